@@ -1,87 +1,567 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context, url_for
+import functools
+import hashlib
+import json
+import math
 import os
+import time
 import traceback
-import uuid
 from werkzeug.utils import secure_filename
-from granite_client import GraniteClient
-from spec_parser import SpecParser
+from artifact_store import ArtifactStore, spec_hash
+from async_granite_client import AsyncGraniteClient
+from batch import (BatchError, BatchScheduler, build_archive, elapsed_ms, expand_archive, interleave,
+                   parse_spec_document, unique_filename)
+from generation_cache import GenerationCache
+from granite_client import GENERATION_PARAMETERS, GraniteClient
+from incremental import FingerprintStore, IncrementalGenerator
+from jobs import JobManager, QueueFullError
+from prompt_builder import PROMPT_TEMPLATE_VERSION, build_prompt_within_budget
+from readiness import ReadinessProbe
+from sharding import ShardedGenerator, merge_test_classes, to_identifier
+from spec_upload import SpecUpload
+
+from testgen_common import tracing
+from testgen_common.llm_scheduler import (DEFAULT_TENANT, Caller, LANES, LLMScheduler, bind_caller, current_caller,
+                                          enter_caller, exit_caller, parse_weights)
+from testgen_common.metrics import CONTENT_TYPE, REGISTRY, SIZE_BUCKETS, TOKEN_BUCKETS
+from testgen_common.resilience import GraniteError
+from testgen_common.shared_state import RedisCacheStore, create_record_store, redis_client
+from testgen_common.token_budget import TokenCounter, default_budget
+from testgen_common.tracing import span
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['GENERATED_TESTS_FOLDER'] = 'generated_tests'
+app.config['UPLOAD_SPOOL_THRESHOLD'] = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))
+app.config['GENERATED_TESTS_FOLDER'] = os.getenv('GENERATED_TESTS_FOLDER', 'generated_tests')
+app.config['ARTIFACTS_MAX_BYTES'] = int(os.getenv('ARTIFACTS_MAX_BYTES', 512 * 1024 * 1024))
+app.config['ARTIFACTS_MAX_AGE'] = int(os.getenv('ARTIFACTS_MAX_AGE', 7 * 24 * 3600))
+app.config['ARTIFACTS_COMPRESS'] = os.getenv('ARTIFACTS_COMPRESS', 'false').lower() == 'true'
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+app.config['JOB_QUEUE_LIMIT'] = int(os.getenv('JOB_QUEUE_LIMIT', 200))
+app.config['JOB_RESULT_TTL'] = int(os.getenv('JOB_RESULT_TTL', 3600))
+app.config['SHARD_CONCURRENCY'] = int(os.getenv('SHARD_CONCURRENCY', 4))
+app.config['SHARD_MAX_ENDPOINTS'] = int(os.getenv('SHARD_MAX_ENDPOINTS', 10))
+# Specs at least this large are parsed one path item at a time when they
+# are sharded (shard_by, batch); endpoints keep only what prompts use
+app.config['SPEC_COMPACT_MIN_BYTES'] = int(os.getenv('SPEC_COMPACT_MIN_BYTES', 8 * 1024 * 1024))
+app.config['GENERATION_CACHE_ENABLED'] = os.getenv('GENERATION_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['GENERATION_CACHE_MAX_ENTRIES'] = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', 256))
+app.config['GENERATION_CACHE_FOLDER'] = os.getenv('GENERATION_CACHE_FOLDER', 'generation_cache')
+app.config['GENERATION_CACHE_MAX_BYTES'] = int(os.getenv('GENERATION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+app.config['GENERATION_CACHE_TTL'] = int(os.getenv('GENERATION_CACHE_TTL', 7 * 24 * 3600))
+# 'file' or 'redis' shares the IAM token, job records (and, with redis, the
+# generation cache) between worker processes; gunicorn.conf.py turns on 'file'
+app.config['SHARED_STATE_BACKEND'] = os.getenv('SHARED_STATE_BACKEND', 'none').lower()
+app.config['SHARED_STATE_DIR'] = os.getenv('SHARED_STATE_DIR', 'shared_state')
+app.config['SHARED_STATE_REDIS_URL'] = os.getenv('SHARED_STATE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['FINGERPRINTS_FOLDER'] = os.getenv('FINGERPRINTS_FOLDER', 'spec_fingerprints')
+app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 50))
+app.config['BATCH_MAX_EXPANDED_BYTES'] = int(os.getenv('BATCH_MAX_EXPANDED_BYTES', 64 * 1024 * 1024))
+app.config['BATCH_GENERATION_WORKERS'] = int(os.getenv('BATCH_GENERATION_WORKERS', 8))
+app.config['BATCH_CONCURRENCY_PER_REQUEST'] = int(os.getenv('BATCH_CONCURRENCY_PER_REQUEST', 4))
+app.config['BATCH_PARSE_WORKERS'] = int(os.getenv('BATCH_PARSE_WORKERS', 2))
+app.config['GRANITE_CONTEXT_WINDOW'] = int(os.getenv('GRANITE_CONTEXT_WINDOW', 8192))
+app.config['PROMPT_TOKEN_BUDGET'] = int(os.getenv('PROMPT_TOKEN_BUDGET') or default_budget(
+    app.config['GRANITE_CONTEXT_WINDOW'], GENERATION_PARAMETERS['max_new_tokens']))
+# Count prompt tokens with the watsonx tokenizer instead of the local estimate
+app.config['PROMPT_TOKENIZE_REMOTE'] = os.getenv('PROMPT_TOKENIZE_REMOTE', 'false').lower() == 'true'
+app.config['READINESS_INTERVAL'] = float(os.getenv('READINESS_INTERVAL', 30))
+app.config['READINESS_TIMEOUT'] = float(os.getenv('READINESS_TIMEOUT', 5))
+# Lets callers add ?debug=timing or ?debug=profile to get a per-request
+# breakdown in the response; keep it off in production.
+app.config['TRACING_DEBUG'] = os.getenv('TRACING_DEBUG', 'false').lower() == 'true'
+app.config['TRACING_OTEL'] = os.getenv('TRACING_OTEL', 'false').lower() == 'true'
+# Directory where worker processes pool their metrics so /metrics reports all
+# of them; gunicorn.conf.py sets it
+app.config['METRICS_MULTIPROC_DIR'] = os.getenv('METRICS_MULTIPROC_DIR', '')
+# watsonx plan limits (0 = unlimited). Each of LLM_SCHEDULER_WORKERS processes
+# schedules an equal share; gunicorn.conf.py sets it to the worker count.
+app.config['LLM_RPM_LIMIT'] = int(os.getenv('LLM_RPM_LIMIT', 0))
+app.config['LLM_TPM_LIMIT'] = int(os.getenv('LLM_TPM_LIMIT', 0))
+app.config['LLM_SCHEDULER_WORKERS'] = max(1, int(os.getenv('LLM_SCHEDULER_WORKERS', 1)))
+# 'team-a=3,team-b=1'; unlisted tenants weigh 1
+app.config['LLM_TENANT_WEIGHTS'] = parse_weights(os.getenv('LLM_TENANT_WEIGHTS', ''))
+app.config['LLM_TENANT_HEADER'] = os.getenv('LLM_TENANT_HEADER', 'X-Tenant')
+app.config['LLM_MAX_QUEUE_WAIT'] = float(os.getenv('LLM_MAX_QUEUE_WAIT', 120))
+
+if app.config['TRACING_OTEL']:
+    tracing.configure_opentelemetry(os.getenv('OTEL_SERVICE_NAME', 'ai-test-generator'))
+
+# Shared by both clients so their calls count against the same limits
+llm_scheduler = LLMScheduler(
+    requests_per_minute=app.config['LLM_RPM_LIMIT'] / app.config['LLM_SCHEDULER_WORKERS'],
+    tokens_per_minute=app.config['LLM_TPM_LIMIT'] / app.config['LLM_SCHEDULER_WORKERS'],
+    weights=app.config['LLM_TENANT_WEIGHTS'],
+    max_wait=app.config['LLM_MAX_QUEUE_WAIT']
+)
+granite_client = GraniteClient(llm_scheduler)
+async_granite_client = AsyncGraniteClient(llm_scheduler)
+if os.getenv('GRANITE_TOKEN_RENEWER', 'false').lower() == 'true':
+    granite_client.start_token_renewer()
+
+job_manager = JobManager(
+    max_workers=app.config['JOB_WORKERS'],
+    max_queue=app.config['JOB_QUEUE_LIMIT'],
+    result_ttl=app.config['JOB_RESULT_TTL'],
+    # Status and result requests may reach any worker, not just the one running the job
+    store=create_record_store(
+        app.config['SHARED_STATE_BACKEND'], 'jobs', app.config['JOB_RESULT_TTL'],
+        directory=app.config['SHARED_STATE_DIR'],
+        redis_url=app.config['SHARED_STATE_REDIS_URL']
+    )
+)
+
+generation_cache = None
+if app.config['GENERATION_CACHE_ENABLED']:
+    shared_cache = None
+    if app.config['SHARED_STATE_BACKEND'] == 'redis':
+        client = redis_client(app.config['SHARED_STATE_REDIS_URL'])
+        if client is not None:
+            shared_cache = RedisCacheStore(client, 'testgen:generation:', app.config['GENERATION_CACHE_TTL'])
+    generation_cache = GenerationCache(
+        max_entries=app.config['GENERATION_CACHE_MAX_ENTRIES'],
+        directory=app.config['GENERATION_CACHE_FOLDER'] or None,
+        max_disk_bytes=app.config['GENERATION_CACHE_MAX_BYTES'],
+        ttl=app.config['GENERATION_CACHE_TTL'],
+        shared=shared_cache
+    )
+
+artifact_store = ArtifactStore(
+    app.config['GENERATED_TESTS_FOLDER'],
+    max_bytes=app.config['ARTIFACTS_MAX_BYTES'],
+    max_age=app.config['ARTIFACTS_MAX_AGE'],
+    compress=app.config['ARTIFACTS_COMPRESS']
+)
+
+prompt_token_counter = TokenCounter(granite_client.count_tokens if app.config['PROMPT_TOKENIZE_REMOTE'] else None)
+
+PROMPT_TOKENS = REGISTRY.histogram('prompt_tokens', 'Prompt tokens sent after compaction', buckets=TOKEN_BUCKETS)
+PROMPT_TRIMMED_TOKENS = REGISTRY.counter('prompt_trimmed_tokens_total', 'Prompt tokens removed by compaction')
+
+def generation_inputs():
+    """Settings besides the spec that shape generated tests; part of cache keys and fingerprints."""
+    return {
+        'model_id': granite_client.model_id,
+        'parameters': granite_client.generation_parameters,
+        'template_version': PROMPT_TEMPLATE_VERSION,
+        'prompt_token_budget': app.config['PROMPT_TOKEN_BUDGET']
+    }
+
+def generation_cache_key(api_info, class_name=None):
+    inputs = generation_inputs()
+    return GenerationCache.make_key(
+        api_info,
+        inputs['model_id'],
+        inputs['parameters'],
+        inputs['template_version'],
+        class_name=class_name,
+        prompt_token_budget=inputs['prompt_token_budget']
+    )
+
+def build_prompt(api_info, class_name=None):
+    """Prompt for api_info compacted to PROMPT_TOKEN_BUDGET; returns (prompt, report)."""
+    with span('prompt.build') as prompt_span:
+        prompt, report = build_prompt_within_budget(api_info, app.config['PROMPT_TOKEN_BUDGET'],
+                                                    prompt_token_counter, class_name)
+        prompt_span.set('tokens', report['tokens'])
+        prompt_span.set('trimmed_tokens', report['trimmed_tokens'])
+    
+    PROMPT_TOKENS.observe(report['tokens'])
+    if report['trimmed_tokens'] > 0:
+        PROMPT_TRIMMED_TOKENS.inc(report['trimmed_tokens'])
+    if not report['within_budget']:
+        app.logger.warning("Prompt for '%s' is %d tokens after compaction; budget is %d",
+                           api_info['title'], report['tokens'], report['budget'])
+    return prompt, report
+
+def generate_for_spec(api_info, class_name=None, prompt_reports=None):
+    """Generate tests for api_info, serving repeated specs from the cache.
+    
+    When prompt_reports is a list, the compaction report of a freshly built
+    prompt is appended to it.
+    """
+    def generate():
+        prompt, report = build_prompt(api_info, class_name)
+        if prompt_reports is not None:
+            prompt_reports.append(report)
+        with span('generation'):
+            return granite_client.generate_test_cases(prompt)
+    
+    if generation_cache is None:
+        return generate()
+    with span('cache.get_or_generate'):
+        return generation_cache.get_or_generate(generation_cache_key(api_info, class_name), generate)
+
+sharded_generator = ShardedGenerator(
+    generate_for_spec,
+    max_concurrency=app.config['SHARD_CONCURRENCY'],
+    max_endpoints=app.config['SHARD_MAX_ENDPOINTS']
+)
+
+incremental_generator = IncrementalGenerator(
+    sharded_generator,
+    FingerprintStore(app.config['FINGERPRINTS_FOLDER']),
+    generation_inputs
+)
+
+batch_scheduler = BatchScheduler(
+    max_workers=app.config['BATCH_GENERATION_WORKERS'],
+    per_batch_limit=app.config['BATCH_CONCURRENCY_PER_REQUEST'],
+    parse_workers=app.config['BATCH_PARSE_WORKERS']
+)
+
+# /ready serves the result of this background check; probes never wait on watsonx
+readiness_probe = ReadinessProbe(
+    lambda: granite_client.check_upstream(app.config['READINESS_TIMEOUT']),
+    interval=app.config['READINESS_INTERVAL']
+)
+
+def after_fork():
+    """Per-worker setup when gunicorn forks a preloaded app (see gunicorn.conf.py)."""
+    if app.config['METRICS_MULTIPROC_DIR']:
+        REGISTRY.enable_multiprocess(app.config['METRICS_MULTIPROC_DIR'])
+    granite_client.after_fork()
+    async_granite_client.after_fork()
+    readiness_probe.after_fork()
+    batch_scheduler.after_fork()
+
+REQUEST_SECONDS = REGISTRY.histogram('http_request_seconds', 'Time spent handling HTTP requests',
+                                     ('endpoint', 'method', 'status'))
+UPLOAD_SIZE_BYTES = REGISTRY.histogram('upload_size_bytes', 'Size of spec upload request bodies',
+                                       ('endpoint',), buckets=SIZE_BUCKETS)
+REQUEST_ERRORS = REGISTRY.counter('request_errors_total', 'Failed generations by endpoint and error class',
+                                  ('endpoint', 'error'))
+REGISTRY.gauge('job_queue_depth', 'Generation jobs by state', ('state',),
+               function=lambda: {(state,): job_manager.stats()[state] for state in ('queued', 'running')})
+REGISTRY.gauge('batch_active', 'Batch requests currently generating',
+               function=lambda: batch_scheduler.stats()['active_batches'])
+REGISTRY.gauge('async_client_in_flight', 'Generations in flight on the async client',
+               function=lambda: async_granite_client.stats()['in_flight'])
+REGISTRY.gauge('llm_queue_depth', 'watsonx calls waiting for the scheduler by lane', ('lane',),
+               function=lambda: {(lane,): llm_scheduler.stats()['queued'][lane] for lane in LANES})
+REGISTRY.gauge('artifact_store_bytes', 'Bytes of generated test artifacts kept on disk',
+               function=lambda: artifact_store.stats()['stored_bytes'])
+REGISTRY.callback_counter('artifact_evictions_total', 'Artifacts removed for age or size',
+                          lambda: artifact_store.stats()['evictions'])
+REGISTRY.gauge('circuit_breaker_open', '1 while the watsonx circuit breaker is open or half-open',
+               function=lambda: int(granite_client.circuit_breaker.stats()['state'] != 'closed'))
+REGISTRY.callback_counter('watsonx_coalesced_total', 'Generations that shared an identical in-flight watsonx call',
+                          lambda: {('sync',): granite_client.coalescer.stats()['coalesced'],
+                                   ('async',): async_granite_client.coalescer.stats()['coalesced']},
+                          ('client',))
+if generation_cache is not None:
+    REGISTRY.callback_counter('generation_cache_lookups_total', 'Generation cache lookups by result',
+                              lambda: {(result,): generation_cache.stats()[result]
+                                       for result in ('memory_hits', 'disk_hits', 'misses')},
+                              ('result',))
+
+DEBUG_MODES = {'timing', 'profile'}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.llm_caller_token = enter_caller(Caller(request_tenant(), request_lane()))
+    if app.config['TRACING_DEBUG']:
+        mode = request.args.get('debug') or request.headers.get('X-Debug')
+        if mode in DEBUG_MODES:
+            g.trace = tracing.begin(profile=mode == 'profile')
+
+@app.teardown_request
+def release_llm_caller(exc):
+    token = g.pop('llm_caller_token', None)
+    if token is not None:
+        exit_caller(token)
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'metrics':
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    
+    caller = current_caller()
+    if caller is not None and caller.calls:
+        response.headers['X-Queue-Wait-Ms'] = str(caller.queue_wait_ms)
+    
+    trace_handle = g.pop('trace', None)
+    if trace_handle:
+        attach_debug_trace(response, tracing.end(trace_handle))
+    return response
 
-granite_client = GraniteClient()
+def request_tenant():
+    """Whose share of the watsonx quota a request uses: its API key, LLM_TENANT_HEADER or address"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        return 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+    tenant = request.headers.get(app.config['LLM_TENANT_HEADER'], '').strip()[:128]
+    return tenant or request.remote_addr or DEFAULT_TENANT
+
+def request_lane():
+    """'interactive' for the web UI's own requests, 'batch' for batch uploads and API clients"""
+    if request.path.startswith('/batch/'):
+        return 'batch'
+    # Browsers set Sec-Fetch-Site themselves; scripts cannot forge it from a page
+    return 'interactive' if request.headers.get('Sec-Fetch-Site') == 'same-origin' else 'batch'
+
+def attach_debug_trace(response, trace):
+    """Add the trace as Server-Timing and, for JSON bodies, as a 'debug' field"""
+    response.headers['Server-Timing'] = trace.server_timing()
+    if response.is_json and not response.is_streamed:
+        data = response.get_json()
+        if isinstance(data, dict):
+            data['debug'] = trace.summary()
+            response.set_data(json.dumps(data))
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['GENERATED_TESTS_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'json', 'yaml', 'yml'}
 
+class UploadError(ValueError):
+    pass
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_test_generation_prompt(api_info):
-    endpoints_summary = ""
-    for endpoint in api_info['endpoints']:
-        params = ", ".join([p.get('name', '') for p in endpoint.get('parameters', [])])
-        responses = ", ".join(endpoint.get('responses', {}).keys())
-        
-        endpoints_summary += f"""
-- {endpoint['method']} {endpoint['path']}
-  Summary: {endpoint.get('summary', 'N/A')}
-  Parameters: {params if params else 'None'}
-  Responses: {responses if responses else 'N/A'}"""
+def read_uploaded_spec():
+    """Validate the uploaded spec file and wrap its request stream."""
+    if 'file' not in request.files:
+        raise UploadError('No file uploaded')
     
-    schemas_summary = ""
-    for name, schema in api_info.get('schemas', {}).items():
-        properties = schema.get('properties', {})
-        prop_list = ", ".join([f"{k}: {v.get('type', 'unknown')}" for k, v in properties.items()])
-        schemas_summary += f"- {name}: {prop_list}\n"
+    file = request.files['file']
+    if file.filename == '':
+        raise UploadError('No file selected')
     
-    prompt = f"""You are an expert QA engineer specializing in API testing. Generate comprehensive JUnit 5 test cases for this REST API.
+    if not allowed_file(file.filename):
+        raise UploadError('Invalid file type. Please upload JSON, YAML, or YML files.')
+    
+    UPLOAD_SIZE_BYTES.observe(request.content_length or 0, endpoint=request.endpoint)
+    return SpecUpload(file.stream, secure_filename(file.filename))
 
-API Information:
-- Title: {api_info['title']}
-- Version: {api_info['version']}
-- Description: {api_info['description']}
-- Base URL: {api_info['base_url']}
+def read_batch_uploads():
+    """Collect (name, bytes) for every spec in a multi-file or zip upload."""
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        raise UploadError('No files uploaded')
+    
+    max_items = app.config['BATCH_MAX_ITEMS']
+    items = []
+    for file in files:
+        filename = secure_filename(file.filename or '')
+        if filename.lower().endswith('.zip'):
+            items.extend(expand_archive(filename, file.read(), max_items, app.config['BATCH_MAX_EXPANDED_BYTES']))
+        elif allowed_file(filename):
+            items.append((filename, file.read()))
+        else:
+            raise UploadError(f"Invalid file type for '{file.filename}'. Please upload JSON, YAML, YML or ZIP files.")
+    
+    UPLOAD_SIZE_BYTES.observe(request.content_length or 0, endpoint=request.endpoint)
+    if not items:
+        raise UploadError('No JSON or YAML specs found in the upload')
+    if len(items) > max_items:
+        raise UploadError(f"Batch contains {len(items)} specs; the limit is {max_items}")
+    return items
 
-Endpoints:{endpoints_summary}
+SHARD_MODES = {'tag', 'prefix'}
+OUTPUT_MODES = {'single', 'per_tag'}
 
-Data Models:
-{schemas_summary if schemas_summary else 'No schemas defined'}
+def generation_options():
+    """Read the optional sharding settings from the query string or form."""
+    shard_by = request.values.get('shard_by', '').lower() or None
+    output = request.values.get('output', 'single').lower()
+    
+    if shard_by and shard_by not in SHARD_MODES:
+        raise UploadError(f"Invalid shard_by '{shard_by}'. Use one of: {', '.join(sorted(SHARD_MODES))}")
+    if output not in OUTPUT_MODES:
+        raise UploadError(f"Invalid output '{output}'. Use one of: {', '.join(sorted(OUTPUT_MODES))}")
+    if output == 'per_tag' and not shard_by:
+        shard_by = 'tag'
+    
+    incremental = request.values.get('incremental', 'false').lower() == 'true'
+    spec_id = secure_filename(request.values.get('spec_id', ''))
+    if incremental and (shard_by or output != 'single'):
+        raise UploadError('incremental cannot be combined with shard_by or output')
+    
+    return {'shard_by': shard_by, 'output': output, 'incremental': incremental, 'spec_id': spec_id or None}
 
-Requirements:
-1. Generate complete JUnit 5 test classes with proper annotations
-2. Include positive test cases for valid inputs
-3. Include negative test cases for invalid data and error conditions
-4. Add boundary value testing for numeric fields
-5. Test edge cases (empty strings, null values, special characters)
-6. Generate realistic test data matching API schemas
-7. Use proper assertions for status codes, headers, and response body
-8. Use RestTemplate or TestRestTemplate for API calls
-9. Include setup and teardown methods
-10. Follow Spring Boot testing best practices
+def request_user():
+    """Caller identity used to index artifacts, from the X-User header"""
+    return request.headers.get('X-User', '').strip()[:128] or None
+
+def write_generated_tests(api_info, generated_tests, test_filename=None, user=None):
+    """Store generated tests as a new artifact and return it."""
+    if test_filename is None:
+        test_filename = f"{api_info['title'].replace(' ', '_')}_Tests.java"
+    
+    with span('file.write', filename=test_filename):
+        return artifact_store.put(generated_tests, test_filename, spec_hash=spec_hash(api_info), user=user)
 
-Generate complete, runnable Java test classes:
+def artifact_fields(artifact):
+    return {'filename': artifact.filename, 'artifact_id': artifact.id, 'download_url': artifact.download_url}
 
-package com.example.api.test;
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-import org.junit.jupiter.api.Test;
-import org.junit.jupiter.api.BeforeEach;
-import org.springframework.boot.test.context.SpringBootTest;
-import org.springframework.test.web.reactive.server.WebTestClient;
-import static org.junit.jupiter.api.Assertions.*;
+def run_sharded_generation(api_info, shard_by, output, report, user=None):
+    """Generate endpoint groups concurrently and write the merged result."""
+    report('generating', 0.3)
+    if output == 'per_tag':
+        classes = sharded_generator.generate_per_group(api_info, shard_by)
+    else:
+        classes = [(None, sharded_generator.generate_merged(api_info, shard_by))]
+    
+    report('writing', 0.9)
+    artifacts = []
+    for class_name, source in classes:
+        test_filename = f"{class_name}.java" if class_name else None
+        artifacts.append(write_generated_tests(api_info, source, test_filename, user))
+    
+    return {
+        'success': True,
+        'test_cases': '\n\n'.join(source for _, source in classes),
+        **artifact_fields(artifacts[0]),
+        'files': [artifact.filename for artifact in artifacts],
+        'artifacts': [artifact_fields(artifact) for artifact in artifacts],
+        'api_title': api_info['title'],
+        'endpoints_count': len(api_info['endpoints'])
+    }
 
-@SpringBootTest(webEnvironment = SpringBootTest.WebEnvironment.RANDOM_PORT)
-public class {api_info['title'].replace(' ', '')}ApiTest {{
+def run_incremental_generation(api_info, spec_id, report, user=None):
+    """Regenerate only changed endpoints and splice in the stored rest."""
+    report('generating', 0.3)
+    generated_tests, summary = incremental_generator.generate(
+        api_info, spec_id or to_identifier(api_info['title'])
+    )
+    
+    report('writing', 0.9)
+    artifact = write_generated_tests(api_info, generated_tests, user=user)
+    
+    return {
+        'success': True,
+        'test_cases': generated_tests,
+        **artifact_fields(artifact),
+        'api_title': api_info['title'],
+        'endpoints_count': len(api_info['endpoints']),
+        'incremental': summary
+    }
 
-text
+def run_generation_pipeline(upload, job=None, shard_by=None, output='single',
+                            incremental=False, spec_id=None, user=None):
+    """Parse a spec, generate tests for it and write the Java file."""
+    def report(stage, progress):
+        if job:
+            job.update(stage, progress)
+    
+    report('parsing', 0.1)
+    with span('spec.parse'):
+        size = upload.size
+        if shard_by and not incremental and size is not None and size >= app.config['SPEC_COMPACT_MIN_BYTES']:
+            api_info = upload.parse_compact()
+        else:
+            api_info = upload.parse()
+    
+    if incremental and api_info['endpoints']:
+        return run_incremental_generation(api_info, spec_id, report, user)
+    
+    if shard_by and api_info['endpoints']:
+        return run_sharded_generation(api_info, shard_by, output, report, user)
+    
+    report('generating', 0.3)
+    prompt_reports = []
+    generated_tests = generate_for_spec(api_info, prompt_reports=prompt_reports)
+    
+    report('writing', 0.9)
+    artifact = write_generated_tests(api_info, generated_tests, user=user)
+    
+    result = {
+        'success': True,
+        'test_cases': generated_tests,
+        **artifact_fields(artifact),
+        'api_title': api_info['title'],
+        'endpoints_count': len(api_info['endpoints'])
+    }
+    if prompt_reports:
+        result['prompt'] = prompt_reports[0]
+    return result
 
-Generate the complete test implementation now:"""
+def run_batch_generation(items, job=None):
+    """Generate tests for every (name, bytes) spec; returns (zip buffer, manifest).
+    
+    Specs are parsed in the batch process pool. Large specs are split into
+    shards, and shards of all specs are queued round-robin so a big service
+    does not delay the first results of the small ones.
+    """
+    started = time.perf_counter()
+    
+    def report(stage, progress):
+        if job:
+            job.update(stage, progress)
+    
+    report('parsing', 0.1)
+    with span('batch.parse', specs=len(items)):
+        parsed = batch_scheduler.parse_all(
+            functools.partial(parse_spec_document, compact_min_bytes=app.config['SPEC_COMPACT_MIN_BYTES']), items)
     
-    return prompt
+    entries = []
+    shard_groups = []
+    for index, ((name, _), (api_info, error)) in enumerate(zip(items, parsed)):
+        entry = {'source': name, 'status': 'failed' if error else 'succeeded'}
+        entries.append(entry)
+        if error:
+            entry['error'] = str(error)
+            continue
+        
+        entry['api_title'] = api_info['title']
+        entry['endpoints_count'] = len(api_info['endpoints'])
+        if len(api_info['endpoints']) > app.config['SHARD_MAX_ENDPOINTS']:
+            shards = sharded_generator.build_shards(api_info, 'tag')
+        else:
+            shards = [(None, None, None, api_info)]
+        shard_groups.append([(index, shard) for shard in shards])
+    
+    report('generating', 0.3)
+    queued = interleave(shard_groups)
+    with span('batch.generate', shards=len(queued)):
+        results = batch_scheduler.run([
+            bind_caller(tracing.bind(lambda shard=shard: generate_for_spec(shard[3], shard[2])))
+            for _, shard in queued
+        ])
+    
+    sources = {}
+    for (index, shard), (source, error) in zip(queued, results):
+        if error:
+            entries[index]['status'] = 'failed'
+            entries[index].setdefault('error', str(error))
+        sources.setdefault(index, []).append((shard[1], source))
+    
+    report('writing', 0.9)
+    files = []
+    used_names = set()
+    for index, entry in enumerate(entries):
+        if entry['status'] != 'succeeded':
+            continue
+        title_id = to_identifier(entry['api_title'])
+        shard_sources = sources[index]
+        if len(shard_sources) == 1:
+            generated_tests = shard_sources[0][1]
+        else:
+            generated_tests = merge_test_classes(f"{title_id}ApiTest", shard_sources)
+        
+        test_filename = secure_filename(f"{entry['api_title'].replace(' ', '_')}_Tests.java") or f"{title_id}_Tests.java"
+        entry['filename'] = unique_filename(test_filename, used_names)
+        files.append((entry['filename'], generated_tests))
+    
+    manifest = {
+        'items': entries,
+        'total': len(entries),
+        'succeeded': sum(1 for entry in entries if entry['status'] == 'succeeded'),
+        'failed': sum(1 for entry in entries if entry['status'] == 'failed'),
+        'duration_ms': elapsed_ms(started)
+    }
+    return build_archive(files, manifest), manifest
+
+def wants_async():
+    return request.args.get('mode') == 'async' or request.form.get('mode') == 'async'
 
 @app.route('/')
 def index():
@@ -90,77 +570,319 @@ def index():
 @app.route('/generate', methods=['POST'])
 def generate_tests():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
+        try:
+            with span('upload.read'):
+                upload = read_uploaded_spec()
+            options = generation_options()
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        if wants_async():
+            # The request stream is gone once we return, so the job gets its
+            # own copy, spooled to disk only for large uploads.
+            with span('upload.spool'):
+                job_upload = upload.spool(app.config['UPLOAD_SPOOL_THRESHOLD'], app.config['UPLOAD_FOLDER'])
+            
+            user = request_user()
+            
+            def run_job(job):
+                with job_upload:
+                    return run_generation_pipeline(job_upload, job=job, user=user, **options)
+            
+            return queue_job(run_job, on_rejected=job_upload.close)
         
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type. Please upload JSON, YAML, or YML files.'}), 400
-        
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
+        return jsonify(run_generation_pipeline(upload, user=request_user(), **options))
+    
+    except GraniteError as e:
+        return granite_error_response(e)
+    except Exception as e:
+        return error_response(e)
+
+def record_error(e):
+    REQUEST_ERRORS.inc(endpoint=request.endpoint or 'unknown', error=type(e).__name__)
+
+def error_response(e):
+    """500 response for an unexpected failure; call from an except block."""
+    record_error(e)
+    return jsonify({
+        'error': f'Failed to generate tests: {str(e)}',
+        'details': traceback.format_exc()
+    }), 500
+
+def granite_error_response(e):
+    """Report a watsonx/IAM failure with the status its type maps to."""
+    record_error(e)
+    response = jsonify({
+        'error': f'Failed to generate tests: {str(e)}',
+        'details': traceback.format_exc()
+    })
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, e.http_status
+
+def queue_job(run_job, on_rejected=None):
+    """Submit run_job to the job manager and build the 202 or 429 response."""
+    # Jobs run in the batch lane whoever submits them
+    caller = Caller(request_tenant(), 'batch')
+    scheduled_job = bind_caller(run_job, caller)
+    
+    def counted_job(job):
+        try:
+            result = scheduled_job(job)
+        except Exception as e:
+            REQUEST_ERRORS.inc(endpoint='job', error=type(e).__name__)
+            raise
+        if isinstance(result, dict):
+            result['queue_wait_ms'] = caller.queue_wait_ms
+        return result
+    
+    try:
+        job = job_manager.submit(counted_job)
+    except QueueFullError as e:
+        if on_rejected:
+            on_rejected()
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    response = jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id)
+    })
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response, 202
+
+@app.route('/batch/generate', methods=['POST'])
+def batch_generate():
+    """Generate tests for many specs at once and return them as a zip."""
+    try:
+        try:
+            with span('upload.read'):
+                items = read_batch_uploads()
+        except (UploadError, BatchError) as e:
+            return jsonify({'error': str(e)}), 400
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            file_content = f.read()
+        if wants_async():
+            user = request_user()
+            
+            def run_job(job):
+                archive, manifest = run_batch_generation(items, job=job)
+                # Zip entries are already deflated, so never gzip the archive
+                artifact = artifact_store.put(archive.getbuffer(), f"batch_{job.id}.zip", user=user, compress=False)
+                manifest.update(artifact_fields(artifact))
+                return manifest
+            
+            return queue_job(run_job)
         
-        file_extension = filename.rsplit('.', 1)[1].lower()
-        api_info = SpecParser.parse_openapi_spec(file_content, file_extension)
+        archive, manifest = run_batch_generation(items)
+        response = send_file(archive, mimetype='application/zip', as_attachment=True,
+                             download_name='generated_tests.zip')
+        response.headers['X-Batch-Succeeded'] = str(manifest['succeeded'])
+        response.headers['X-Batch-Failed'] = str(manifest['failed'])
+        return response
+    
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_tests_stream():
+    """Like /generate, but forwards generated text as Server-Sent Events."""
+    try:
+        try:
+            upload = read_uploaded_spec()
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
         
-        prompt = create_test_generation_prompt(api_info)
-        generated_tests = granite_client.generate_test_cases(prompt)
+        with span('spec.parse'):
+            api_info = upload.parse()
+        prompt, prompt_report = build_prompt(api_info)
+        cache_key = generation_cache_key(api_info)
+        cached_tests = generation_cache.get(cache_key) if generation_cache else None
+        user = request_user()
+        caller = current_caller()
+    except Exception as e:
+        return error_response(e)
+    
+    def events():
+        yield sse_event('meta', {
+            'api_title': api_info['title'],
+            'endpoints_count': len(api_info['endpoints']),
+            'prompt': prompt_report
+        })
         
-        test_filename = f"{api_info['title'].replace(' ', '_')}_Tests.java"
-        test_filepath = os.path.join(app.config['GENERATED_TESTS_FOLDER'], test_filename)
+        chunks = []
+        try:
+            if cached_tests is not None:
+                chunks.append(cached_tests)
+                yield sse_event('chunk', {'text': cached_tests})
+            else:
+                for chunk in granite_client.generate_test_cases_stream(prompt):
+                    chunks.append(chunk)
+                    yield sse_event('chunk', {'text': chunk})
+                if generation_cache:
+                    generation_cache.set(cache_key, ''.join(chunks))
+            
+            artifact = write_generated_tests(api_info, ''.join(chunks), user=user)
+            yield sse_event('done', {
+                'success': True,
+                **artifact_fields(artifact),
+                'api_title': api_info['title'],
+                'endpoints_count': len(api_info['endpoints']),
+                'queue_wait_ms': caller.queue_wait_ms
+            })
+        except Exception as e:
+            REQUEST_ERRORS.inc(endpoint='generate_tests_stream', error=type(e).__name__)
+            yield sse_event('error', {'error': f'Failed to generate tests: {str(e)}'})
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/async/generate', methods=['POST'])
+async def generate_tests_async():
+    """/generate as an async view; the Granite call runs on AsyncGraniteClient."""
+    try:
+        try:
+            upload = read_uploaded_spec()
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
         
-        with open(test_filepath, 'w', encoding='utf-8') as f:
-            f.write(generated_tests)
+        with span('spec.parse'):
+            api_info = upload.parse()
+        cache_key = generation_cache_key(api_info)
+        generated_tests = generation_cache.get(cache_key) if generation_cache else None
+        if generated_tests is None:
+            prompt, _ = build_prompt(api_info)
+            with span('generation'):
+                generated_tests = await async_granite_client.generate_test_cases(prompt)
+            if generation_cache:
+                generation_cache.set(cache_key, generated_tests)
         
-        os.remove(filepath)
+        artifact = write_generated_tests(api_info, generated_tests, user=request_user())
         
         return jsonify({
             'success': True,
             'test_cases': generated_tests,
-            'filename': test_filename,
+            **artifact_fields(artifact),
             'api_title': api_info['title'],
             'endpoints_count': len(api_info['endpoints'])
         })
     
+    except GraniteError as e:
+        return granite_error_response(e)
     except Exception as e:
+        return error_response(e)
+
+@app.route('/cache/stats')
+def cache_stats():
+    if generation_cache is None:
+        return jsonify({'enabled': False})
+    stats = generation_cache.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/jobs')
+def job_queue_stats():
+    stats = job_manager.stats()
+    stats['batch'] = batch_scheduler.stats()
+    stats['llm_scheduler'] = llm_scheduler.stats()
+    return jsonify(stats)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status == 'succeeded':
+        return jsonify(job.result)
+    
+    if job.status == 'failed':
         return jsonify({
-            'error': f'Failed to generate tests: {str(e)}',
-            'details': traceback.format_exc()
+            'error': f'Failed to generate tests: {job.error}',
+            'details': job.details
         }), 500
+    
+    return jsonify(job.to_dict()), 202
+
+@app.route('/artifacts')
+def list_artifacts():
+    """Newest stored artifacts, filtered by ?spec_hash= and/or ?user="""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    artifacts = artifact_store.find(request.args.get('spec_hash'), request.args.get('user'), limit)
+    return jsonify({
+        'artifacts': [{**artifact.to_dict(), 'download_url': artifact.download_url} for artifact in artifacts],
+        'store': artifact_store.stats()
+    })
 
-@app.route('/download/<filename>')
-def download_tests(filename):
+@app.route('/download/<artifact_id>')
+def download_tests(artifact_id):
+    """Serve an artifact with ETag, Last-Modified and Range support"""
+    artifact = artifact_store.get(artifact_id)
+    if artifact is None:
+        return jsonify({'error': f'File not found: {artifact_id}'}), 404
+    
     try:
-        filepath = os.path.join(app.config['GENERATED_TESTS_FOLDER'], filename)
-        return send_file(filepath, as_attachment=True)
-    except Exception as e:
+        if artifact.compressed and not request.range and 'gzip' in request.accept_encodings:
+            # Send the stored bytes as-is and let the client inflate them
+            response = send_file(artifact_store.stored_path(artifact), as_attachment=True,
+                                 download_name=artifact.filename, etag=f"{artifact.etag}-gzip",
+                                 last_modified=artifact.created_at)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = send_file(artifact_store.open(artifact), as_attachment=True,
+                                 download_name=artifact.filename, etag=artifact.etag,
+                                 last_modified=artifact.created_at)
+    except OSError as e:
+        # Evicted by another worker after the lookup
         return jsonify({'error': f'File not found: {str(e)}'}), 404
+    
+    if artifact.compressed:
+        response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/health')
 def health_check():
-    try:
-        test_prompt = "Hello, respond with 'OK' if you can process this request."
-        response = granite_client.generate_test_cases(test_prompt)
-        
-        return jsonify({
-            'status': 'healthy',
-            'granite_model': granite_client.model_id,
-            'project_id': granite_client.project_id,
-            'test_response': response.strip()
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 500
+    """Liveness: answers from memory and never calls watsonx"""
+    return jsonify({
+        'status': 'healthy',
+        'granite_model': granite_client.model_id,
+        'project_id': granite_client.project_id,
+        'circuit_breaker': granite_client.circuit_breaker.stats(),
+        'coalescing': granite_client.coalescer.stats()
+    })
+
+@app.route('/ready')
+def readiness_check():
+    """Readiness: the cached result of the background token and upstream check"""
+    status = readiness_probe.status()
+    status['circuit_breaker'] = granite_client.circuit_breaker.stats()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of every worker's metrics (see METRICS_MULTIPROC_DIR)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/async/health')
+async def health_check_async():
+    return jsonify({
+        'status': 'healthy',
+        'granite_model': async_granite_client.model_id,
+        'project_id': async_granite_client.project_id,
+        'async_client': async_granite_client.stats()
+    })
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,304 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from generation_cache import canonical_json
+
+
+def spec_hash(api_info):
+    """SHA-256 of the normalized parsed spec; equal specs share a hash whatever their formatting."""
+    return hashlib.sha256(canonical_json(api_info).encode('utf-8')).hexdigest()
+
+
+class Artifact:
+    __slots__ = ('id', 'filename', 'spec_hash', 'user', 'created_at', 'size', 'stored_size', 'etag',
+                 'compressed')
+
+    def __init__(self, id, filename, spec_hash, user, created_at, size, stored_size, etag, compressed):
+        self.id = id
+        self.filename = filename
+        self.spec_hash = spec_hash
+        self.user = user
+        self.created_at = created_at
+        self.size = size
+        self.stored_size = stored_size
+        self.etag = etag
+        self.compressed = compressed
+
+    @property
+    def download_url(self):
+        return f"/download/{self.id}"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__})
+
+
+class ArtifactStore:
+    """Generated test files on disk, indexed in memory by id, spec hash and user.
+
+    Every artifact gets its own id, so two users generating tests for APIs
+    with the same title never overwrite each other. Content and a small
+    JSON metadata file are written atomically; the index is rebuilt from the
+    metadata files on startup. Artifacts older than max_age seconds are
+    removed and the oldest are evicted once the stored bytes exceed
+    max_bytes. With compress, text is kept gzipped at rest.
+
+    Several worker processes may share the directory. Each re-reads it at
+    most every sync_interval seconds, so max_bytes bounds the directory as
+    a whole, give or take what was written since. Temporary files and
+    content without metadata are only removed once older than
+    orphan_grace seconds, which leaves other workers' writes in flight alone.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600, compress=False,
+                 sync_interval=60, orphan_grace=3600):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.sync_interval = sync_interval
+        self.orphan_grace = orphan_grace
+        self._synced_at = 0.0
+        self._artifacts = OrderedDict()     # id -> Artifact, oldest first
+        self._by_spec = {}                  # spec hash -> {id: None}, newest last
+        self._by_user = {}                  # user -> {id: None}, newest last
+        self._stored_bytes = 0
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def put(self, content, filename, spec_hash=None, user=None, compress=None):
+        """Store content (str or bytes) and return its Artifact."""
+        data = content.encode('utf-8') if isinstance(content, str) else bytes(content)
+        compressed = self.compress if compress is None else compress
+        stored = gzip.compress(data, mtime=0) if compressed else data
+
+        artifact = Artifact(
+            id=uuid.uuid4().hex,
+            filename=filename,
+            spec_hash=spec_hash,
+            user=user,
+            created_at=time.time(),
+            size=len(data),
+            stored_size=len(stored),
+            etag=hashlib.sha256(data).hexdigest()[:32],
+            compressed=compressed
+        )
+        # Content first, then metadata: a crash in between leaves an orphan
+        # that _load_index removes, never an index entry without content
+        self._write_atomic(self._content_path(artifact), stored)
+        self._write_atomic(self._meta_path(artifact.id), json.dumps(artifact.to_dict()).encode('utf-8'))
+
+        with self._lock:
+            self._add(artifact)
+            expired = self._select_evictions(time.time())
+        self._delete_files(expired)
+        self._sync_if_due()
+        return artifact
+
+    def get(self, artifact_id):
+        """The Artifact for artifact_id, or None once it is missing or expired."""
+        with self._lock:
+            artifact = self._artifacts.get(artifact_id)
+        if artifact is None:
+            # Written by another worker process since this one loaded its index
+            artifact = self._read_meta(artifact_id)
+        if artifact is None or time.time() - artifact.created_at >= self.max_age:
+            return None
+        return artifact
+
+    def latest(self, spec_hash=None, user=None):
+        """Newest artifact for a spec hash and/or user, or None."""
+        matches = self.find(spec_hash, user, limit=1)
+        return matches[0] if matches else None
+
+    def find(self, spec_hash=None, user=None, limit=50):
+        """Artifacts matching spec_hash and user, newest first."""
+        now = time.time()
+        with self._lock:
+            if spec_hash is not None:
+                ids = self._by_spec.get(spec_hash, {})
+            elif user is not None:
+                ids = self._by_user.get(user, {})
+            else:
+                ids = self._artifacts
+            matches = []
+            for artifact_id in reversed(ids):
+                artifact = self._artifacts[artifact_id]
+                if user is not None and artifact.user != user:
+                    continue
+                if now - artifact.created_at >= self.max_age:
+                    break
+                matches.append(artifact)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def open(self, artifact):
+        """Decompressed content of artifact as a BytesIO."""
+        with open(self._content_path(artifact), 'rb') as f:
+            data = f.read()
+        return io.BytesIO(gzip.decompress(data) if artifact.compressed else data)
+
+    def stored_path(self, artifact):
+        """Path of the file as stored, gzipped when artifact.compressed."""
+        return self._content_path(artifact)
+
+    def evict_expired(self):
+        with self._lock:
+            expired = self._select_evictions(time.time())
+        self._delete_files(expired)
+        return len(expired) + self._sync_if_due()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'artifacts': len(self._artifacts),
+                'stored_bytes': self._stored_bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'compress': self.compress,
+                'evictions': self._evictions
+            }
+
+    def _add(self, artifact):
+        self._artifacts[artifact.id] = artifact
+        self._stored_bytes += artifact.stored_size
+        if artifact.spec_hash:
+            self._by_spec.setdefault(artifact.spec_hash, {})[artifact.id] = None
+        if artifact.user:
+            self._by_user.setdefault(artifact.user, {})[artifact.id] = None
+
+    def _discard(self, artifact):
+        del self._artifacts[artifact.id]
+        self._stored_bytes -= artifact.stored_size
+        for index, key in ((self._by_spec, artifact.spec_hash), (self._by_user, artifact.user)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(artifact.id, None)
+                if not ids:
+                    del index[key]
+
+    def _select_evictions(self, now):
+        """Unindex expired and over-budget artifacts, oldest first. Callers hold self._lock."""
+        evicted = []
+        while self._artifacts:
+            oldest = next(iter(self._artifacts.values()))
+            if now - oldest.created_at < self.max_age and self._stored_bytes <= self.max_bytes:
+                break
+            self._discard(oldest)
+            evicted.append(oldest)
+        self._evictions += len(evicted)
+        return evicted
+
+    def _delete_files(self, artifacts):
+        for artifact in artifacts:
+            self._remove(self._meta_path(artifact.id))
+            self._remove(self._content_path(artifact))
+
+    def _content_path(self, artifact):
+        suffix = '.gz' if artifact.compressed else ''
+        return os.path.join(self.directory, f"{artifact.id}.artifact{suffix}")
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self.directory, f"{artifact_id}.meta.json")
+
+    def _read_meta(self, artifact_id):
+        if not artifact_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(artifact_id), 'r', encoding='utf-8') as f:
+                return Artifact.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _load_index(self):
+        self._sync_index(time.time())
+
+    def _sync_if_due(self):
+        now = time.time()
+        with self._lock:
+            if now - self._synced_at < self.sync_interval:
+                return 0
+            self._synced_at = now
+        return self._sync_index(now)
+
+    def _sync_index(self, now):
+        """Rebuild the index from the directory and evict over it; returns the number evicted.
+
+        Known artifacts are reused, so only metadata written since the last
+        sync, typically by another worker, is read. Artifacts removed by
+        another worker drop out of the index.
+        """
+        names = os.listdir(self.directory)
+        present = set(names)
+        with self._lock:
+            known = dict(self._artifacts)
+
+        artifacts = []
+        for name in names:
+            if name.endswith('.meta.json'):
+                artifact_id = name[:-len('.meta.json')]
+                artifact = known.get(artifact_id) or self._read_meta(artifact_id)
+                if artifact is not None and os.path.basename(self._content_path(artifact)) in present:
+                    artifacts.append(artifact)
+
+        indexed = {os.path.basename(self._content_path(artifact)) for artifact in artifacts}
+        for name in names:
+            if name.endswith('.tmp') or ('.artifact' in name and name not in indexed):
+                self._remove_stale(os.path.join(self.directory, name), now)
+
+        with self._lock:
+            # Keep what this process stored while the directory was being read
+            listed = {artifact.id for artifact in artifacts}
+            artifacts.extend(artifact for artifact in self._artifacts.values()
+                             if artifact.id not in listed and artifact.created_at >= now)
+            self._artifacts = OrderedDict()
+            self._by_spec = {}
+            self._by_user = {}
+            self._stored_bytes = 0
+            for artifact in sorted(artifacts, key=lambda artifact: artifact.created_at):
+                self._add(artifact)
+            self._synced_at = now
+            expired = self._select_evictions(time.time())
+        self._delete_files(expired)
+        return len(expired)
+
+    def _remove_stale(self, path, now):
+        """Remove a leftover file unless it may still be another process's write in flight."""
+        try:
+            if now - os.path.getmtime(path) < self.orphan_grace:
+                return
+        except OSError:
+            return
+        self._remove(path)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
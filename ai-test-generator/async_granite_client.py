@@ -0,0 +1,275 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from granite_client import GENERATION_PARAMETERS, IAM_TOKEN_URL
+
+from testgen_common.coalescing import SingleFlight, request_key
+from testgen_common.llm_scheduler import (LLMScheduler, current_caller, estimate_call_tokens, estimate_prompt_tokens,
+                                          used_tokens)
+from testgen_common.metrics import (TOKEN_FETCH_SECONDS, WATSONX_ERRORS, WATSONX_REQUEST_SECONDS, operation_for_url,
+                                    record_token_usage)
+from testgen_common.resilience import (CircuitBreaker, GraniteAuthError, GraniteResponseError, RetryPolicy,
+                                       acall_with_retries, generation_deadline, raise_for_status, translate_exception)
+from testgen_common.shared_state import create_token_store
+
+load_dotenv()
+
+class AsyncGraniteClient:
+    """asyncio counterpart of GraniteClient.
+
+    All calls run on one event loop owned by the client, in a background
+    thread, so that a single httpx connection pool and a single semaphore
+    bound every in-flight request in the process. The public coroutines can
+    be awaited from any event loop, including the per-request loops Flask
+    creates for async views.
+    """
+
+    def __init__(self, scheduler=None):
+        self.api_key = os.getenv('IBM_API_KEY')
+        self.project_id = os.getenv('WATSONX_PROJECT_ID')
+        self.base_url = os.getenv('WATSONX_URL')
+        self.model_id = os.getenv('GRANITE_MODEL')
+        self.iam_url = os.getenv('IBM_IAM_URL', IAM_TOKEN_URL)
+        self.generation_parameters = copy.deepcopy(GENERATION_PARAMETERS)
+        self.access_token = None
+        self.token_expires_at = 0
+
+        self.max_inflight = int(os.getenv('GRANITE_ASYNC_MAX_INFLIGHT', 64))
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv('GRANITE_POOL_MAXSIZE', 16)),
+            max_keepalive_connections=int(os.getenv('GRANITE_POOL_MAXSIZE', 16)),
+            keepalive_expiry=float(os.getenv('GRANITE_KEEPALIVE_EXPIRY', 60))
+        )
+        self.timeout = httpx.Timeout(
+            float(os.getenv('GRANITE_READ_TIMEOUT', 120)),
+            connect=float(os.getenv('GRANITE_CONNECT_TIMEOUT', 5)),
+            pool=None
+        )
+
+        self.deadline_base = float(os.getenv('GRANITE_DEADLINE_BASE', 10))
+        self.min_tokens_per_second = float(os.getenv('GRANITE_MIN_TOKENS_PER_SECOND', 20))
+        self.deadline_max = float(os.getenv('GRANITE_DEADLINE_MAX', 300))
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv('GRANITE_MAX_ATTEMPTS', 3)),
+            base_delay=float(os.getenv('GRANITE_BACKOFF_BASE', 0.5)),
+            max_delay=float(os.getenv('GRANITE_BACKOFF_MAX', 20))
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('GRANITE_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('GRANITE_BREAKER_RESET', 30))
+        )
+
+        # Reads and publishes the token shared through SHARED_STATE_BACKEND but
+        # skips the cross-process refresh lock, which would block the loop
+        self.token_store = create_token_store(
+            os.getenv('SHARED_STATE_BACKEND', 'none').lower(),
+            self.api_key or '',
+            directory=os.getenv('SHARED_STATE_DIR', 'shared_state'),
+            redis_url=os.getenv('SHARED_STATE_REDIS_URL', 'redis://localhost:6379/0')
+        )
+        self.coalescer = SingleFlight(os.getenv('GRANITE_COALESCE', 'true').lower() == 'true')
+        self.scheduler = scheduler or LLMScheduler()
+
+        self._reset_loop_state()
+
+    def after_fork(self):
+        """Forget the parent's event loop thread and connections in a forked worker"""
+        self._reset_loop_state()
+        self.coalescer = SingleFlight(self.coalescer.enabled)
+
+    def _reset_loop_state(self):
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        self._http = None
+        self._semaphore = None
+        self._token_lock = None
+        self._in_flight = 0
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='granite-async-client', daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    async def _setup(self):
+        self._http = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self._token_lock = asyncio.Lock()
+
+    async def _on_client_loop(self, coroutine_function, *args):
+        loop = self._ensure_loop()
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is loop:
+            return await coroutine_function(*args)
+        future = asyncio.run_coroutine_threadsafe(coroutine_function(*args), loop)
+        return await asyncio.wrap_future(future)
+
+    async def get_access_token(self):
+        return await self._on_client_loop(self._get_access_token)
+
+    async def generate_test_cases(self, prompt):
+        # The caller is read here, on the requesting thread; the client loop has no request context
+        return await self._on_client_loop(self._generate_test_cases, prompt, current_caller())
+
+    def stats(self):
+        return {
+            'max_inflight': self.max_inflight,
+            'in_flight': self._in_flight,
+            'coalescing': self.coalescer.stats(),
+            'circuit_breaker': self.circuit_breaker.stats()
+        }
+
+    def close(self):
+        with self._loop_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+
+    def _token_is_valid(self):
+        return self.access_token is not None and time.time() < self.token_expires_at
+
+    async def _get_access_token(self):
+        if self._token_is_valid():
+            return self.access_token
+
+        async with self._token_lock:
+            if self._token_is_valid():
+                return self.access_token
+
+            stored = self.token_store.load() if self.token_store else None
+            if stored:
+                self.access_token, self.token_expires_at = stored
+                return self.access_token
+
+            headers = {"Content-Type": "application/x-www-form-urlencoded"}
+            data = {
+                "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+                "apikey": self.api_key
+            }
+
+            async def attempt(remaining):
+                timeout = httpx.Timeout(min(self.timeout.read, remaining), connect=self.timeout.connect, pool=None)
+                response = await self._http.post(self.iam_url, headers=headers, data=data, timeout=timeout)
+                raise_for_status(response, "IAM token request")
+                return response.json()
+
+            try:
+                with TOKEN_FETCH_SECONDS.time():
+                    token_data = await acall_with_retries(attempt, self.timeout.read, "IAM token request",
+                                                          self.retry_policy)
+                expires_at = time.time() + token_data.get("expires_in", 3600) - 300
+                self.access_token = token_data["access_token"]
+                self.token_expires_at = expires_at
+                if self.token_store:
+                    self.token_store.save(self.access_token, self.token_expires_at)
+
+                return self.access_token
+            except Exception as e:
+                raise GraniteAuthError(f"Failed to get access token: {str(e)}",
+                                       getattr(e, 'status_code', None)) from e
+
+    async def _generate_test_cases(self, prompt, caller=None):
+        url = f"{self.base_url}/ml/v1/text/generation?version=2023-05-29"
+        payload = {
+            "input": prompt,
+            "parameters": self.generation_parameters,
+            "model_id": self.model_id,
+            "project_id": self.project_id
+        }
+        # Duplicates wait outside the semaphore, holding no in-flight slot
+        return await self.coalescer.ado(request_key(payload), self._limited_generation, url, payload, caller)
+
+    async def _limited_generation(self, url, payload, caller):
+        ticket = await self.scheduler.aacquire(estimate_call_tokens(payload), caller)
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                return await self._post_generation(url, payload, ticket)
+            finally:
+                self._in_flight -= 1
+
+    async def _post_generation(self, url, payload, ticket):
+        operation = operation_for_url(url)
+
+        async def send(headers, timeout):
+            started = time.perf_counter()
+            try:
+                response = await self._http.post(url, headers=headers, json=payload, timeout=timeout)
+            except Exception as e:
+                WATSONX_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation,
+                                                status=type(e).__name__)
+                raise
+            WATSONX_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation,
+                                            status=response.status_code)
+            return response
+
+        async def attempt(remaining):
+            token = await self._get_access_token()
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            timeout = httpx.Timeout(remaining, connect=self.timeout.connect, pool=None)
+            response = await send(headers, timeout)
+            if response.status_code == 401 and self.access_token == token:
+                # The token was revoked or expired early; retry once with a new one
+                self.access_token = None
+                if self.token_store:
+                    self.token_store.discard(token)
+                headers["Authorization"] = f"Bearer {await self._get_access_token()}"
+                response = await send(headers, timeout)
+            raise_for_status(response, "Failed to generate test cases")
+            return response
+
+        async def counted_attempt(remaining):
+            try:
+                return await attempt(remaining)
+            except Exception as e:
+                error = translate_exception(e, "Failed to generate test cases")
+                WATSONX_ERRORS.inc(operation=operation, error=type(error).__name__)
+                if error.status_code is not None and error.retry_after:
+                    # watsonx asked every caller to back off, not just this one
+                    self.scheduler.pause(error.retry_after)
+                raise
+
+        async def before_retry(error):
+            # Each retry is another request against the plan's limits
+            await self.scheduler.areadmit(ticket)
+
+        deadline = generation_deadline(self.generation_parameters.get("max_new_tokens", 0), self.deadline_base,
+                                       self.min_tokens_per_second, self.deadline_max)
+        # A call watsonx never answered is charged nothing
+        used = 0
+        try:
+            response = await acall_with_retries(counted_attempt, deadline, "Failed to generate test cases",
+                                                self.retry_policy, self.circuit_breaker, before_retry)
+            # watsonx ran the prompt; charge it unless the result has the counts
+            used = estimate_prompt_tokens(payload)
+
+            try:
+                result = response.json()["results"][0]
+                record_token_usage(operation, result)
+                used = used_tokens(result, used)
+                return result["generated_text"]
+            except Exception as e:
+                raise GraniteResponseError(f"Failed to generate test cases: {str(e)}")
+        finally:
+            self.scheduler.settle(ticket, used)
@@ -0,0 +1,184 @@
+import atexit
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from spec_parser import SpecParser
+
+SPEC_EXTENSIONS = ('.json', '.yaml', '.yml')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_spec_document(filename, data, compact_min_bytes=None):
+    """Parse one spec from its raw bytes; runs in a worker process.
+
+    Specs of compact_min_bytes or more are read with SpecParser.stream_spec,
+    which keeps only what prompts and sharding use.
+    """
+    file_type = filename.rsplit('.', 1)[1].lower()
+    if compact_min_bytes is not None and len(data) >= compact_min_bytes:
+        return SpecParser.stream_spec(io.BytesIO(data), file_type).api_info()
+    return SpecParser.parse_openapi_stream(io.BytesIO(data), file_type)
+
+
+def expand_archive(filename, data, max_items, max_bytes):
+    """Return [(name, bytes)] for every spec file inside a zip archive.
+
+    Member counts and uncompressed sizes are checked against the limits
+    before anything is extracted.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BatchError(f"'{filename}' is not a valid zip archive")
+
+    with archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir()
+                   and info.filename.lower().endswith(SPEC_EXTENSIONS)
+                   and not os.path.basename(info.filename).startswith('.')]
+        if len(members) > max_items:
+            raise BatchError(f"'{filename}' contains {len(members)} specs; the limit is {max_items}")
+        if sum(info.file_size for info in members) > max_bytes:
+            raise BatchError(f"'{filename}' expands to more than {max_bytes} bytes")
+        return [(info.filename, archive.read(info)) for info in members]
+
+
+def interleave(groups):
+    """Round-robin over lists so every group gets its first turn early."""
+    ordered = []
+    for index in range(max((len(group) for group in groups), default=0)):
+        ordered.extend(group[index] for group in groups if index < len(group))
+    return ordered
+
+
+def unique_filename(name, used):
+    stem, extension = os.path.splitext(name)
+    candidate = name
+    suffix = 2
+    while candidate in used:
+        candidate = f"{stem}_{suffix}{extension}"
+        suffix += 1
+    used.add(candidate)
+    return candidate
+
+
+def build_archive(files, manifest):
+    """Zip [(filename, text)] together with manifest.json."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, text in files:
+            archive.writestr(filename, text)
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    buffer.seek(0)
+    return buffer
+
+
+def _process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class BatchScheduler:
+    """Shares one bounded pool between every batch in the process.
+
+    Parsing runs in a process pool so large specs do not hold the GIL.
+    Generation tasks run on a thread pool of max_workers, and each batch
+    keeps at most per_batch_limit tasks queued or running at a time, so
+    concurrent batches interleave instead of one draining the pool first.
+
+    The process pool is started on first use, from a request thread, so
+    its processes come from a forkserver (spawn where that is missing):
+    fork() there would copy locks that other threads hold at that moment.
+    """
+
+    def __init__(self, max_workers=8, per_batch_limit=4, parse_workers=2):
+        self.max_workers = max_workers
+        self.per_batch_limit = max(1, min(per_batch_limit, max_workers))
+        self.parse_workers = parse_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-generation')
+        self._parse_pool = None
+        self._lock = threading.Lock()
+        self._active_batches = 0
+
+    def parse_all(self, fn, items):
+        """Run fn(*item) for each item; returns [(result, error)] in order."""
+        if not self.parse_workers or len(items) < 2:
+            return [self._capture(fn, *item) for item in items]
+
+        with self._lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=_process_context())
+                atexit.register(self.shutdown)
+            pool = self._parse_pool
+
+        futures = [pool.submit(fn, *item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def run(self, tasks):
+        """Run callables on the shared pool; returns [(result, error)] in order."""
+        slots = threading.Semaphore(self.per_batch_limit)
+        futures = []
+
+        with self._lock:
+            self._active_batches += 1
+        try:
+            for task in tasks:
+                slots.acquire()
+                future = self._executor.submit(self._capture, task)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            return [future.result() for future in futures]
+        finally:
+            with self._lock:
+                self._active_batches -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_batches': self._active_batches,
+                'max_workers': self.max_workers,
+                'per_batch_limit': self.per_batch_limit,
+                'parse_workers': self.parse_workers
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(wait=False)
+                self._parse_pool = None
+
+    def after_fork(self):
+        """Forget a process pool inherited from the parent; the next parse_all() starts one.
+
+        Its processes are the parent's children, so only the parent can shut
+        them down.
+        """
+        self._lock = threading.Lock()
+        self._parse_pool = None
+
+    @staticmethod
+    def _capture(fn, *args):
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
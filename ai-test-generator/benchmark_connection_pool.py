@@ -0,0 +1,135 @@
+"""Benchmark pooled keep-alive sessions against per-call requests.post.
+
+Starts a local stub of the IAM token and text generation endpoints, then
+drives the same number of generation calls through:
+
+  1. module-level requests.post (new TCP/TLS connection per call)
+  2. GraniteClient with its pooled session
+
+Usage:
+    python benchmark_connection_pool.py --requests 500 --concurrency 16
+    python benchmark_connection_pool.py --tls-cert cert.pem --tls-key key.pem
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if self.path.startswith("/identity/token"):
+            body = {"access_token": "stub-token", "expires_in": 3600}
+        else:
+            if self.latency:
+                time.sleep(self.latency)
+            body = {"results": [{"generated_text": "@Test void ok() {}"}]}
+
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency, cert=None, key=None):
+    StubHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    scheme = "http"
+    if cert and key:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"{scheme}://{host}:{port}"
+
+
+def run(label, call, total, concurrency):
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_call(_):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed_call, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(latencies) * 1000:8.2f} ms"
+          f"  p50 {statistics.median(latencies) * 1000:8.2f} ms"
+          f"  p95 {p95 * 1000:8.2f} ms"
+          f"  throughput {total / wall:8.1f} req/s")
+    return wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated generation latency in seconds")
+    parser.add_argument("--tls-cert")
+    parser.add_argument("--tls-key")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency, args.tls_cert, args.tls_key)
+    verify = not base_url.startswith("https")
+
+    os.environ["IBM_API_KEY"] = "stub"
+    os.environ["WATSONX_PROJECT_ID"] = "stub"
+    os.environ["WATSONX_URL"] = base_url
+    os.environ["GRANITE_MODEL"] = "ibm/granite-stub"
+    os.environ["IBM_IAM_URL"] = f"{base_url}/identity/token"
+    os.environ.setdefault("GRANITE_POOL_MAXSIZE", str(args.concurrency))
+
+    from granite_client import GraniteClient
+
+    url = f"{base_url}/ml/v1/text/generation?version=2023-05-29"
+    payload = {"input": "prompt", "parameters": {"max_new_tokens": 10}}
+
+    def unpooled_call():
+        response = requests.post(url, json=payload, verify=verify)
+        response.raise_for_status()
+
+    client = GraniteClient()
+    client.session.verify = verify
+
+    print(f"Stub server: {base_url}  requests={args.requests}  concurrency={args.concurrency}")
+    baseline = run("requests.post", unpooled_call, args.requests, args.concurrency)
+    pooled = run("GraniteClient (pooled)", lambda: client.generate_test_cases("prompt"),
+                 args.requests, args.concurrency)
+    print(f"Speed-up: {baseline / pooled:.2f}x")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
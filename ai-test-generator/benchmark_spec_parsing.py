@@ -0,0 +1,139 @@
+"""Benchmark OpenAPI spec loading for synthetic specs of increasing size.
+
+Times the raw YAML/JSON loaders (pure Python vs accelerated backends) and the
+full SpecParser.parse_openapi_spec path for specs with 10, 1k and 10k paths,
+and compares the peak memory of parse_openapi_stream with the lazy
+SpecParser.iter_endpoints.
+
+Usage:
+    python benchmark_spec_parsing.py
+    python benchmark_spec_parsing.py --sizes 10 1000 --repeat 5
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import yaml
+
+import spec_parser
+from spec_parser import SpecParser
+
+
+def build_spec(path_count):
+    paths = {}
+    for i in range(path_count):
+        paths[f"/resources{i}/{{id}}"] = {
+            'get': {
+                'summary': f"Get resource {i}",
+                'tags': [f"group{i % 25}"],
+                'parameters': [
+                    {'name': 'id', 'in': 'path', 'required': True, 'schema': {'type': 'integer'}},
+                    {'name': 'expand', 'in': 'query', 'schema': {'type': 'string', 'enum': ['a', 'b', 'c']}}
+                ],
+                'responses': {
+                    '200': {
+                        'description': 'OK',
+                        'content': {'application/json': {'schema': {'$ref': f"#/components/schemas/Model{i % 50}"}}}
+                    },
+                    '404': {'description': 'Not found'}
+                }
+            },
+            'put': {
+                'summary': f"Replace resource {i}",
+                'requestBody': {
+                    'content': {'application/json': {'schema': {'$ref': f"#/components/schemas/Model{i % 50}"}}}
+                },
+                'responses': {'204': {'description': 'Updated'}}
+            }
+        }
+
+    schemas = {
+        f"Model{i}": {
+            'type': 'object',
+            'properties': {
+                'id': {'type': 'integer'},
+                'name': {'type': 'string', 'maxLength': 64},
+                'parent': {'$ref': f"#/components/schemas/Model{(i + 1) % 50}"}
+            }
+        }
+        for i in range(50)
+    }
+
+    return {
+        'openapi': '3.0.0',
+        'info': {'title': f"Synthetic {path_count}", 'version': '1.0.0'},
+        'servers': [{'url': 'https://api.example.com'}],
+        'paths': paths,
+        'components': {'schemas': schemas}
+    }
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def count_endpoints(data, file_type):
+    return sum(1 for _ in SpecParser.iter_endpoints(io.BytesIO(data), file_type))
+
+
+def report(label, seconds, size_bytes):
+    mb_per_second = size_bytes / (1024 * 1024) / seconds if seconds else float('inf')
+    print(f"  {label:<34} {seconds * 1000:10.1f} ms  {mb_per_second:8.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"YAML loader: {spec_parser.YAML_LOADER}  JSON backend: {spec_parser.JSON_BACKEND}")
+
+    for size in args.sizes:
+        spec = build_spec(size)
+        yaml_text = yaml.dump(spec, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper), sort_keys=False)
+        json_text = json.dumps(spec)
+        print(f"\n{size} paths  (YAML {len(yaml_text) / 1024:.0f} KB, JSON {len(json_text) / 1024:.0f} KB)")
+
+        report('yaml SafeLoader', best_of(args.repeat, lambda: yaml.load(yaml_text, Loader=yaml.SafeLoader)),
+               len(yaml_text))
+        if hasattr(yaml, 'CSafeLoader'):
+            report('yaml CSafeLoader', best_of(args.repeat, lambda: yaml.load(yaml_text, Loader=yaml.CSafeLoader)),
+                   len(yaml_text))
+        report('json.loads', best_of(args.repeat, lambda: json.loads(json_text)), len(json_text))
+        if spec_parser.JSON_BACKEND != 'json':
+            report(f"{spec_parser.JSON_BACKEND}.loads", best_of(args.repeat, lambda: spec_parser.json_loads(json_text)),
+                   len(json_text))
+        report('SpecParser.parse_openapi_spec yaml',
+               best_of(args.repeat, lambda: SpecParser.parse_openapi_spec(yaml_text, 'yaml')), len(yaml_text))
+        report('SpecParser.parse_openapi_spec json',
+               best_of(args.repeat, lambda: SpecParser.parse_openapi_spec(json_text, 'json')), len(json_text))
+        
+        for file_type, text in (('yaml', yaml_text), ('json', json_text)):
+            data = text.encode('utf-8')
+            report(f"SpecParser.iter_endpoints {file_type}",
+                   best_of(args.repeat, lambda: count_endpoints(data, file_type)), len(data))
+            full = peak_memory(lambda: SpecParser.parse_openapi_stream(io.BytesIO(data), file_type))
+            lazy = peak_memory(lambda: count_endpoints(data, file_type))
+            print(f"  {'peak memory ' + file_type:<34} {full / (1024 * 1024):7.1f} MB parse_openapi_stream"
+                  f"  {lazy / (1024 * 1024):7.1f} MB iter_endpoints")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+
+def _json_default(value):
+    # Lazily decoded schema mappings (spec_parser.LazySchemas) hash like dicts
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_json_default)
+
+
+class GenerationCache:
+    """Two-tier cache for generated test code.
+
+    Entries are addressed by a SHA-256 of everything that determines the
+    model output: the normalized parsed spec, the prompt template version,
+    the model id and the decoding parameters. The memory tier is an LRU of
+    max_entries items; the optional disk tier lives in directory and is
+    trimmed to max_disk_bytes, oldest first. Both tiers expire entries after
+    ttl seconds. The disk tier is shared by every worker process on a host;
+    passing shared, an object with get(key) and set(key, value) such as
+    testgen_common.shared_state.RedisCacheStore, replaces it with a store
+    shared across hosts. Its hits are counted as disk_hits.
+    """
+
+    def __init__(self, max_entries=256, directory=None, max_disk_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600,
+                 shared=None):
+        self.max_entries = max_entries
+        self.directory = directory if shared is None else None
+        self.shared = shared
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(api_info, model_id, parameters, template_version, **extra):
+        material = {
+            'spec': api_info,
+            'template_version': template_version,
+            'model_id': model_id,
+            'parameters': parameters,
+            'extra': extra
+        }
+        return hashlib.sha256(canonical_json(material).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return entry[0]
+            if entry:
+                del self._memory[key]
+
+        value = self._read_shared(key, now)
+        with self._lock:
+            if value is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._remember(key, value, now)
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._counters['stores'] += 1
+            self._remember(key, value, now)
+        self._write_shared(key, value)
+
+    def get_or_generate(self, key, generate):
+        value = self.get(key)
+        if value is None:
+            value = generate()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        if self.directory:
+            with self._disk_lock:
+                files = self._disk_entries()
+            stats['disk_entries'] = len(files)
+            stats['disk_bytes'] = sum(size for _, size, _ in files)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            with self._disk_lock:
+                for path, _, _ in self._disk_entries():
+                    self._remove(path)
+
+    def _remember(self, key, value, now):
+        self._memory[key] = (value, now)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _read_shared(self, key, now):
+        if self.shared is None:
+            return self._read_disk(key, now)
+        try:
+            return self.shared.get(key)
+        except Exception:
+            return None
+
+    def _write_shared(self, key, value):
+        if self.shared is None:
+            self._write_disk(key, value)
+            return
+        try:
+            self.shared.set(key, value)
+        except Exception:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.java")
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) >= self.ttl:
+                self._remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.directory:
+            return
+        with self._disk_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(value)
+                os.replace(tmp_path, self._path(key))
+            except OSError:
+                self._remove(tmp_path)
+                return
+            self._trim_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.java'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _trim_disk(self):
+        now = time.time()
+        evicted = 0
+        entries = []
+        for path, size, mtime in self._disk_entries():
+            if now - mtime >= self.ttl:
+                self._remove(path)
+                evicted += 1
+            else:
+                entries.append((path, size, mtime))
+
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+            evicted += 1
+
+        if evicted:
+            with self._lock:
+                self._counters['evictions'] += evicted
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,67 +1,431 @@
 import os
+import copy
+import json
 import requests
 import time
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from testgen_common.coalescing import SingleFlight, request_key
+from testgen_common.llm_scheduler import LLMScheduler, estimate_call_tokens, estimate_prompt_tokens, used_tokens
+from testgen_common.metrics import (TOKEN_FETCH_SECONDS, WATSONX_ERRORS, WATSONX_REQUEST_SECONDS, operation_for_url,
+                                    record_token_usage)
+from testgen_common.resilience import (CircuitBreaker, GraniteAuthError, GraniteError, GraniteResponseError,
+                                       RetryPolicy, call_with_retries, generation_deadline, raise_for_status,
+                                       translate_exception)
+from testgen_common.shared_state import create_token_store
+from testgen_common.tracing import span
+
 load_dotenv()
 
+IAM_TOKEN_URL = "https://iam.cloud.ibm.com/identity/token"
+
+GENERATION_PARAMETERS = {
+    "decoding_method": "greedy",
+    "max_new_tokens": 3000,
+    "temperature": 0.1,
+    "stop_sequences": ["</code>", "---END---"]
+}
+
+logger = logging.getLogger(__name__)
+
 class GraniteClient:
-    def __init__(self):
+    def __init__(self, scheduler=None):
         self.api_key = os.getenv('IBM_API_KEY')
         self.project_id = os.getenv('WATSONX_PROJECT_ID')
         self.base_url = os.getenv('WATSONX_URL')
         self.model_id = os.getenv('GRANITE_MODEL')
+        self.iam_url = os.getenv('IBM_IAM_URL', IAM_TOKEN_URL)
+        self.generation_parameters = copy.deepcopy(GENERATION_PARAMETERS)
         self.access_token = None
         self.token_expires_at = 0
+        self._token_lock = threading.Lock()
+        self._renewer_thread = None
+        self._renewer_stop = threading.Event()
+        # With SHARED_STATE_BACKEND=file or redis, worker processes share one
+        # IAM token instead of each fetching their own
+        self.token_store = create_token_store(
+            os.getenv('SHARED_STATE_BACKEND', 'none').lower(),
+            self.api_key or '',
+            directory=os.getenv('SHARED_STATE_DIR', 'shared_state'),
+            redis_url=os.getenv('SHARED_STATE_REDIS_URL', 'redis://localhost:6379/0')
+        )
+        
+        # Connection pool settings. One pool is kept per host (IAM and
+        # watsonx), each holding up to pool_maxsize keep-alive connections.
+        self.pool_connections = int(os.getenv('GRANITE_POOL_CONNECTIONS', 4))
+        self.pool_maxsize = int(os.getenv('GRANITE_POOL_MAXSIZE', 16))
+        self.pool_block = os.getenv('GRANITE_POOL_BLOCK', 'false').lower() == 'true'
+        self.keep_alive = os.getenv('GRANITE_KEEP_ALIVE', 'true').lower() == 'true'
+        self.connect_timeout = float(os.getenv('GRANITE_CONNECT_TIMEOUT', 5))
+        self.read_timeout = float(os.getenv('GRANITE_READ_TIMEOUT', 120))
+        self.session = self._build_session()
+        
+        # Generation calls get a deadline that scales with max_new_tokens and
+        # covers every retry; transient failures back off with jitter and a
+        # circuit breaker fails fast while watsonx keeps failing.
+        self.deadline_base = float(os.getenv('GRANITE_DEADLINE_BASE', 10))
+        self.min_tokens_per_second = float(os.getenv('GRANITE_MIN_TOKENS_PER_SECOND', 20))
+        self.deadline_max = float(os.getenv('GRANITE_DEADLINE_MAX', 300))
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv('GRANITE_MAX_ATTEMPTS', 3)),
+            base_delay=float(os.getenv('GRANITE_BACKOFF_BASE', 0.5)),
+            max_delay=float(os.getenv('GRANITE_BACKOFF_MAX', 20))
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('GRANITE_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('GRANITE_BREAKER_RESET', 30))
+        )
+        
+        # Identical generations already in flight (the same spec pushed by
+        # several CI jobs at once) share one watsonx call, cache or no cache
+        self.coalescer = SingleFlight(os.getenv('GRANITE_COALESCE', 'true').lower() == 'true')
+        # Orders calls by tenant and lane within the plan's rate limits; the
+        # app passes the one it shares with the async client
+        self.scheduler = scheduler or LLMScheduler()
+    
+    def _build_session(self):
+        """Create the pooled HTTP session shared by all request threads."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=0
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # The session is shared across Flask threads, so keep it free of
+        # per-response mutable state: never store cookies.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+        return session
+    
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+    
+    def generation_deadline(self, parameters=None):
+        parameters = parameters or self.generation_parameters
+        return generation_deadline(parameters.get("max_new_tokens", 0), self.deadline_base,
+                                   self.min_tokens_per_second, self.deadline_max)
+    
+    def close(self):
+        self.stop_token_renewer()
+        self.session.close()
+    
+    def _token_is_valid(self):
+        return self.access_token is not None and time.time() < self.token_expires_at
     
     def get_access_token(self):
-        if self.access_token and time.time() < self.token_expires_at:
+        if self._token_is_valid():
             return self.access_token
         
-        url = "https://iam.cloud.ibm.com/identity/token"
+        # Single-flight refresh: the first caller fetches a new token while
+        # concurrent callers block on the lock and reuse its result.
+        with self._token_lock:
+            if self._token_is_valid():
+                return self.access_token
+            return self._refresh_access_token()
+    
+    def _refresh_access_token(self, min_remaining=0):
+        """Replace the token. Callers must hold self._token_lock.
+        
+        With a shared token store, a token another worker stored is adopted
+        while it stays valid for min_remaining more seconds. Otherwise this
+        process fetches one under the store's lock and saves it for the rest.
+        """
+        if self.token_store is None:
+            return self._fetch_access_token()
+        
+        try:
+            with self.token_store.lock():
+                stored = self.token_store.load()
+                if stored and stored[1] - min_remaining > time.time():
+                    self.access_token, self.token_expires_at = stored
+                    return self.access_token
+                self._fetch_access_token()
+                self.token_store.save(self.access_token, self.token_expires_at)
+                return self.access_token
+        except GraniteAuthError:
+            raise
+        except Exception as e:
+            logger.warning("Shared token store failed, using a token for this process only: %s", e)
+            return self._fetch_access_token()
+    
+    def _fetch_access_token(self):
+        """Fetch a new IAM token from IAM."""
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {
             "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
             "apikey": self.api_key
         }
         
+        def attempt(remaining):
+            response = self.session.post(self.iam_url, headers=headers, data=data,
+                                         timeout=(self.connect_timeout, min(self.read_timeout, remaining)))
+            raise_for_status(response, "IAM token request")
+            return response.json()
+        
         try:
-            response = requests.post(url, headers=headers, data=data)
-            response.raise_for_status()
-            
-            token_data = response.json()
+            with span('iam.token'), TOKEN_FETCH_SECONDS.time():
+                token_data = call_with_retries(attempt, self.read_timeout, "IAM token request", self.retry_policy)
+            expires_at = time.time() + token_data.get("expires_in", 3600) - 300
             self.access_token = token_data["access_token"]
-            self.token_expires_at = time.time() + token_data.get("expires_in", 3600) - 300
+            self.token_expires_at = expires_at
             
             return self.access_token
         except Exception as e:
-            raise Exception(f"Failed to get access token: {str(e)}")
+            raise GraniteAuthError(f"Failed to get access token: {str(e)}",
+                                   getattr(e, 'status_code', None)) from e
+    
+    def _invalidate_access_token(self, rejected_token):
+        with self._token_lock:
+            if self.access_token == rejected_token:
+                self.access_token = None
+                self.token_expires_at = 0
+            if self.token_store is not None:
+                try:
+                    self.token_store.discard(rejected_token)
+                except Exception as e:
+                    logger.warning("Could not discard the rejected token from the shared store: %s", e)
+    
+    def start_token_renewer(self, renew_before=60, retry_interval=15):
+        """Refresh the token in a background thread ahead of its expiry.
+        
+        The token is renewed renew_before seconds before token_expires_at, so
+        request threads find a valid token and never wait on IAM. If a renewal
+        fails it is retried every retry_interval seconds; request threads still
+        fall back to a synchronous refresh if the token does lapse.
+        """
+        if self._renewer_thread and self._renewer_thread.is_alive():
+            return
+        
+        self._renewer_stop.clear()
+        
+        def renew_loop():
+            while not self._renewer_stop.is_set():
+                wait = self.token_expires_at - renew_before - time.time()
+                if self.access_token is not None:
+                    # Never spin, even if IAM hands out very short-lived tokens
+                    wait = max(wait, 1)
+                if wait > 0 and self._renewer_stop.wait(wait):
+                    break
+                try:
+                    with self._token_lock:
+                        if self.token_expires_at - renew_before - time.time() <= 0:
+                            self._refresh_access_token(renew_before)
+                except Exception as e:
+                    logger.warning("Background token renewal failed: %s", e)
+                    self._renewer_stop.wait(retry_interval)
+        
+        self._renewer_thread = threading.Thread(target=renew_loop, name="granite-token-renewer", daemon=True)
+        self._renewer_thread.start()
+    
+    def stop_token_renewer(self):
+        self._renewer_stop.set()
+        if self._renewer_thread:
+            self._renewer_thread.join(timeout=5)
+            self._renewer_thread = None
+    
+    def after_fork(self):
+        """Reset per-process state in a newly forked worker.
+        
+        Pooled sockets and threads belong to the parent, so the child builds
+        its own session and restarts the token renewer if the parent ran one.
+        """
+        renewer_running = self._renewer_thread is not None
+        self.session = self._build_session()
+        self._token_lock = threading.Lock()
+        self._renewer_thread = None
+        self._renewer_stop = threading.Event()
+        self.coalescer = SingleFlight(self.coalescer.enabled)
+        if renewer_running:
+            self.start_token_renewer()
+    
+    def _generation_payload(self, prompt):
+        return {
+            "input": prompt,
+            "parameters": self.generation_parameters,
+            "model_id": self.model_id,
+            "project_id": self.project_id
+        }
+    
+    def _post_watsonx(self, url, payload, action, stream=False, ticket=None):
+        """POST to watsonx with retries, the circuit breaker and a token-scaled deadline."""
+        operation = operation_for_url(url)
+        
+        def send(headers, remaining):
+            started = time.perf_counter()
+            with span('watsonx.request', operation=operation) as request_span:
+                try:
+                    response = self.session.post(url, headers=headers, json=payload, stream=stream,
+                                                 timeout=(self.connect_timeout, remaining))
+                except Exception as e:
+                    WATSONX_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation,
+                                                    status=type(e).__name__)
+                    raise
+                request_span.set('status', response.status_code)
+            WATSONX_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation,
+                                            status=response.status_code)
+            return response
+        
+        def attempt(remaining):
+            token = self.get_access_token()
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            if stream:
+                headers["Accept"] = "text/event-stream"
+            
+            response = send(headers, remaining)
+            if response.status_code == 401:
+                # The token was revoked or expired early; retry once with a new one
+                response.close()
+                self._invalidate_access_token(token)
+                headers["Authorization"] = f"Bearer {self.get_access_token()}"
+                response = send(headers, remaining)
+            if response.status_code >= 400:
+                response.close()
+            raise_for_status(response, action)
+            return response
+        
+        def counted_attempt(remaining):
+            try:
+                return attempt(remaining)
+            except Exception as e:
+                error = translate_exception(e, action)
+                WATSONX_ERRORS.inc(operation=operation, error=type(error).__name__)
+                if error.status_code is not None and error.retry_after:
+                    # watsonx asked every caller to back off, not just this one
+                    self.scheduler.pause(error.retry_after)
+                raise
+        
+        def before_retry(error):
+            # Each retry is another request against the plan's limits
+            if ticket is not None:
+                self.scheduler.readmit(ticket)
+        
+        return call_with_retries(counted_attempt, self.generation_deadline(payload["parameters"]), action,
+                                 self.retry_policy, self.circuit_breaker, before_retry)
     
     def generate_test_cases(self, prompt):
+        payload = self._generation_payload(prompt)
+        return self.coalescer.do(request_key(payload), self._post_generation, payload)
+    
+    def _post_generation(self, payload):
         url = f"{self.base_url}/ml/v1/text/generation?version=2023-05-29"
         
-        headers = {
-            "Authorization": f"Bearer {self.get_access_token()}",
-            "Content-Type": "application/json"
-        }
+        ticket = self.scheduler.acquire(estimate_call_tokens(payload))
+        # A call watsonx never answered is charged nothing
+        used = 0
+        try:
+            response = self._post_watsonx(url, payload, "Failed to generate test cases", ticket=ticket)
+            # watsonx ran the prompt; charge it unless the result has the counts
+            used = estimate_prompt_tokens(payload)
+            result = response.json()["results"][0]
+            record_token_usage("generation", result)
+            used = used_tokens(result, used)
+            return result["generated_text"]
+        except GraniteError:
+            raise
+        except Exception as e:
+            raise GraniteResponseError(f"Failed to generate test cases: {str(e)}")
+        finally:
+            self.scheduler.settle(ticket, used)
+    
+    def count_tokens(self, text, timeout=5):
+        """Token count of text for the configured model, from the tokenization endpoint.
         
+        A single attempt that bypasses the circuit breaker: callers treat a
+        failure as "unknown" rather than waiting on retries.
+        """
+        url = f"{self.base_url}/ml/v1/text/tokenization?version=2023-05-29"
         payload = {
-            "input": prompt,
-            "parameters": {
-                "decoding_method": "greedy",
-                "max_new_tokens": 3000,
-                "temperature": 0.1,
-                "stop_sequences": ["</code>", "---END---"]
-            },
+            "input": text,
             "model_id": self.model_id,
             "project_id": self.project_id
         }
         
+        token = self.get_access_token()
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result["results"][0]["generated_text"]
+            response = self.session.post(url, json=payload, headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }, timeout=(min(self.connect_timeout, timeout), timeout))
         except Exception as e:
-            raise Exception(f"Failed to generate test cases: {str(e)}")
+            raise translate_exception(e, "Token count") from e
+        raise_for_status(response, "Token count")
+        
+        try:
+            return response.json()["result"]["token_count"]
+        except Exception as e:
+            raise GraniteResponseError(f"Token count: {str(e)}")
+    
+    def check_upstream(self, timeout=5):
+        """Cheap readiness check: tokenize a short string with the configured model.
+        
+        This proves the IAM token is accepted and watsonx, the project and the
+        model are reachable without paying for a generation.
+        """
+        self.count_tokens("ping", timeout)
+        
+        return {
+            'model': self.model_id,
+            'token_expires_in': int(self.token_expires_at - time.time())
+        }
+    
+    def generate_test_cases_stream(self, prompt):
+        """Yield generated text chunks as watsonx streams them."""
+        url = f"{self.base_url}/ml/v1/text/generation_stream?version=2023-05-29"
+        
+        payload = self._generation_payload(prompt)
+        
+        # Streams keep their full reservation; the final counts arrive after
+        # the caller has consumed the text
+        ticket = self.scheduler.acquire(estimate_call_tokens(payload))
+        
+        # Retries only cover opening the stream; once text has been yielded
+        # a failure is reported to the caller instead of replayed.
+        try:
+            response = self._post_watsonx(url, payload, "Failed to generate test cases", stream=True, ticket=ticket)
+        except Exception:
+            # The stream never opened, so nothing was generated
+            self.scheduler.settle(ticket, 0)
+            raise
+        
+        with response:
+            for text in iter_stream_text(response):
+                yield text
+
+def iter_stream_text(response):
+    """Parse a watsonx generation_stream SSE response into text chunks."""
+    if response.encoding is None:
+        response.encoding = "utf-8"
+    last_result = None
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if not data or data == "[DONE]":
+                continue
+            
+            event = json.loads(data)
+            if event.get("errors"):
+                message = event["errors"][0].get("message", "Unknown error")
+                raise GraniteError(f"Failed to generate test cases: {message}")
+            
+            for result in event.get("results", []):
+                text = result.get("generated_text")
+                if text:
+                    yield text
+                last_result = result
+    finally:
+        # Stream events carry running totals, so the last one has the final counts
+        if last_result:
+            record_token_usage("generation_stream", last_result)
@@ -0,0 +1,75 @@
+"""Production server profile.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master and forked into the workers
+(preload_app), so they share its read-only memory and start instantly.
+post_fork gives each worker its own HTTP connection pool, event loop
+and background threads, which do not survive fork().
+
+Generation requests spend almost all of their time waiting on watsonx, so
+each worker runs many threads and only a few processes are needed for the
+CPU-bound parts (spec parsing, prompt building) and fault isolation. The
+in-flight request capacity is workers * threads; size it to the watsonx
+rate limit rather than to the CPU count.
+
+Workers share one IAM token through SHARED_STATE_BACKEND=file (set below
+unless already configured) and the on-disk tier of the generation cache
+in GENERATION_CACHE_FOLDER, so N workers cost one token refresh and one
+generation per distinct spec. SHARED_STATE_BACKEND=redis shares both
+across hosts through SHARED_STATE_REDIS_URL.
+
+An async job runs in the worker that accepted it, but its status and
+result are published to the same backend, so /jobs/<id> answers from
+any worker. JOB_QUEUE_LIMIT and JOB_WORKERS apply to each worker.
+
+LLM_RPM_LIMIT and LLM_TPM_LIMIT are the watsonx plan's limits; each worker
+schedules calls within an equal share of them.
+
+Workers pool their metrics in METRICS_MULTIPROC_DIR (metrics/ under
+SHARED_STATE_DIR unless set), so a scrape of /metrics, whichever worker
+answers it, reports the whole server. The directory is emptied when the
+server starts.
+"""
+import glob
+import multiprocessing
+import os
+
+# Read by GraniteClient when the app is imported after this file
+os.environ.setdefault('SHARED_STATE_BACKEND', 'file')
+os.environ.setdefault('METRICS_MULTIPROC_DIR',
+                      os.path.join(os.getenv('SHARED_STATE_DIR', 'shared_state'), 'metrics'))
+
+wsgi_app = 'app:app'
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+preload_app = True
+
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+os.environ.setdefault('LLM_SCHEDULER_WORKERS', str(workers))
+
+# Each thread can hold one watsonx connection; keep them all pooled
+os.environ.setdefault('GRANITE_POOL_MAXSIZE', str(threads))
+
+# Longer than the largest generation deadline (GRANITE_DEADLINE_MAX, 300s)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 330))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = '-'
+
+
+def on_starting(server):
+    # Totals from a previous run must not carry over
+    directory = os.environ['METRICS_MULTIPROC_DIR']
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
+    server.log.info("Worker %s ready with %s threads", worker.pid, threads)
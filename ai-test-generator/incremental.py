@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from generation_cache import canonical_json
+from sharding import merge_test_classes, schemas_for_endpoints, to_identifier
+
+
+def endpoint_key(endpoint):
+    return f"{endpoint['method']} {endpoint['path']}"
+
+
+def endpoint_fingerprint(endpoint, schemas, inputs=None):
+    """Hash everything about an endpoint that affects its generated tests.
+
+    inputs are the generation settings outside the spec (model, parameters,
+    prompt template and budget), so changing them regenerates every endpoint.
+    """
+    material = {
+        'inputs': inputs,
+        'method': endpoint['method'],
+        'path': endpoint['path'],
+        'parameters': endpoint.get('parameters', []),
+        'request_body': endpoint.get('request_body', {}),
+        'responses': endpoint.get('responses', {}),
+        'schemas': schemas_for_endpoints([endpoint], schemas)
+    }
+    return hashlib.sha256(canonical_json(material).encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """Keeps per-endpoint fingerprints and generated tests from the last run of each spec."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, spec_id):
+        return os.path.join(self.directory, f"{spec_id}.json")
+
+    def load(self, spec_id):
+        try:
+            with open(self._path(spec_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'endpoints': {}}
+
+    def save(self, spec_id, record):
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(record, f)
+                os.replace(tmp_path, self._path(spec_id))
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+
+class IncrementalGenerator:
+    """Regenerates tests only for endpoints that changed since the previous run.
+
+    Every endpoint is generated as its own shard, so its tests can be stored
+    next to its fingerprint and spliced back in unchanged on later runs.
+    generation_inputs() returns the settings folded into every fingerprint.
+    """
+
+    def __init__(self, sharded_generator, store, generation_inputs=None):
+        self.sharded_generator = sharded_generator
+        self.store = store
+        self.generation_inputs = generation_inputs
+
+    def generate(self, api_info, spec_id):
+        """Return (merged_source, summary) for api_info, reusing unchanged endpoints."""
+        schemas = api_info.get('schemas', {})
+        title_id = to_identifier(api_info['title'])
+        previous = self.store.load(spec_id)['endpoints']
+
+        inputs = self.generation_inputs() if self.generation_inputs else None
+        endpoints = sorted(api_info['endpoints'], key=endpoint_key)
+        fingerprints = {endpoint_key(e): endpoint_fingerprint(e, schemas, inputs) for e in endpoints}
+
+        shards = []
+        for endpoint in endpoints:
+            key = endpoint_key(endpoint)
+            cached = previous.get(key)
+            if cached and cached.get('fingerprint') == fingerprints[key]:
+                continue
+            shard_info = dict(api_info)
+            shard_info['endpoints'] = [endpoint]
+            shard_info['schemas'] = schemas_for_endpoints([endpoint], schemas)
+            shards.append((key, key, f"{title_id}{to_identifier(key)}ApiTest", shard_info))
+
+        generated = {key: source for key, _, source in self.sharded_generator.generate_shards(shards)}
+
+        record = {'updated_at': time.time(), 'endpoints': {}}
+        sources = []
+        for endpoint in endpoints:
+            key = endpoint_key(endpoint)
+            source = generated[key] if key in generated else previous[key]['source']
+            record['endpoints'][key] = {'fingerprint': fingerprints[key], 'source': source}
+            sources.append((key, source))
+
+        self.store.save(spec_id, record)
+
+        summary = {
+            'spec_id': spec_id,
+            'regenerated': [key for key, _, _, _ in shards],
+            'reused': len(endpoints) - len(shards),
+            'removed': sorted(set(previous) - set(fingerprints))
+        }
+        return merge_test_classes(f"{title_id}ApiTest", sources), summary
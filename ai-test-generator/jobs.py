@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, on_change=None):
+        self.id = str(uuid.uuid4())
+        self.on_change = on_change
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.details = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at = None
+
+    def update(self, stage, progress):
+        self.stage = stage
+        self.progress = progress
+        self.updated_at = time.time()
+        if self.on_change:
+            self.on_change(self)
+
+    @property
+    def done(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress, 2),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'finished_at': self.finished_at,
+            'error': self.error
+        }
+
+    def to_record(self):
+        return dict(self.to_dict(), result=self.result, details=self.details)
+
+    @classmethod
+    def from_record(cls, record):
+        """A read-only copy of a job published by another worker process."""
+        job = cls()
+        job.id = record['job_id']
+        for field in ('status', 'stage', 'progress', 'created_at', 'updated_at', 'finished_at', 'error',
+                      'result', 'details'):
+            setattr(job, field, record[field])
+        return job
+
+
+class JobManager:
+    """Runs generation jobs on a bounded thread pool.
+
+    At most max_workers jobs run at once and at most max_queue more wait for
+    a worker; submit() raises QueueFullError beyond that so the caller can
+    apply back-pressure. Finished jobs are kept for result_ttl seconds.
+
+    Jobs run in the process that accepted them. With a store (see
+    testgen_common.shared_state.create_record_store) every change is also
+    published there, so get() finds jobs of the other worker processes;
+    the queue limit and stats() stay per process.
+    """
+
+    def __init__(self, max_workers=4, max_queue=100, result_ttl=3600, store=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation-job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes the job result."""
+        with self._lock:
+            self._evict_expired()
+            if self._pending >= self.max_workers + self.max_queue:
+                raise QueueFullError('Job queue is full, retry later')
+            self._pending += 1
+            job = Job(self._publish)
+            self._jobs[job.id] = job
+        self._publish(job)
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            try:
+                record = self.store.get(job_id)
+            except Exception as e:
+                logger.warning("Could not read shared job %s: %s", job_id, e)
+                record = None
+            if record:
+                job = Job.from_record(record)
+        return job
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == 'running')
+            return {
+                'pending': self._pending,
+                'running': running,
+                'queued': self._pending - running,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'tracked_jobs': len(self._jobs)
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        job.update('running', 0.0)
+        result = error = details = None
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            error = str(e)
+            details = traceback.format_exc()
+        finally:
+            # finished_at is set before the final status, under the lock, so
+            # a job that reads as done always has one
+            with self._lock:
+                # The final state is published once, outside the lock
+                job.on_change = None
+                job.result = result
+                job.error = error
+                job.details = details
+                job.finished_at = time.time()
+                if error is None:
+                    job.update('done', 1.0)
+                    job.status = 'succeeded'
+                else:
+                    job.update('failed', job.progress)
+                    job.status = 'failed'
+                self._pending -= 1
+            self._publish(job)
+
+    def _publish(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.set(job.id, job.to_record())
+        except Exception as e:
+            # The job still runs and is visible to this process
+            logger.warning("Could not publish job %s: %s", job.id, e)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            if self.store is not None:
+                try:
+                    self.store.delete(job_id)
+                except Exception as e:
+                    logger.warning("Could not remove shared job %s: %s", job_id, e)
@@ -0,0 +1,127 @@
+from testgen_common.metrics import REGISTRY
+from testgen_common.token_budget import fit_to_budget
+
+# Bump whenever the prompt text changes so cached generations are not reused
+PROMPT_TEMPLATE_VERSION = '3'
+
+# Compaction steps, least lossy first. None of them drops an endpoint.
+COMPACTION_STEPS = ('dedupe_schemas', 'summarize_enums', 'drop_descriptions', 'compact_endpoints')
+
+# Enums longer than this are shown as their first values plus a count
+ENUM_SUMMARY_LIMIT = 8
+
+PROMPT_BUILD_SECONDS = REGISTRY.histogram('prompt_build_seconds', 'Time to build a test generation prompt')
+
+def describe_property(prop, summarize_enums=False):
+    kind = prop.get('type') or prop.get('$ref', 'unknown').rsplit('/', 1)[-1]
+    values = prop.get('enum')
+    if values:
+        values = [str(value) for value in values]
+        if summarize_enums and len(values) > ENUM_SUMMARY_LIMIT:
+            shown = ENUM_SUMMARY_LIMIT // 2
+            values = values[:shown] + [f"...{len(values) - shown} more"]
+        kind += f" enum[{'|'.join(values)}]"
+    return kind
+
+def describe_schemas(api_info, steps):
+    """One line per schema; with dedupe_schemas, unreferenced schemas are
+    dropped and schemas with identical properties share a line."""
+    schemas = api_info.get('schemas', {})
+    if 'dedupe_schemas' in steps:
+        referenced = set()
+        for endpoint in api_info['endpoints']:
+            referenced.update(endpoint.get('schema_refs', []))
+        schemas = {name: schema for name, schema in schemas.items() if name in referenced}
+    
+    summarize_enums = 'summarize_enums' in steps
+    rendered = []
+    for name, schema in schemas.items():
+        properties = schema.get('properties', {})
+        prop_list = ", ".join([f"{k}: {describe_property(v, summarize_enums)}" for k, v in properties.items()])
+        rendered.append((name, prop_list))
+    
+    if 'dedupe_schemas' in steps:
+        grouped = {}
+        for name, prop_list in rendered:
+            grouped.setdefault(prop_list, []).append(name)
+        rendered = [(", ".join(names), prop_list) for prop_list, names in grouped.items()]
+    
+    return "".join(f"- {name}: {prop_list}\n" for name, prop_list in rendered)
+
+def describe_endpoints(api_info, steps):
+    endpoints_summary = ""
+    for endpoint in api_info['endpoints']:
+        params = ", ".join([p.get('name', '') for p in endpoint.get('parameters', [])])
+        responses = ", ".join(endpoint.get('responses', {}).keys())
+        request_body = ", ".join(endpoint.get('request_schemas', []))
+        
+        if 'compact_endpoints' in steps:
+            endpoints_summary += (f"\n- {endpoint['method']} {endpoint['path']} ({params})"
+                                  f" body: {request_body or '-'} -> {responses or '-'}")
+            continue
+        
+        summary = "" if 'drop_descriptions' in steps else f"\n  Summary: {endpoint.get('summary', 'N/A')}"
+        endpoints_summary += f"""
+- {endpoint['method']} {endpoint['path']}{summary}
+  Parameters: {params if params else 'None'}
+  Request Body: {request_body if request_body else 'None'}
+  Responses: {responses if responses else 'N/A'}"""
+    return endpoints_summary
+
+def create_test_generation_prompt(api_info, class_name=None, steps=()):
+    """Render the prompt, applying the named COMPACTION_STEPS."""
+    if class_name is None:
+        class_name = f"{api_info['title'].replace(' ', '')}ApiTest"
+    
+    endpoints_summary = describe_endpoints(api_info, steps)
+    schemas_summary = describe_schemas(api_info, steps)
+    description = "" if 'drop_descriptions' in steps else f"\n- Description: {api_info['description']}"
+    
+    prompt = f"""You are an expert QA engineer specializing in API testing. Generate comprehensive JUnit 5 test cases for this REST API.
+
+API Information:
+- Title: {api_info['title']}
+- Version: {api_info['version']}{description}
+- Base URL: {api_info['base_url']}
+
+Endpoints:{endpoints_summary}
+
+Data Models:
+{schemas_summary if schemas_summary else 'No schemas defined'}
+
+Requirements:
+1. Generate complete JUnit 5 test classes with proper annotations
+2. Include positive test cases for valid inputs
+3. Include negative test cases for invalid data and error conditions
+4. Add boundary value testing for numeric fields
+5. Test edge cases (empty strings, null values, special characters)
+6. Generate realistic test data matching API schemas
+7. Use proper assertions for status codes, headers, and response body
+8. Use RestTemplate or TestRestTemplate for API calls
+9. Include setup and teardown methods
+10. Follow Spring Boot testing best practices
+
+Generate complete, runnable Java test classes:
+
+package com.example.api.test;
+
+import org.junit.jupiter.api.Test;
+import org.junit.jupiter.api.BeforeEach;
+import org.springframework.boot.test.context.SpringBootTest;
+import org.springframework.test.web.reactive.server.WebTestClient;
+import static org.junit.jupiter.api.Assertions.*;
+
+@SpringBootTest(webEnvironment = SpringBootTest.WebEnvironment.RANDOM_PORT)
+public class {class_name} {{
+
+text
+
+Generate the complete test implementation now:"""
+    
+    return prompt
+
+@PROMPT_BUILD_SECONDS.time()
+def build_prompt_within_budget(api_info, budget, counter, class_name=None):
+    """Compact the prompt until it fits budget tokens; returns (prompt, report)."""
+    return fit_to_budget(lambda steps: create_test_generation_prompt(api_info, class_name, steps),
+                         COMPACTION_STEPS, budget, counter)
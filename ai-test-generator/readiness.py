@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProbe:
+    """Runs a deep upstream check in the background and serves the cached result.
+
+    check() is called every interval seconds on a daemon thread; it returns a
+    dict of details or raises. Probes only ever read the last result, so a
+    slow or hanging upstream never delays them. A result older than
+    stale_after seconds counts as not ready, which covers a check that hangs.
+    """
+
+    def __init__(self, check, interval=30.0, stale_after=None, name='watsonx'):
+        self.check = check
+        self.interval = interval
+        self.stale_after = stale_after or interval * 3
+        self.name = name
+        self._result = None
+        self._consecutive_failures = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-readiness", daemon=True)
+            self._thread.start()
+
+    def after_fork(self):
+        """Drop the parent's checker thread in a forked worker; status() starts a new one"""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_check(self):
+        """Run the check once and cache its outcome."""
+        started = time.monotonic()
+        try:
+            details = self.check() or {}
+            error = None
+        except Exception as e:
+            details = {}
+            error = str(e)
+            logger.warning("Readiness check for %s failed: %s", self.name, e)
+
+        result = {
+            'ready': error is None,
+            'checked_at': time.time(),
+            'latency_ms': round((time.monotonic() - started) * 1000, 1),
+            **details
+        }
+        if error:
+            result['error'] = error
+        with self._lock:
+            self._consecutive_failures = 0 if error is None else self._consecutive_failures + 1
+            result['consecutive_failures'] = self._consecutive_failures
+            self._result = result
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_check()
+            self._stop.wait(self.interval)
+
+    def status(self):
+        """The cached result; starts the background checker on first use."""
+        self.start()
+        with self._lock:
+            result = dict(self._result) if self._result else None
+
+        if result is None:
+            return {'ready': False, 'error': 'Readiness check has not completed yet'}
+
+        result['age_seconds'] = round(time.time() - result['checked_at'], 1)
+        if result['ready'] and result['age_seconds'] > self.stale_after:
+            result['ready'] = False
+            result['error'] = f"Last successful check is older than {self.stale_after:.0f}s"
+        return result
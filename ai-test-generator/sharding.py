@@ -0,0 +1,269 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from testgen_common.resilience import GraniteError
+
+IMPORT_PATTERN = re.compile(r'^\s*import\s+(static\s+)?[\w.]+(\.\*)?\s*;\s*$', re.MULTILINE)
+PACKAGE_PATTERN = re.compile(r'^\s*package\s+[\w.]+\s*;\s*$', re.MULTILINE)
+CLASS_PATTERN = re.compile(r'\bclass\s+\w+[^{]*\{')
+
+DEFAULT_PACKAGE = 'com.example.api.test'
+BASE_IMPORTS = [
+    'import org.junit.jupiter.api.Nested;',
+    'import org.springframework.boot.test.context.SpringBootTest;',
+]
+
+
+def to_identifier(text):
+    words = re.split(r'[^0-9A-Za-z]+', text)
+    identifier = ''.join(word[:1].upper() + word[1:] for word in words if word)
+    if not identifier or identifier[0].isdigit():
+        identifier = f"Group{identifier}"
+    return identifier
+
+
+def path_prefix(path, depth=1):
+    segments = [s for s in path.split('/') if s and not s.startswith('{')]
+    return '/'.join(segments[:depth]) or 'root'
+
+
+def collect_schema_refs(node, refs=None):
+    """Collect names of component schemas referenced anywhere inside node."""
+    if refs is None:
+        refs = set()
+    if isinstance(node, dict):
+        ref = node.get('$ref')
+        if isinstance(ref, str) and ref.startswith('#/components/schemas/'):
+            refs.add(ref.rsplit('/', 1)[1])
+        for value in node.values():
+            collect_schema_refs(value, refs)
+    elif isinstance(node, list):
+        for value in node:
+            collect_schema_refs(value, refs)
+    return refs
+
+
+def schemas_for_endpoints(endpoints, schemas):
+    """Return the component schemas the endpoints reach, following nested refs.
+
+    Uses the schema_refs closure SpecParser precomputes for each endpoint and
+    only walks the endpoint itself when that is missing.
+    """
+    if all('schema_refs' in endpoint for endpoint in endpoints):
+        names = set()
+        for endpoint in endpoints:
+            names.update(endpoint['schema_refs'])
+        return {name: schemas[name] for name in sorted(names) if name in schemas}
+
+    pending = set()
+    for endpoint in endpoints:
+        collect_schema_refs([endpoint.get('parameters'), endpoint.get('request_body'),
+                             endpoint.get('responses')], pending)
+
+    needed = {}
+    while pending:
+        name = pending.pop()
+        if name in needed or name not in schemas:
+            continue
+        needed[name] = schemas[name]
+        pending |= collect_schema_refs(schemas[name]) - needed.keys()
+
+    return {name: needed[name] for name in sorted(needed)}
+
+
+def group_endpoints(endpoints, shard_by='tag', max_endpoints=10, prefix_depth=1):
+    """Split endpoints into named groups by tag or path prefix.
+
+    Endpoints without tags fall back to their path prefix. Groups larger than
+    max_endpoints are split into numbered chunks so they can run in parallel.
+    Returns [(group, shard_name, endpoints)] sorted by group so output order
+    is deterministic.
+    """
+    groups = {}
+    for endpoint in endpoints:
+        tags = endpoint.get('tags') or []
+        if shard_by == 'tag' and tags:
+            key = tags[0]
+        else:
+            key = path_prefix(endpoint['path'], prefix_depth)
+        groups.setdefault(key, []).append(endpoint)
+
+    shards = []
+    for key in sorted(groups):
+        members = groups[key]
+        if not max_endpoints or len(members) <= max_endpoints:
+            shards.append((key, key, members))
+            continue
+        for index in range(0, len(members), max_endpoints):
+            part = index // max_endpoints + 1
+            name = key if part == 1 else f"{key} {part}"
+            shards.append((key, name, members[index:index + max_endpoints]))
+    return shards
+
+
+def find_class_body(java_source):
+    """Return (start, end) offsets of the first class body, excluding braces."""
+    match = CLASS_PATTERN.search(java_source)
+    if not match:
+        return None
+
+    depth = 1
+    index = match.end()
+    in_string = None
+    while index < len(java_source):
+        char = java_source[index]
+        if in_string:
+            if char == '\\':
+                index += 1
+            elif char == in_string:
+                in_string = None
+        elif char in ('"', "'"):
+            in_string = char
+        elif java_source.startswith('//', index):
+            newline = java_source.find('\n', index)
+            index = len(java_source) if newline == -1 else newline
+        elif java_source.startswith('/*', index):
+            close = java_source.find('*/', index + 2)
+            index = len(java_source) if close == -1 else close + 1
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return match.end(), index
+        index += 1
+
+    # Generation was cut off before the class was closed
+    return match.end(), len(java_source)
+
+
+def split_java_source(java_source):
+    """Split generated Java into (imports, class body)."""
+    imports = [match.group(0).strip() for match in IMPORT_PATTERN.finditer(java_source)]
+
+    bounds = find_class_body(java_source)
+    if bounds:
+        body = java_source[bounds[0]:bounds[1]]
+    else:
+        body = PACKAGE_PATTERN.sub('', IMPORT_PATTERN.sub('', java_source))
+    return imports, body.strip('\n')
+
+
+def indent(text, prefix='    '):
+    return '\n'.join(prefix + line if line.strip() else '' for line in text.splitlines())
+
+
+def merge_test_classes(class_name, shard_sources, package=DEFAULT_PACKAGE):
+    """Merge generated shard classes into one class with a @Nested class per shard.
+
+    shard_sources is a list of (shard_name, java_source) in the order the
+    nested classes should appear.
+    """
+    imports = set(BASE_IMPORTS)
+    nested = []
+    used_names = set()
+    for shard_name, source in shard_sources:
+        shard_imports, body = split_java_source(source)
+        imports.update(shard_imports)
+
+        nested_name = f"{to_identifier(shard_name)}Tests"
+        suffix = 2
+        while nested_name in used_names:
+            nested_name = f"{to_identifier(shard_name)}{suffix}Tests"
+            suffix += 1
+        used_names.add(nested_name)
+
+        nested.append(
+            f"    @Nested\n"
+            f"    class {nested_name} {{\n"
+            f"{indent(body.strip(), '        ')}\n"
+            f"    }}"
+        )
+
+    return (
+        f"package {package};\n\n"
+        + '\n'.join(sorted(imports)) + "\n\n"
+        + "@SpringBootTest(webEnvironment = SpringBootTest.WebEnvironment.RANDOM_PORT)\n"
+        + f"public class {class_name} {{\n\n"
+        + '\n\n'.join(nested)
+        + "\n}\n"
+    )
+
+
+class ShardedGenerator:
+    """Generates tests for groups of endpoints concurrently and merges them.
+
+    Each shard gets a prompt with only its endpoints and the schemas they
+    reference, so wall-clock time is bounded by the slowest shard times
+    ceil(shards / max_concurrency) rather than by the endpoint count.
+
+    generate(shard_api_info, class_name) must return the generated Java
+    source for one shard.
+    """
+
+    def __init__(self, generate, max_concurrency=4, max_endpoints=10):
+        self.generate = generate
+        self.max_concurrency = max_concurrency
+        self.max_endpoints = max_endpoints
+
+    def build_shards(self, api_info, shard_by='tag'):
+        """Return [(group, shard_name, class_name, shard_api_info)]."""
+        title_id = to_identifier(api_info['title'])
+        shards = []
+        for group, name, endpoints in group_endpoints(api_info['endpoints'], shard_by, self.max_endpoints):
+            shard_info = dict(api_info)
+            shard_info['endpoints'] = endpoints
+            shard_info['schemas'] = schemas_for_endpoints(endpoints, api_info.get('schemas', {}))
+            class_name = f"{title_id}{to_identifier(name)}ApiTest"
+            shards.append((group, name, class_name, shard_info))
+        return shards
+
+    def generate_shards(self, shards):
+        """Generate every shard and return [(group, name, source)] in shard order."""
+        def run(shard):
+            _, name, class_name, shard_info = shard
+            try:
+                return self.generate(shard_info, class_name)
+            except GraniteError as e:
+                # Same type, status and Retry-After, so callers still map it
+                # to 429/503/504 instead of a generic 500
+                raise type(e)(f"Shard '{name}' failed: {e}", e.status_code, e.retry_after) from e
+            except Exception as e:
+                raise Exception(f"Shard '{name}' failed: {str(e)}")
+
+        # Shards run with the caller's context (its trace and LLM scheduling
+        # tenant); a context can only be entered by one thread at a time
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as pool:
+            sources = list(pool.map(lambda shard: context.copy().run(run, shard), shards))
+
+        return [(group, name, source)
+                for (group, name, _, _), source in zip(shards, sources)]
+
+    def generate_merged(self, api_info, shard_by='tag'):
+        results = self.generate_shards(self.build_shards(api_info, shard_by))
+        class_name = f"{to_identifier(api_info['title'])}ApiTest"
+        return merge_test_classes(class_name, [(name, source) for _, name, source in results])
+
+    def generate_per_group(self, api_info, shard_by='tag'):
+        """Return [(class_name, source)], one test class per group.
+
+        A group that was split into several chunks is merged back into a
+        single class with one @Nested class per chunk.
+        """
+        results = self.generate_shards(self.build_shards(api_info, shard_by))
+        title_id = to_identifier(api_info['title'])
+
+        by_group = {}
+        for group, name, source in results:
+            by_group.setdefault(group, []).append((name, source))
+
+        classes = []
+        for group, chunks in by_group.items():
+            class_name = f"{title_id}{to_identifier(group)}ApiTest"
+            if len(chunks) == 1:
+                classes.append((class_name, chunks[0][1]))
+            else:
+                classes.append((class_name, merge_test_classes(class_name, chunks)))
+        return classes
@@ -1,20 +1,622 @@
+import codecs
+import re
+import threading
 import yaml
 import json
-from typing import Dict, List, Any
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from testgen_common.metrics import REGISTRY
+
+# Prefer the libyaml-backed loader and orjson when they are installed; both
+# are several times faster on large specs and fall back transparently.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    import orjson
+    JSON_BACKEND = 'orjson'
+    
+    def json_loads(data: Any) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # json accepts a few things orjson rejects, such as NaN and Infinity
+            return json.loads(data)
+    
+    def json_dumps(value: Any) -> bytes:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    json_loads = json.loads
+    JSON_BACKEND = 'json'
+    
+    def json_dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+
+YAML_LOADER = YamlLoader.__name__
+
+SCHEMA_REF_PREFIX = '#/components/schemas/'
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+SPEC_PARSE_SECONDS = REGISTRY.histogram('spec_parse_seconds', 'Time to load a spec and extract its API info',
+                                        ('source',))
+
+class SchemaResolver:
+    """Resolves local $refs for one spec.
+    
+    The component schema dependency graph is built once up front. Transitive
+    closures and fully resolved schemas are memoized, so shared schemas are
+    walked once no matter how many endpoints reach them. Circular references
+    are cut with an {'$ref': ..., 'x-circular': True} marker instead of
+    recursing forever.
+    """
+    
+    def __init__(self, spec: Dict):
+        self.spec = spec
+        self.schemas = (spec.get('components') or {}).get('schemas') or {}
+        self.graph = {name: self.direct_refs(schema) for name, schema in self.schemas.items()}
+        self._closures: Dict[str, Set[str]] = {}
+        self._resolved: Dict[str, Any] = {}
+    
+    @staticmethod
+    def direct_refs(node: Any) -> Set[str]:
+        """Names of component schemas referenced directly inside node."""
+        refs = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, dict):
+                ref = current.get('$ref')
+                if isinstance(ref, str) and ref.startswith(SCHEMA_REF_PREFIX):
+                    refs.add(ref[len(SCHEMA_REF_PREFIX):])
+                stack.extend(current.values())
+            elif isinstance(current, list):
+                stack.extend(current)
+        return refs
+    
+    def lookup(self, ref: str) -> Optional[Any]:
+        """Follow a local JSON pointer such as '#/components/parameters/limit'."""
+        if not ref.startswith('#/'):
+            return None
+        node = self.spec
+        for part in ref[2:].split('/'):
+            part = part.replace('~1', '/').replace('~0', '~')
+            if isinstance(node, dict) and part in node:
+                node = node[part]
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            else:
+                return None
+        return node
+    
+    def dereference(self, node: Any) -> Any:
+        """Replace a {'$ref': ...} object by its target, following ref chains."""
+        seen = set()
+        while isinstance(node, dict) and isinstance(node.get('$ref'), str):
+            ref = node['$ref']
+            target = self.lookup(ref)
+            if target is None or ref in seen:
+                return node
+            seen.add(ref)
+            node = target
+        return node
+    
+    def closure(self, name: str) -> Set[str]:
+        """All component schemas reachable from schema name, including itself."""
+        if name in self._closures:
+            return self._closures[name]
+        
+        reached = set()
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            if current in reached or current not in self.schemas:
+                continue
+            if current in self._closures:
+                reached |= self._closures[current]
+                continue
+            reached.add(current)
+            stack.extend(self.graph.get(current, ()))
+        
+        self._closures[name] = reached
+        return reached
+    
+    def referenced_schemas(self, node: Any) -> Set[str]:
+        """Names of component schemas referenced from node.
+        
+        Refs to other components (responses, requestBodies, parameters) are
+        followed to the schemas they contain.
+        """
+        names = set()
+        followed = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, dict):
+                ref = current.get('$ref')
+                if isinstance(ref, str):
+                    if ref.startswith(SCHEMA_REF_PREFIX):
+                        names.add(ref[len(SCHEMA_REF_PREFIX):])
+                    elif ref not in followed:
+                        followed.add(ref)
+                        stack.append(self.lookup(ref))
+                stack.extend(current.values())
+            elif isinstance(current, list):
+                stack.extend(current)
+        return names
+    
+    def closure_for(self, node: Any) -> Set[str]:
+        """All component schemas reachable from node, through referenced_schemas."""
+        reached = set()
+        for name in self.referenced_schemas(node):
+            reached |= self.closure(name)
+        return reached
+    
+    def resolve(self, name: str) -> Any:
+        """Return schema name with every nested schema $ref inlined.
+        
+        Dependencies are resolved bottom-up with an explicit stack, so long
+        ref chains never recurse deeply and each schema is inlined once.
+        Resolved schemas share structure and must be treated as read-only.
+        """
+        if name in self._resolved:
+            return self._resolved[name]
+        
+        active = {name}
+        stack = [(name, iter(sorted(self.graph.get(name, ()))))]
+        while stack:
+            current, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency in self.schemas and dependency not in self._resolved and dependency not in active:
+                    active.add(dependency)
+                    stack.append((dependency, iter(sorted(self.graph.get(dependency, ())))))
+                    break
+            else:
+                stack.pop()
+                self._resolved[current] = self._inline(self.schemas.get(current, {}), active)
+                active.discard(current)
+        
+        return self._resolved[name]
+    
+    def _inline(self, node: Any, active: Set[str]) -> Any:
+        if isinstance(node, list):
+            return [self._inline(item, active) for item in node]
+        if not isinstance(node, dict):
+            return node
+        
+        ref = node.get('$ref')
+        if isinstance(ref, str) and ref.startswith(SCHEMA_REF_PREFIX):
+            name = ref[len(SCHEMA_REF_PREFIX):]
+            if name in active:
+                return {'$ref': ref, 'x-circular': True}
+            if name in self._resolved:
+                return self._resolved[name]
+            if name not in self.schemas:
+                return node
+            return self.resolve(name)
+        
+        return {key: self._inline(value, active) for key, value in node.items()}
+
+class LazySchemas(Mapping):
+    """Component schemas kept as compact JSON and decoded when looked up.
+    
+    Only the encoded bytes and the ref graph stay resident; a small LRU of
+    decoded schemas serves repeated lookups. Values come back as JSON types,
+    so non-string keys and dates in YAML examples turn into strings.
+    """
+    
+    def __init__(self, max_cached: int = 128):
+        self.max_cached = max_cached
+        self.graph: Dict[str, Set[str]] = {}
+        self._encoded: Dict[str, bytes] = {}
+        self._cache: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, name: str, schema: Any):
+        self._encoded[name] = json_dumps(schema)
+        self.graph[name] = SchemaResolver.direct_refs(schema)
+    
+    def __getitem__(self, name: str) -> Any:
+        with self._lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                return self._cache[name]
+        schema = json_loads(self._encoded[name])
+        with self._lock:
+            self._cache[name] = schema
+            if len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return schema
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._encoded)
+    
+    def __len__(self) -> int:
+        return len(self._encoded)
+    
+    def __getstate__(self):
+        # Travels between processes as the encoded schemas only
+        return {'max_cached': self.max_cached, 'graph': self.graph, '_encoded': self._encoded}
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def encoded_bytes(self) -> int:
+        return sum(len(encoded) for encoded in self._encoded.values())
+    
+    def closure(self, names: Iterable[str]) -> Set[str]:
+        """All component schemas reachable from names, including themselves."""
+        reached = set()
+        stack = list(names)
+        while stack:
+            current = stack.pop()
+            if current in reached or current not in self.graph:
+                continue
+            reached.add(current)
+            stack.extend(self.graph[current])
+        return reached
+
+class EndpointRecord:
+    """One operation reduced to what the prompt and sharding stages read.
+    
+    parameters holds (name, in, required) tuples and responses the status
+    codes; the parameter, body and response subtrees are not kept.
+    """
+    __slots__ = ('path', 'method', 'summary', 'tags', 'parameters', 'responses', 'request_schemas', 'schema_refs')
+    
+    def __init__(self, path: str, method: str, summary: str, tags: Tuple[str, ...],
+                 parameters: Tuple[Tuple[str, str, bool], ...], responses: Tuple[str, ...],
+                 request_schemas: Tuple[str, ...], schema_refs: Tuple[str, ...]):
+        self.path = path
+        self.method = method
+        self.summary = summary
+        self.tags = tags
+        self.parameters = parameters
+        self.responses = responses
+        self.request_schemas = request_schemas
+        self.schema_refs = schema_refs
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Endpoint in the shape of _extract_api_info's, with the compact fields only."""
+        return {
+            'path': self.path,
+            'method': self.method,
+            'summary': self.summary,
+            'parameters': [{'name': name, 'in': location, 'required': required}
+                           for name, location, required in self.parameters],
+            'responses': {code: {} for code in self.responses},
+            'tags': list(self.tags),
+            'request_schemas': list(self.request_schemas),
+            'schema_refs': list(self.schema_refs)
+        }
+    
+    def __repr__(self):
+        return f"EndpointRecord({self.method} {self.path})"
+
+class _JsonReader:
+    """Reads a JSON document from a binary stream one value at a time.
+    
+    items() yields the keys of an object as it reaches them; the caller must
+    consume each key's value with value(), skip() or a nested items() before
+    asking for the next key. Only the value being decoded is buffered.
+    """
+    chunk_size = 256 * 1024
+    
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+    
+    def close(self):
+        pass
+    
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        # Read at least as much as is buffered so a large value decodes in O(n)
+        data = self.stream.read(max(self.chunk_size, len(self.buffer)))
+        if not data:
+            self.eof = True
+            self.buffer += self.text_decoder.decode(b'', final=True)
+            return False
+        self.buffer += self.text_decoder.decode(data)
+        return True
+    
+    def _peek(self) -> str:
+        """Next non-whitespace character, or '' at the end of the stream."""
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+    
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'end of document'}'")
+        self.pos += 1
+    
+    def value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value ending with the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+    
+    def skip(self):
+        # Objects go member by member so skipping paths never decodes it whole
+        if self._peek() == '{':
+            for _ in self.items():
+                self.value()
+        else:
+            self.value()
+    
+    def items(self) -> Iterator[str]:
+        if self._peek() == 'n':
+            self.value()
+            return
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Object keys must be strings")
+            self._expect(':')
+            yield key
+            separator = self._peek()
+            self.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' but found '{separator or 'end of document'}'")
+
+class _YamlReader:
+    """Reads a YAML document from a stream one node at a time.
+    
+    Same protocol as _JsonReader, driven by parser events: only the node
+    being read is composed. Anchored nodes are kept for later aliases, also
+    when they sit in a part that is skipped.
+    """
+    
+    def __init__(self, stream: BinaryIO):
+        self.loader = YamlLoader(stream)
+        self.anchors: Dict[str, yaml.Node] = {}
+        self.loader.get_event()
+        if not self.loader.check_event(yaml.DocumentStartEvent):
+            raise ValueError("Empty document")
+        self.loader.get_event()
+    
+    def close(self):
+        self.loader.dispose()
+    
+    def value(self) -> Any:
+        return self.loader.construct_document(self._compose())
+    
+    def skip(self):
+        depth = 0
+        while True:
+            event = self.loader.peek_event()
+            if getattr(event, 'anchor', None) and not isinstance(event, yaml.AliasEvent):
+                self._compose()
+            else:
+                self.loader.get_event()
+                if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                    depth += 1
+                elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                    depth -= 1
+            if depth == 0:
+                return
+    
+    def items(self) -> Iterator[str]:
+        if not self.loader.check_event(yaml.MappingStartEvent):
+            if self.value() is None:
+                return
+            raise ValueError("Expected a mapping")
+        self.loader.get_event()
+        while not self.loader.check_event(yaml.MappingEndEvent):
+            key = self._compose()
+            if not isinstance(key, yaml.ScalarNode):
+                raise ValueError("Mapping keys must be scalars")
+            yield key.value
+        self.loader.get_event()
+    
+    def _compose(self) -> yaml.Node:
+        event = self.loader.get_event()
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self.anchors:
+                raise ValueError(f"Found undefined alias '{event.anchor}'")
+            return self.anchors[event.anchor]
+        
+        tag = event.tag
+        if isinstance(event, yaml.ScalarEvent):
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+            node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, yaml.SequenceStartEvent):
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(yaml.SequenceNode, None, event.implicit)
+            node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(yaml.SequenceEndEvent):
+                node.value.append(self._compose())
+            node.end_mark = self.loader.get_event().end_mark
+        elif isinstance(event, yaml.MappingStartEvent):
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(yaml.MappingNode, None, event.implicit)
+            node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(yaml.MappingEndEvent):
+                key = self._compose()
+                node.value.append((key, self._compose()))
+            node.end_mark = self.loader.get_event().end_mark
+        else:
+            raise ValueError(f"Unexpected {type(event).__name__} at {event.start_mark}")
+        
+        if event.anchor:
+            self.anchors[event.anchor] = node
+        return node
+
+class StreamedSpec:
+    """A spec read from a seekable binary stream with bounded memory.
+    
+    Opening it makes one pass that keeps info, servers and the non-schema
+    components, stores component schemas in a LazySchemas and skips paths.
+    endpoints() then walks paths again, one path item at a time, so memory
+    holds the components plus a single path item however large the spec is.
+    Non-seekable uploads should be spooled first (SpecUpload.spool).
+    """
+    
+    def __init__(self, stream: BinaryIO, file_type: str):
+        if not stream.seekable():
+            raise ValueError("Streaming a spec needs a seekable stream")
+        self.stream = stream
+        self.file_type = file_type.lower()
+        self.start = stream.tell()
+        self.schemas = LazySchemas()
+        self.components: Dict[str, Any] = {}
+        self.top: Dict[str, Any] = {}
+        
+        reader = self._reader()
+        try:
+            for key in reader.items():
+                if key == 'components':
+                    self._read_components(reader)
+                elif key in ('info', 'servers'):
+                    self.top[key] = reader.value()
+                else:
+                    reader.skip()
+        finally:
+            reader.close()
+        
+        # Schemas live in self.schemas; the resolver only follows refs to
+        # parameters, requestBodies and responses
+        self.resolver = SchemaResolver({'components': self.components})
+        info = self.top.get('info') or {}
+        servers = self.top.get('servers') or [{}]
+        self.info = {
+            'title': info.get('title', 'API'),
+            'version': info.get('version', '1.0'),
+            'description': info.get('description', ''),
+            'base_url': servers[0].get('url', '')
+        }
+    
+    def _reader(self):
+        self.stream.seek(self.start)
+        if self.file_type in ['yaml', 'yml']:
+            return _YamlReader(self.stream)
+        return _JsonReader(self.stream)
+    
+    def _read_components(self, reader):
+        for section in reader.items():
+            if section == 'schemas':
+                for name in reader.items():
+                    self.schemas.add(name, reader.value())
+            else:
+                self.components[section] = reader.value()
+    
+    def endpoints(self) -> Iterator[EndpointRecord]:
+        reader = self._reader()
+        try:
+            for key in reader.items():
+                if key != 'paths':
+                    reader.skip()
+                    continue
+                for path in reader.items():
+                    yield from self._records(path, reader.value())
+        finally:
+            reader.close()
+    
+    def _records(self, path: str, methods: Any) -> Iterator[EndpointRecord]:
+        if not isinstance(methods, dict):
+            return
+        resolver = self.resolver
+        for method, details in methods.items():
+            if str(method).lower() not in ['get', 'post', 'put', 'delete', 'patch']:
+                continue
+            parameters = [resolver.dereference(p) for p in details.get('parameters', [])]
+            request_body = resolver.dereference(details.get('requestBody', {}))
+            responses = details.get('responses', {})
+            referenced = resolver.referenced_schemas([parameters, request_body, responses])
+            yield EndpointRecord(
+                path=path,
+                method=method.upper(),
+                summary=details.get('summary', ''),
+                tags=tuple(details.get('tags', [])),
+                parameters=tuple((p.get('name', ''), p.get('in', ''), bool(p.get('required', False)))
+                                 for p in parameters if isinstance(p, dict)),
+                responses=tuple(str(code) for code in responses),
+                request_schemas=tuple(sorted(resolver.direct_refs(request_body))),
+                schema_refs=tuple(sorted(self.schemas.closure(referenced)))
+            )
+    
+    def api_info(self) -> Dict[str, Any]:
+        """API info like parse_openapi_stream's, with compact endpoints and lazy schemas."""
+        return dict(self.info, endpoints=[record.to_dict() for record in self.endpoints()], schemas=self.schemas)
 
 class SpecParser:
     @staticmethod
+    @SPEC_PARSE_SECONDS.time(source='text')
     def parse_openapi_spec(file_content: str, file_type: str) -> Dict[str, Any]:
         try:
             if file_type.lower() in ['yaml', 'yml']:
-                spec = yaml.safe_load(file_content)
+                spec = yaml.load(file_content, Loader=YamlLoader)
             else:
-                spec = json.loads(file_content)
+                spec = json_loads(file_content)
             
             return SpecParser._extract_api_info(spec)
         except Exception as e:
             raise ValueError(f"Failed to parse specification: {str(e)}")
     
+    @staticmethod
+    @SPEC_PARSE_SECONDS.time(source='stream')
+    def parse_openapi_stream(stream: BinaryIO, file_type: str) -> Dict[str, Any]:
+        """Parse a spec from a binary file-like object without decoding it to a str first."""
+        try:
+            if file_type.lower() in ['yaml', 'yml']:
+                spec = yaml.load(stream, Loader=YamlLoader)
+            elif JSON_BACKEND == 'orjson':
+                spec = json_loads(stream.read())
+            else:
+                spec = json.load(stream)
+            
+            return SpecParser._extract_api_info(spec)
+        except Exception as e:
+            raise ValueError(f"Failed to parse specification: {str(e)}")
+    
+    @staticmethod
+    @SPEC_PARSE_SECONDS.time(source='outline')
+    def stream_spec(stream: BinaryIO, file_type: str) -> StreamedSpec:
+        """Open a spec for lazy reading: info and schemas now, endpoints on iteration."""
+        try:
+            return StreamedSpec(stream, file_type)
+        except Exception as e:
+            raise ValueError(f"Failed to parse specification: {str(e)}")
+    
+    @staticmethod
+    def iter_endpoints(stream: BinaryIO, file_type: str) -> Iterator[EndpointRecord]:
+        """Yield an EndpointRecord per operation, reading one path item at a time."""
+        return SpecParser.stream_spec(stream, file_type).endpoints()
+    
     @staticmethod
     def _extract_api_info(spec: Dict) -> Dict[str, Any]:
         info = {
@@ -28,19 +630,25 @@ class SpecParser:
         paths = spec.get('paths', {})
         components = spec.get('components', {})
         schemas = components.get('schemas', {})
+        resolver = SchemaResolver(spec)
         
         for path, methods in paths.items():
             for method, details in methods.items():
                 if method.lower() in ['get', 'post', 'put', 'delete', 'patch']:
+                    parameters = [resolver.dereference(p) for p in details.get('parameters', [])]
+                    request_body = resolver.dereference(details.get('requestBody', {}))
+                    responses = details.get('responses', {})
                     endpoint_info = {
                         'path': path,
                         'method': method.upper(),
                         'summary': details.get('summary', ''),
                         'description': details.get('description', ''),
-                        'parameters': details.get('parameters', []),
-                        'request_body': details.get('requestBody', {}),
-                        'responses': details.get('responses', {}),
-                        'tags': details.get('tags', [])
+                        'parameters': parameters,
+                        'request_body': request_body,
+                        'responses': responses,
+                        'tags': details.get('tags', []),
+                        'request_schemas': sorted(resolver.direct_refs(request_body)),
+                        'schema_refs': sorted(resolver.closure_for([parameters, request_body, responses]))
                     }
                     info['endpoints'].append(endpoint_info)
         
@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+
+from spec_parser import SpecParser
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class SpecUpload:
+    """An uploaded spec that is parsed straight from its byte stream.
+
+    Request handlers wrap the upload's own stream, so nothing is written to
+    disk or decoded into an intermediate string. Work that outlives the
+    request calls spool() to take a private copy, held in memory up to
+    spool_threshold bytes and in an anonymous temp file beyond that.
+    """
+
+    def __init__(self, stream, filename, owns_stream=False):
+        self.stream = stream
+        self.filename = filename
+        self.owns_stream = owns_stream
+
+    @property
+    def file_type(self):
+        return self.filename.rsplit('.', 1)[1].lower()
+
+    @property
+    def size(self):
+        """Length of the upload in bytes, or None for a non-seekable stream."""
+        if not self.stream.seekable():
+            return None
+        position = self.stream.tell()
+        size = self.stream.seek(0, 2)
+        self.stream.seek(position)
+        return size
+
+    def parse(self):
+        if self.stream.seekable():
+            self.stream.seek(0)
+        return SpecParser.parse_openapi_stream(self.stream, self.file_type)
+
+    def parse_compact(self):
+        """API info with compact endpoints and lazy schemas (SpecParser.stream_spec).
+
+        Memory holds the schemas plus one path item at a time instead of
+        the whole document. Needs a seekable stream; others are parsed whole.
+        """
+        if not self.stream.seekable():
+            return self.parse()
+        self.stream.seek(0)
+        return SpecParser.stream_spec(self.stream, self.file_type).api_info()
+
+    def spool(self, spool_threshold, directory=None):
+        """Return a SpecUpload that owns a copy of this upload's bytes."""
+        buffer = tempfile.SpooledTemporaryFile(max_size=spool_threshold, dir=directory)
+        try:
+            if self.stream.seekable():
+                self.stream.seek(0)
+            shutil.copyfileobj(self.stream, buffer, COPY_CHUNK_SIZE)
+            buffer.seek(0)
+        except Exception:
+            buffer.close()
+            raise
+        return SpecUpload(buffer, self.filename, owns_stream=True)
+
+    def close(self):
+        if self.owns_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
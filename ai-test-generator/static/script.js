@@ -8,7 +8,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const apiInfo = document.getElementById('apiInfo');
     const downloadBtn = document.getElementById('downloadBtn');
     
-    let currentFilename = '';
+    let currentDownloadUrl = '';
     
     uploadForm.addEventListener('submit', async function(e) {
         e.preventDefault();
@@ -30,18 +30,34 @@ document.addEventListener('DOMContentLoaded', function() {
         formData.append('file', file);
         
         try {
-            const response = await fetch('/generate', {
+            const response = await fetch('/generate/stream', {
                 method: 'POST',
                 body: formData
             });
             
-            const data = await response.json();
-            
-            if (response.ok && data.success) {
-                showResults(data);
-            } else {
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.ok || !contentType.startsWith('text/event-stream')) {
+                const data = await response.json();
                 showError(data.error || 'Failed to generate test cases');
+                return;
             }
+            
+            await readEventStream(response, {
+                meta: function(data) {
+                    showStreamingResults(data);
+                },
+                chunk: function(data) {
+                    testOutput.textContent += data.text;
+                },
+                done: function(data) {
+                    currentDownloadUrl = data.download_url;
+                    renderApiInfo(data);
+                    downloadBtn.disabled = false;
+                },
+                error: function(data) {
+                    showError(data.error || 'Failed to generate test cases');
+                }
+            });
         } catch (error) {
             showError('Network error: ' + error.message);
         } finally {
@@ -51,21 +67,62 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     downloadBtn.addEventListener('click', function() {
-        if (currentFilename) {
-            window.location.href = `/download/${currentFilename}`;
+        if (currentDownloadUrl) {
+            window.location.href = currentDownloadUrl;
         }
     });
     
-    function showResults(data) {
-        currentFilename = data.filename;
+    async function readEventStream(response, handlers) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                dispatchEvent(buffer.slice(0, boundary), handlers);
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+    }
+    
+    function dispatchEvent(rawEvent, handlers) {
+        let event = 'message';
+        let data = '';
+        
+        rawEvent.split('\n').forEach(function(line) {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
         
+        if (handlers[event] && data) {
+            handlers[event](JSON.parse(data));
+        }
+    }
+    
+    function renderApiInfo(data) {
         apiInfo.innerHTML = `
             <strong>API:</strong> ${data.api_title}<br>
             <strong>Endpoints:</strong> ${data.endpoints_count}<br>
-            <strong>Generated File:</strong> ${data.filename}
+            <strong>Generated File:</strong> ${data.filename || 'generating...'}
         `;
-        
-        testOutput.textContent = data.test_cases;
+    }
+    
+    function showStreamingResults(data) {
+        currentDownloadUrl = '';
+        renderApiInfo(data);
+        testOutput.textContent = '';
+        downloadBtn.disabled = true;
         resultsSection.classList.remove('d-none');
     }
     
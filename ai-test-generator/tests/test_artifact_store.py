@@ -0,0 +1,76 @@
+import os
+import time
+
+from artifact_store import ArtifactStore
+
+
+def artifact_files(directory):
+    return sorted(name for name in os.listdir(directory) if '.artifact' in name)
+
+
+def test_put_and_open_round_trip(tmp_path):
+    store = ArtifactStore(tmp_path, compress=True)
+    artifact = store.put('class PetApiTest {}', 'PetApiTest.java', spec_hash='abc', user='alice')
+    assert store.get(artifact.id) is artifact
+    assert store.open(artifact).read() == b'class PetApiTest {}'
+    assert store.latest(spec_hash='abc') is artifact
+    assert store.find(user='bob') == []
+
+
+def test_oldest_artifacts_are_evicted_over_max_bytes(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=25)
+    first = store.put('a' * 10, 'A.java')
+    second = store.put('b' * 10, 'B.java')
+    third = store.put('c' * 10, 'C.java')
+
+    assert store.get(first.id) is None
+    assert [artifact.id for artifact in store.find()] == [third.id, second.id]
+    assert store.stats()['stored_bytes'] == 20
+    assert store.stats()['evictions'] == 1
+    assert len(artifact_files(tmp_path)) == 2
+
+
+def test_artifacts_expire_after_max_age(tmp_path):
+    store = ArtifactStore(tmp_path, max_age=0.1)
+    artifact = store.put('class PetApiTest {}', 'PetApiTest.java')
+    assert store.get(artifact.id) is artifact
+
+    time.sleep(0.15)
+    assert store.get(artifact.id) is None
+    assert store.find() == []
+    assert store.evict_expired() == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    artifact = ArtifactStore(tmp_path).put('class PetApiTest {}', 'PetApiTest.java', user='alice')
+    reopened = ArtifactStore(tmp_path)
+    assert reopened.latest(user='alice').id == artifact.id
+    assert reopened.stats()['stored_bytes'] == artifact.stored_size
+
+
+def test_only_old_leftover_files_are_removed(tmp_path):
+    old = time.time() - 120
+    for name in ('old.tmp', 'old.artifact', 'young.tmp', 'young.artifact'):
+        (tmp_path / name).write_bytes(b'partial')
+    for name in ('old.tmp', 'old.artifact'):
+        os.utime(tmp_path / name, (old, old))
+
+    ArtifactStore(tmp_path, orphan_grace=60)
+
+    # The young files may be another worker's write still in flight
+    assert sorted(os.listdir(tmp_path)) == ['young.artifact', 'young.tmp']
+
+
+def test_workers_sharing_a_directory_enforce_max_bytes_together(tmp_path):
+    one = ArtifactStore(tmp_path, max_bytes=25, sync_interval=0)
+    two = ArtifactStore(tmp_path, max_bytes=25, sync_interval=0)
+
+    first = one.put('a' * 10, 'A.java')
+    second = two.put('b' * 10, 'B.java')
+    third = one.put('c' * 10, 'C.java')
+
+    assert len(artifact_files(tmp_path)) == 2
+    assert one.get(first.id) is None
+    assert one.get(second.id).id == second.id
+    assert two.get(third.id).id == third.id
@@ -0,0 +1,35 @@
+import json
+
+from batch import BatchScheduler, parse_spec_document
+
+
+def spec(title):
+    return json.dumps({'openapi': '3.0.0', 'info': {'title': title},
+                       'paths': {'/pets': {'get': {'responses': {'200': {}}}}}}).encode('utf-8')
+
+
+def test_specs_are_parsed_in_a_forkserver_pool():
+    scheduler = BatchScheduler(parse_workers=2)
+    try:
+        results = scheduler.parse_all(parse_spec_document, [('a.json', spec('A')), ('b.json', b'{')])
+        assert results[0][0]['title'] == 'A' and results[0][1] is None
+        assert results[1][0] is None and 'Failed to parse specification' in str(results[1][1])
+        assert scheduler._parse_pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+    finally:
+        scheduler.shutdown()
+    assert scheduler._parse_pool is None
+
+
+def test_after_fork_forgets_the_inherited_pool():
+    scheduler = BatchScheduler(parse_workers=2)
+    try:
+        scheduler.parse_all(parse_spec_document, [('a.json', spec('A')), ('b.json', spec('B'))])
+        inherited = scheduler._parse_pool
+        scheduler.after_fork()
+        assert scheduler._parse_pool is None
+        results = scheduler.parse_all(parse_spec_document, [('a.json', spec('A')), ('b.json', spec('B'))])
+        assert [info['title'] for info, _ in results] == ['A', 'B']
+        assert scheduler._parse_pool is not inherited
+    finally:
+        scheduler.shutdown()
+        inherited.shutdown()
@@ -0,0 +1,78 @@
+import os
+import time
+
+from generation_cache import GenerationCache
+
+SPEC = {'title': 'Pets', 'endpoints': [{'method': 'GET', 'path': '/pets'}], 'schemas': {'Pet': {'type': 'object'}}}
+PARAMETERS = {'decoding_method': 'greedy', 'max_new_tokens': 1500}
+
+
+def key(spec=SPEC, model_id='granite', parameters=PARAMETERS, template_version=1, **extra):
+    return GenerationCache.make_key(spec, model_id, parameters, template_version, **extra)
+
+
+def test_key_ignores_dict_order():
+    reordered = {'schemas': {'Pet': {'type': 'object'}}, 'endpoints': [{'path': '/pets', 'method': 'GET'}],
+                 'title': 'Pets'}
+    assert key(reordered, parameters=dict(reversed(list(PARAMETERS.items())))) == key()
+
+
+def test_key_covers_everything_that_changes_the_output():
+    keys = {
+        key(),
+        key(dict(SPEC, title='Stores')),
+        key(model_id='granite-8b'),
+        key(parameters=dict(PARAMETERS, max_new_tokens=2000)),
+        key(template_version=2),
+        key(class_name='PetsApiTest')
+    }
+    assert len(keys) == 6
+
+
+def test_memory_tier_is_an_lru():
+    cache = GenerationCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['memory_hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_get_or_generate_generates_once():
+    cache = GenerationCache()
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_generate('k', lambda: calls.append(1) or 'class PetsApiTest {}') == 'class PetsApiTest {}'
+    assert len(calls) == 1
+
+
+def test_disk_tier_is_shared_between_caches(tmp_path):
+    GenerationCache(directory=tmp_path).set('k', 'class PetsApiTest {}')
+    other = GenerationCache(directory=tmp_path)
+    assert other.get('k') == 'class PetsApiTest {}'
+    assert other.stats()['disk_hits'] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = GenerationCache(directory=tmp_path, ttl=60)
+    cache.set('k', 'class PetsApiTest {}')
+    old = time.time() - 120
+    os.utime(tmp_path / 'k.java', (old, old))
+    assert GenerationCache(directory=tmp_path, ttl=60).get('k') is None
+    assert not (tmp_path / 'k.java').exists()
+
+
+def test_disk_tier_is_trimmed_oldest_first(tmp_path):
+    cache = GenerationCache(directory=tmp_path, max_disk_bytes=25)
+    for age, name in ((30, 'a'), (20, 'b')):
+        cache.set(name, name * 10)
+        mtime = time.time() - age
+        os.utime(tmp_path / f"{name}.java", (mtime, mtime))
+    cache.set('c', 'c' * 10)
+    assert sorted(os.listdir(tmp_path)) == ['b.java', 'c.java']
+    assert cache.stats()['disk_bytes'] == 20
@@ -0,0 +1,55 @@
+import io
+import json
+
+import pytest
+import requests
+
+from granite_client import GraniteClient
+
+from testgen_common.llm_scheduler import LLMScheduler
+from testgen_common.resilience import GraniteResponseError, GraniteUnavailableError, RetryPolicy
+
+
+def response(status_code, body):
+    fake = requests.Response()
+    fake.status_code = status_code
+    fake._content = json.dumps(body).encode()
+    fake.raw = io.BytesIO()
+    return fake
+
+
+def make_client(*responses):
+    client = GraniteClient(LLMScheduler(tokens_per_minute=100000))
+    client.retry_policy = RetryPolicy(max_attempts=1)
+    client.get_access_token = lambda: 'token'
+    replies = list(responses)
+    client.session.post = lambda *args, **kwargs: replies.pop(0)
+    return client
+
+
+def available_tokens(client):
+    return client.scheduler.stats()['available_tokens']
+
+
+def test_generation_is_charged_the_tokens_watsonx_reports():
+    client = make_client(response(200, {'results': [
+        {'generated_text': 'class PetTests {}', 'input_token_count': 300, 'generated_token_count': 200}
+    ]}))
+    assert client.generate_test_cases('prompt') == 'class PetTests {}'
+    assert available_tokens(client) == pytest.approx(100000 - 500, abs=50)
+
+
+def test_failed_generation_releases_its_reservation():
+    client = make_client(response(503, {'errors': [{'message': 'busy'}]}))
+    with pytest.raises(GraniteUnavailableError):
+        client.generate_test_cases('prompt')
+    assert available_tokens(client) == pytest.approx(100000, abs=50)
+
+
+def test_unreadable_result_is_charged_its_prompt():
+    client = make_client(response(200, {'unexpected': True}))
+    with pytest.raises(GraniteResponseError):
+        client.generate_test_cases('x' * 4000)
+    available = available_tokens(client)
+    # The prompt, but not the max_new_tokens the call reserved
+    assert 100000 - 3000 < available < 100000 - 500
@@ -0,0 +1,87 @@
+import copy
+
+from incremental import FingerprintStore, IncrementalGenerator, endpoint_fingerprint
+from sharding import ShardedGenerator
+
+SCHEMAS = {
+    'Pet': {'properties': {'owner': {'$ref': '#/components/schemas/Owner'}}},
+    'Owner': {'properties': {'name': {'type': 'string'}}},
+    'Store': {'properties': {'id': {'type': 'integer'}}}
+}
+API_INFO = {
+    'title': 'Pets',
+    'endpoints': [
+        {'method': 'GET', 'path': '/pets', 'parameters': [],
+         'responses': {'200': {'schema': {'$ref': '#/components/schemas/Pet'}}}},
+        {'method': 'GET', 'path': '/stores', 'parameters': [],
+         'responses': {'200': {'schema': {'$ref': '#/components/schemas/Store'}}}}
+    ],
+    'schemas': SCHEMAS
+}
+
+
+def test_fingerprint_follows_referenced_schemas_only():
+    pets = API_INFO['endpoints'][0]
+    before = endpoint_fingerprint(pets, SCHEMAS)
+    assert endpoint_fingerprint(copy.deepcopy(pets), copy.deepcopy(SCHEMAS)) == before
+
+    unrelated = dict(SCHEMAS, Store={'properties': {'id': {'type': 'string'}}})
+    assert endpoint_fingerprint(pets, unrelated) == before
+
+    nested = dict(SCHEMAS, Owner={'properties': {'name': {'type': 'string'}, 'email': {'type': 'string'}}})
+    assert endpoint_fingerprint(pets, nested) != before
+
+
+class Generator:
+    def __init__(self, tmp_path, **kwargs):
+        self.calls = []
+        self.incremental = IncrementalGenerator(ShardedGenerator(self.generate), FingerprintStore(tmp_path),
+                                                **kwargs)
+
+    def generate(self, shard_info, class_name):
+        self.calls.append(class_name)
+        return f"class {class_name} {{\n    void test() {{}}\n}}\n"
+
+    def run(self, api_info):
+        self.calls = []
+        return self.incremental.generate(api_info, 'pets')
+
+
+def test_only_changed_endpoints_are_regenerated(tmp_path):
+    generator = Generator(tmp_path)
+    first, summary = generator.run(API_INFO)
+    assert summary['regenerated'] == ['GET /pets', 'GET /stores']
+    assert len(generator.calls) == 2
+
+    again, summary = generator.run(API_INFO)
+    assert generator.calls == []
+    assert summary['reused'] == 2
+    assert again == first
+
+    changed = copy.deepcopy(API_INFO)
+    changed['schemas']['Owner']['properties']['email'] = {'type': 'string'}
+    _, summary = generator.run(changed)
+    assert summary['regenerated'] == ['GET /pets']
+    assert generator.calls == ['PetsGETPetsApiTest']
+
+
+def test_removed_endpoints_are_reported_and_dropped(tmp_path):
+    generator = Generator(tmp_path)
+    generator.run(API_INFO)
+    merged, summary = generator.run(dict(API_INFO, endpoints=API_INFO['endpoints'][:1]))
+    assert summary['removed'] == ['GET /stores']
+    assert summary['reused'] == 1
+    assert 'class GETPetsTests' in merged
+    assert 'GETStores' not in merged
+
+
+def test_changed_generation_inputs_regenerate_every_endpoint(tmp_path):
+    inputs = {'model_id': 'granite', 'template_version': 1}
+    generator = Generator(tmp_path, generation_inputs=lambda: dict(inputs))
+    generator.run(API_INFO)
+    _, summary = generator.run(API_INFO)
+    assert summary['regenerated'] == []
+
+    inputs['template_version'] = 2
+    _, summary = generator.run(API_INFO)
+    assert summary['regenerated'] == ['GET /pets', 'GET /stores']
@@ -0,0 +1,59 @@
+import time
+
+from jobs import JobManager
+
+from testgen_common.shared_state import FileRecordStore
+
+
+def wait_until_done(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job and job.done:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_jobs_are_visible_to_other_processes_through_the_store(tmp_path):
+    # Two managers stand in for two gunicorn workers sharing the state directory
+    running = JobManager(max_workers=1, store=FileRecordStore(str(tmp_path), 'jobs_', 60))
+    other = JobManager(max_workers=1, store=FileRecordStore(str(tmp_path), 'jobs_', 60))
+
+    def generate(job):
+        job.update('generating', 0.5)
+        return {'success': True, 'test_cases': 'class PetTests {}'}
+
+    job = running.submit(generate)
+    finished = wait_until_done(other, job.id)
+    assert finished.status == 'succeeded'
+    assert finished.result == {'success': True, 'test_cases': 'class PetTests {}'}
+    assert finished.to_dict()['progress'] == 1.0
+    running.shutdown()
+    other.shutdown()
+
+
+def test_failed_job_is_published_with_its_error(tmp_path):
+    store = FileRecordStore(str(tmp_path), 'jobs_', 60)
+    running = JobManager(max_workers=1, store=store)
+
+    def generate(job):
+        raise ValueError('spec has no paths')
+
+    job = running.submit(generate)
+    finished = wait_until_done(JobManager(store=store), job.id)
+    assert finished.status == 'failed'
+    assert finished.error == 'spec has no paths'
+    assert 'ValueError' in finished.details
+    running.shutdown()
+
+
+def test_unknown_and_expired_jobs_are_not_found(tmp_path):
+    store = FileRecordStore(str(tmp_path), 'jobs_', 60)
+    manager = JobManager(store=store)
+    assert manager.get('../../etc/passwd') is None
+
+    store.set('old', {'job_id': 'old'})
+    store.ttl = -1
+    assert store.get('old') is None
+    manager.shutdown()
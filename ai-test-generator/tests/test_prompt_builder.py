@@ -0,0 +1,74 @@
+from prompt_builder import (COMPACTION_STEPS, ENUM_SUMMARY_LIMIT, build_prompt_within_budget, describe_property,
+                            describe_schemas)
+from testgen_common.token_budget import TokenCounter
+
+STATUSES = [f"s{index}" for index in range(20)]
+
+API_INFO = {
+    'title': 'Pets',
+    'version': '1.0',
+    'description': 'Pet store ' * 40,
+    'base_url': 'https://api.example.com',
+    'endpoints': [
+        {'method': 'GET', 'path': '/pets', 'summary': 'List pets', 'parameters': [{'name': 'limit'}],
+         'responses': {'200': {}}, 'request_schemas': [], 'schema_refs': ['Pet']},
+        {'method': 'POST', 'path': '/pets', 'summary': 'Create a pet', 'parameters': [],
+         'responses': {'201': {}}, 'request_schemas': ['NewPet'], 'schema_refs': ['NewPet', 'Pet']}
+    ],
+    'schemas': {
+        'Pet': {'properties': {'name': {'type': 'string'}, 'status': {'type': 'string', 'enum': STATUSES}}},
+        'NewPet': {'properties': {'name': {'type': 'string'}, 'status': {'type': 'string', 'enum': STATUSES}}},
+        'Unused': {'properties': {'x': {'type': 'integer'}}}
+    }
+}
+
+
+def test_describe_property_lists_short_enums_whole():
+    values = [f"v{index}" for index in range(ENUM_SUMMARY_LIMIT)]
+    assert describe_property({'type': 'string', 'enum': values}, summarize_enums=True) == \
+        f"string enum[{'|'.join(values)}]"
+
+
+def test_describe_property_summarizes_long_enums():
+    prop = {'type': 'string', 'enum': list('abcdefghij')}
+    assert describe_property(prop, summarize_enums=True) == 'string enum[a|b|c|d|...6 more]'
+    assert describe_property(prop) == 'string enum[a|b|c|d|e|f|g|h|i|j]'
+
+
+def test_describe_property_names_referenced_schema():
+    assert describe_property({'$ref': '#/components/schemas/Pet'}) == 'Pet'
+
+
+def test_describe_schemas_without_steps_lists_every_schema():
+    described = describe_schemas(API_INFO, ())
+    assert described.count('\n') == 3
+    assert '- Unused: x: integer\n' in described
+
+
+def test_dedupe_schemas_drops_unreferenced_and_merges_identical():
+    described = describe_schemas(API_INFO, ('dedupe_schemas', 'summarize_enums'))
+    assert described == '- Pet, NewPet: name: string, status: string enum[s0|s1|s2|s3|...16 more]\n'
+
+
+def test_prompt_within_budget_is_left_alone():
+    prompt, report = build_prompt_within_budget(API_INFO, 100000, TokenCounter())
+    assert report['steps'] == []
+    assert report['within_budget']
+    assert 'Unused' in prompt
+
+
+def test_compaction_applies_steps_in_order_until_it_fits():
+    _, full = build_prompt_within_budget(API_INFO, None, TokenCounter())
+    prompt, report = build_prompt_within_budget(API_INFO, full['tokens'] - 1, TokenCounter())
+    assert report['steps'] == ['dedupe_schemas']
+    assert report['within_budget']
+    assert 'Unused' not in prompt
+
+
+def test_compaction_never_drops_an_endpoint():
+    prompt, report = build_prompt_within_budget(API_INFO, 1, TokenCounter())
+    assert report['steps'] == list(COMPACTION_STEPS)
+    assert not report['within_budget']
+    assert report['trimmed_tokens'] > 0
+    assert '- GET /pets (limit) body: - -> 200' in prompt
+    assert '- POST /pets () body: NewPet -> 201' in prompt
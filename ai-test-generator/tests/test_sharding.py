@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+
+from sharding import (ShardedGenerator, find_class_body, group_endpoints, merge_test_classes, schemas_for_endpoints,
+                      split_java_source, to_identifier)
+
+from testgen_common.resilience import GraniteRateLimitError
+
+
+def endpoint(method, path, tags=None, **extra):
+    return dict({'method': method, 'path': path, 'tags': tags or [], 'parameters': [], 'responses': {}}, **extra)
+
+
+def java_class(name, body, imports=('import org.junit.jupiter.api.Test;',)):
+    return 'package com.example;\n\n' + '\n'.join(imports) + f"\n\nclass {name} {{\n{body}\n}}\n"
+
+
+def test_to_identifier():
+    assert to_identifier('pet store') == 'PetStore'
+    assert to_identifier('user-accounts v2') == 'UserAccountsV2'
+    assert to_identifier('2fa') == 'Group2fa'
+    assert to_identifier('///') == 'Group'
+
+
+def test_endpoints_are_grouped_by_tag_then_path_prefix():
+    endpoints = [
+        endpoint('GET', '/pets', ['pets']),
+        endpoint('GET', '/stores/{id}'),
+        endpoint('POST', '/pets', ['pets']),
+        endpoint('GET', '/{id}')
+    ]
+    groups = [(group, name, [e['path'] for e in members]) for group, name, members in group_endpoints(endpoints)]
+    assert groups == [
+        ('pets', 'pets', ['/pets', '/pets']),
+        ('root', 'root', ['/{id}']),
+        ('stores', 'stores', ['/stores/{id}'])
+    ]
+    by_path = group_endpoints(endpoints, shard_by='path')
+    assert [group for group, _, _ in by_path] == ['pets', 'root', 'stores']
+
+
+def test_large_groups_are_split_into_numbered_shards():
+    endpoints = [endpoint('GET', f"/pets/{index}", ['pets']) for index in range(5)]
+    shards = group_endpoints(endpoints, max_endpoints=2)
+    assert [(group, name, len(members)) for group, name, members in shards] == [
+        ('pets', 'pets', 2), ('pets', 'pets 2', 2), ('pets', 'pets 3', 1)
+    ]
+
+
+def test_shards_get_only_the_schemas_they_reach():
+    schemas = {
+        'Pet': {'properties': {'owner': {'$ref': '#/components/schemas/Owner'}}},
+        'Owner': {'properties': {'name': {'type': 'string'}}},
+        'Store': {'properties': {'id': {'type': 'integer'}}}
+    }
+    endpoints = [endpoint('GET', '/pets', responses={'200': {'$ref': '#/components/schemas/Pet'}})]
+    assert list(schemas_for_endpoints(endpoints, schemas)) == ['Owner', 'Pet']
+
+
+def test_class_body_ignores_braces_in_strings_and_comments():
+    source = java_class('PetTest', '    // closing } here\n    String s = "}{";\n    /* } */ void test() {}')
+    start, end = find_class_body(source)
+    assert source[start:end].strip().endswith('void test() {}')
+
+
+def test_truncated_class_body_runs_to_the_end():
+    source = 'class PetTest {\n    void test() {\n'
+    assert find_class_body(source) == (len('class PetTest {'), len(source))
+
+
+def test_split_java_source():
+    imports, body = split_java_source(java_class('PetTest', '    void test() {}'))
+    assert imports == ['import org.junit.jupiter.api.Test;']
+    assert body == '    void test() {}'
+
+
+def test_merge_keeps_shard_order_and_deduplicates_imports():
+    merged = merge_test_classes('PetsApiTest', [
+        ('pets', java_class('A', '    void listPets() {}')),
+        ('pets', java_class('B', '    void createPet() {}')),
+        ('stores', java_class('C', '    void getStore() {}', imports=(
+            'import org.junit.jupiter.api.Test;', 'import static org.hamcrest.Matchers.*;')))
+    ])
+    assert merged.startswith('package com.example.api.test;\n')
+    assert merged.count('import org.junit.jupiter.api.Test;') == 1
+    assert 'import static org.hamcrest.Matchers.*;' in merged
+    assert 'public class PetsApiTest {' in merged
+    assert merged.index('class PetsTests') < merged.index('class Pets2Tests') < merged.index('class StoresTests')
+    assert '        void getStore() {}' in merged
+
+
+def make_generator(generate, **kwargs):
+    return ShardedGenerator(lambda shard_info, class_name: generate(class_name), **kwargs)
+
+
+API_INFO = {
+    'title': 'pet store',
+    'endpoints': [endpoint('GET', '/pets', ['pets']), endpoint('GET', '/stores', ['stores']),
+                  endpoint('GET', '/users', ['users'])],
+    'schemas': {}
+}
+
+
+def test_merged_output_does_not_depend_on_completion_order():
+    delays = {'PetStorePetsApiTest': 0.06, 'PetStoreStoresApiTest': 0.03, 'PetStoreUsersApiTest': 0.0}
+    running = set()
+    overlapped = threading.Event()
+
+    def generate(class_name):
+        running.add(class_name)
+        if len(running) > 1:
+            overlapped.set()
+        time.sleep(delays[class_name])
+        return java_class(class_name, f"    void {class_name.lower()}() {{}}")
+
+    merged = make_generator(generate, max_concurrency=3).generate_merged(API_INFO)
+    assert overlapped.is_set()
+    assert merged.index('class PetsTests') < merged.index('class StoresTests') < merged.index('class UsersTests')
+    assert 'public class PetStoreApiTest {' in merged
+
+
+def test_split_groups_are_merged_back_per_group():
+    info = dict(API_INFO, endpoints=[endpoint('GET', f"/pets/{index}", ['pets']) for index in range(3)])
+    generator = make_generator(lambda class_name: java_class(class_name, '    void test() {}'), max_endpoints=2)
+    classes = generator.generate_per_group(info)
+    assert [name for name, _ in classes] == ['PetStorePetsApiTest']
+    assert 'class PetsTests' in classes[0][1] and 'class Pets2Tests' in classes[0][1]
+
+
+def test_failed_shard_is_named():
+    def generate(class_name):
+        if class_name == 'PetStoreStoresApiTest':
+            raise ValueError('model unavailable')
+        return java_class(class_name, '')
+
+    with pytest.raises(Exception, match="Shard 'stores' failed: model unavailable"):
+        make_generator(generate).generate_merged(API_INFO)
+
+
+def test_failed_shard_keeps_watsonx_error_type():
+    def generate(class_name):
+        if class_name == 'PetStoreStoresApiTest':
+            raise GraniteRateLimitError('rate limited', 429, retry_after=5)
+        return java_class(class_name, '')
+
+    with pytest.raises(GraniteRateLimitError, match="Shard 'stores' failed: rate limited") as raised:
+        make_generator(generate).generate_merged(API_INFO)
+    assert raised.value.status_code == 429
+    assert raised.value.retry_after == 5
+    assert raised.value.http_status == 429
@@ -0,0 +1,213 @@
+import io
+import json
+import pickle
+
+import pytest
+import yaml
+
+from batch import parse_spec_document
+from generation_cache import canonical_json
+from prompt_builder import create_test_generation_prompt
+from sharding import ShardedGenerator
+from spec_parser import SchemaResolver, SpecParser
+
+
+def ref(name):
+    return {'$ref': f"#/components/schemas/{name}"}
+
+
+SPEC = {
+    'openapi': '3.0.0',
+    'info': {'title': 'Pets', 'version': '1.0'},
+    'paths': {
+        '/pets/{id}': {
+            'get': {
+                'parameters': [{'$ref': '#/components/parameters/id'}],
+                'responses': {'200': {'$ref': '#/components/responses/PetResponse'}}
+            },
+            'put': {
+                'requestBody': {'$ref': '#/components/requestBodies/PetBody'},
+                'responses': {'204': {'description': 'Updated'}}
+            }
+        }
+    },
+    'components': {
+        'parameters': {'id': {'name': 'id', 'in': 'path', 'schema': {'type': 'integer'}}},
+        'responses': {'PetResponse': {'content': {'application/json': {'schema': ref('Pet')}}}},
+        'requestBodies': {'PetBody': {'content': {'application/json': {'schema': ref('NewPet')}}}},
+        'schemas': {
+            'Pet': {'properties': {'owner': ref('Owner'), 'tags': {'items': ref('Tag')}}},
+            'NewPet': {'properties': {'name': {'type': 'string'}}},
+            'Owner': {'properties': {'pets': {'items': ref('Pet')}}},
+            'Tag': {'properties': {'name': {'type': 'string'}}},
+            'Unused': {'properties': {'id': {'type': 'integer'}}}
+        }
+    }
+}
+
+
+def test_closure_follows_nested_and_circular_refs():
+    resolver = SchemaResolver(SPEC)
+    assert resolver.closure('Pet') == {'Pet', 'Owner', 'Tag'}
+    assert resolver.closure('Owner') == {'Pet', 'Owner', 'Tag'}
+    assert resolver.closure('Missing') == set()
+
+
+def test_closure_for_follows_shared_components():
+    resolver = SchemaResolver(SPEC)
+    get = SPEC['paths']['/pets/{id}']['get']
+    assert resolver.closure_for(get['responses']) == {'Pet', 'Owner', 'Tag'}
+
+
+def test_dereference_follows_chains_and_stops_at_cycles():
+    spec = {'components': {'parameters': {
+        'a': {'$ref': '#/components/parameters/b'},
+        'b': {'name': 'limit', 'in': 'query'},
+        'loop': {'$ref': '#/components/parameters/loop'},
+        'a~1b': {'name': 'escaped'}
+    }}}
+    resolver = SchemaResolver(spec)
+    assert resolver.dereference({'$ref': '#/components/parameters/a'}) == {'name': 'limit', 'in': 'query'}
+    assert resolver.dereference({'$ref': '#/components/parameters/loop'}) == {'$ref': '#/components/parameters/loop'}
+    assert resolver.dereference({'$ref': '#/components/parameters/missing'}) == \
+        {'$ref': '#/components/parameters/missing'}
+    # JSON pointer escapes: ~0 is '~' and ~1 is '/'
+    assert resolver.lookup('#/components/parameters/a~01b') == {'name': 'escaped'}
+    assert SchemaResolver({'x': {'a/b': 1}}).lookup('#/x/a~1b') == 1
+
+
+def test_resolve_inlines_refs_and_marks_cycles():
+    resolved = SchemaResolver(SPEC).resolve('Pet')
+    owner = resolved['properties']['owner']
+    assert owner['properties']['pets']['items'] == {'$ref': '#/components/schemas/Pet', 'x-circular': True}
+    assert resolved['properties']['tags']['items'] == SPEC['components']['schemas']['Tag']
+
+
+def test_long_ref_chains_do_not_recurse():
+    depth = 5000
+    schemas = {f"S{index}": {'properties': {'next': ref(f"S{index + 1}")}} for index in range(depth)}
+    schemas[f"S{depth}"] = {'type': 'string'}
+    resolver = SchemaResolver({'components': {'schemas': schemas}})
+    assert len(resolver.closure('S0')) == depth + 1
+    node = resolver.resolve('S0')
+    for _ in range(depth):
+        node = node['properties']['next']
+    assert node == {'type': 'string'}
+
+
+def test_endpoints_record_their_request_schemas_and_closure():
+    api_info = SpecParser.parse_openapi_spec(json.dumps(SPEC), 'json')
+    get, put = api_info['endpoints']
+    assert get['parameters'] == [{'name': 'id', 'in': 'path', 'schema': {'type': 'integer'}}]
+    assert get['schema_refs'] == ['Owner', 'Pet', 'Tag']
+    assert get['request_schemas'] == []
+    assert put['request_body'] == SPEC['components']['requestBodies']['PetBody']
+    assert put['request_schemas'] == ['NewPet']
+    assert put['schema_refs'] == ['NewPet']
+
+
+def compact(endpoint):
+    """The fields of a parse_openapi_spec endpoint that EndpointRecord keeps."""
+    return {
+        'path': endpoint['path'],
+        'method': endpoint['method'],
+        'summary': endpoint['summary'],
+        'parameters': [{'name': p.get('name', ''), 'in': p.get('in', ''), 'required': bool(p.get('required', False))}
+                       for p in endpoint['parameters']],
+        'responses': {str(code): {} for code in endpoint['responses']},
+        'tags': endpoint['tags'],
+        'request_schemas': endpoint['request_schemas'],
+        'schema_refs': endpoint['schema_refs']
+    }
+
+
+def assert_streams_like_full_parse(text, file_type):
+    full = SpecParser.parse_openapi_spec(text, file_type)
+    streamed = SpecParser.stream_spec(io.BytesIO(text.encode('utf-8')), file_type)
+    api_info = streamed.api_info()
+    for key in ('title', 'version', 'description', 'base_url'):
+        assert api_info[key] == full[key]
+    assert api_info['endpoints'] == [compact(endpoint) for endpoint in full['endpoints']]
+    assert [record.to_dict() for record in SpecParser.iter_endpoints(io.BytesIO(text.encode('utf-8')), file_type)] \
+        == api_info['endpoints']
+    assert dict(api_info['schemas']) == full['schemas']
+
+
+def components_first(spec):
+    return dict({'components': spec['components']}, **{k: v for k, v in spec.items() if k != 'components'})
+
+
+@pytest.mark.parametrize('file_type', ['json', 'yaml'])
+@pytest.mark.parametrize('order', [dict, components_first], ids=['components_after_paths', 'components_first'])
+def test_streamed_spec_matches_full_parse(file_type, order):
+    spec = dict(order(SPEC), servers=[{'url': 'https://pets.example.com'}])
+    spec['paths'] = dict(spec['paths'], **{'/owners': {
+        'post': {'summary': 'Add owner', 'tags': ['owners'],
+                 'parameters': [{'name': 'dry_run', 'in': 'query', 'required': True}],
+                 'requestBody': {'content': {'application/json': {'schema': ref('Owner')}}},
+                 'responses': {'201': {'description': 'Created'}}},
+        'parameters': [{'name': 'ignored', 'in': 'header'}]
+    }})
+    text = json.dumps(spec) if file_type == 'json' else yaml.safe_dump(spec, sort_keys=False)
+    assert_streams_like_full_parse(text, file_type)
+
+
+def test_streamed_spec_follows_circular_schema_refs():
+    streamed = SpecParser.stream_spec(io.BytesIO(json.dumps(SPEC).encode('utf-8')), 'json')
+    get, put = streamed.endpoints()
+    assert get.schema_refs == ('Owner', 'Pet', 'Tag')
+    assert put.schema_refs == ('NewPet',)
+    assert streamed.schemas.closure(['Owner']) == {'Owner', 'Pet', 'Tag'}
+
+
+def test_streamed_yaml_resolves_anchors_and_aliases():
+    # The Limit anchor sits in paths, which the first pass skips, and is
+    # used by a component defined after it
+    text = """
+openapi: 3.0.0
+info: {title: Anchors, version: '2.0'}
+paths:
+  /pets:
+    get:
+      tags: &pet_tags [pets]
+      parameters:
+        - &limit {name: limit, in: query, required: true}
+      responses: &ok
+        200: {description: OK, content: {application/json: {schema: {$ref: '#/components/schemas/Pet'}}}}
+    post:
+      tags: *pet_tags
+      parameters: [{$ref: '#/components/parameters/Limit'}]
+      responses: *ok
+components:
+  parameters:
+    Limit: *limit
+  schemas:
+    Pet: {properties: {name: {type: string}}}
+"""
+    assert_streams_like_full_parse(text, 'yaml')
+    get, post = SpecParser.iter_endpoints(io.BytesIO(text.encode('utf-8')), 'yaml')
+    assert post.tags == ('pets',)
+    assert post.parameters == (('limit', 'query', True),)
+    assert post.responses == ('200',) and post.schema_refs == ('Pet',)
+
+
+def test_compact_spec_builds_the_same_prompts_and_shards():
+    text = json.dumps(SPEC)
+    full = SpecParser.parse_openapi_spec(text, 'json')
+    compact_info = parse_spec_document('pets.json', text.encode('utf-8'), compact_min_bytes=0)
+    assert create_test_generation_prompt(compact_info) == create_test_generation_prompt(full)
+
+    sharder = ShardedGenerator(None, max_endpoints=1)
+    full_shards = sharder.build_shards(full, 'prefix')
+    compact_shards = sharder.build_shards(compact_info, 'prefix')
+    assert [(name, info['schemas']) for _, name, _, info in compact_shards] == \
+        [(name, info['schemas']) for _, name, _, info in full_shards]
+
+
+def test_lazy_schemas_pickle_and_hash_like_dicts():
+    # Batch parsing sends api_info back from a worker process
+    schemas = SpecParser.stream_spec(io.BytesIO(json.dumps(SPEC).encode('utf-8')), 'json').schemas
+    copy = pickle.loads(pickle.dumps(schemas))
+    assert dict(copy) == SPEC['components']['schemas']
+    assert copy.closure(['Pet']) == {'Pet', 'Owner', 'Tag'}
+    assert canonical_json({'schemas': copy}) == canonical_json({'schemas': SPEC['components']['schemas']})
@@ -0,0 +1,286 @@
+import os
+import re
+
+VALIDATION_ANNOTATIONS = (
+    'Valid', 'Validated', 'NotNull', 'NotBlank', 'NotEmpty', 'Size', 'Min', 'Max', 'Pattern', 'Email',
+    'Positive', 'PositiveOrZero', 'Negative', 'NegativeOrZero', 'DecimalMin', 'DecimalMax', 'Digits',
+    'Past', 'PastOrPresent', 'Future', 'FutureOrPresent'
+)
+
+LITERAL_TOKENS = frozenset(('comment', 'text_block', 'string', 'char'))
+
+_STRING = r'"(?:[^"\\\n]|\\.)*"'
+# {"/a", "/{id}"}: braces inside the strings are part of the paths
+_STRING_ARRAY = rf'\{{\s*(?:{_STRING}(?:\s*,\s*{_STRING})*\s*,?\s*)?\}}'
+
+# One pass over the source. Comments and literals are matched as whole
+# tokens so annotations and braces inside them are never mistaken for code.
+# Every alternative starts with a literal character, which lets the regex
+# engine skip straight to candidate positions; braces are left unnamed for
+# the same reason and come back with lastgroup None.
+TOKEN_PATTERN = re.compile(
+    r'/(?P<comment>/[^\n]*|\*.*?\*/)'
+    r'|"(?P<text_block>""(?:[^\\]|\\.)*?""")'
+    r'|"(?P<string>(?:[^"\\\n]|\\.)*")'
+    r"|'(?P<char>(?:[^'\\\n]|\\.)+')"
+    r'|@(?P<verb>Get|Post|Put|Delete|Patch|Request)Mapping\b'
+    rf'(?:\s*\((?P<args>(?:[^()"]|{_STRING})*)\))?'
+    r'|@(?P<body>RequestBody)\b'
+    rf'|@(?P<valid>{"|".join(VALIDATION_ANNOTATIONS)})\b'
+    r'|\{'
+    r'|\}',
+    re.DOTALL
+)
+
+STRING_PATTERN = re.compile(_STRING)
+KEYED_PATH_PATTERN = re.compile(rf'\b(?:value|path)\s*=\s*({_STRING_ARRAY}|{_STRING})')
+POSITIONAL_PATH_PATTERN = re.compile(rf'\s*({_STRING_ARRAY}|{_STRING})')
+METHOD_ARG_PATTERN = re.compile(r'\bmethod\s*=\s*(\{[^{}]*\}|[\w.]+)')
+REQUEST_METHOD_PATTERN = re.compile(r'\b(GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS|TRACE)\b')
+PATH_VARIABLE_PATTERN = re.compile(r'\{\s*([A-Za-z_]\w*)\s*(?::[^{}]*(?:\{[^{}]*\}[^{}]*)*)?\}')
+TYPE_PATTERN = re.compile(r'(?<![\w.])(?:class|interface|enum|record)\s+([A-Za-z_]\w*)')
+HANDLER_PATTERN = re.compile(r'(?<![@\w.])([A-Za-z_]\w*)\s*\(')
+BODY_TYPE_PATTERN = re.compile(
+    r'(?:\s*\([^()]*\))?\s+'
+    r'(?:(?:@[\w.]+(?:\s*\([^()]*\))?|final)\s+)*'
+    r'([\w.]+(?:\s*<[^()]*?>)?(?:\s*\[\])*)\s+[A-Za-z_]\w*\s*[,)]'
+)
+
+
+def mapping_paths(args):
+    """Return the paths declared in a mapping annotation's arguments."""
+    if not args:
+        return ['']
+    if args[0] == '"' and args.count('"') == 2 and args.endswith('"'):
+        return [args[1:-1]]
+    match = KEYED_PATH_PATTERN.search(args) or POSITIONAL_PATH_PATTERN.match(args)
+    if not match:
+        return ['']
+    return [literal[1:-1] for literal in STRING_PATTERN.findall(match.group(1))] or ['']
+
+
+def mapping_methods(verb, args):
+    if verb != 'Request':
+        return [verb.upper()]
+    match = METHOD_ARG_PATTERN.search(args or '')
+    methods = REQUEST_METHOD_PATTERN.findall(match.group(1)) if match else []
+    return methods or ['ANY']
+
+
+def join_paths(prefix, path):
+    return '/' + '/'.join(filter(None, (prefix.strip('/'), path.strip('/'))))
+
+
+class _Scan:
+    """Per-source state for scan_source."""
+
+    def __init__(self, source, filename):
+        self.source = source
+        self.filename = filename
+        self.endpoints = []
+        self.depth = 0
+        self.classes = []           # [(depth, class_name, prefixes)]
+        self.pending = None         # (verb, args, start, end) of a mapping not yet bound
+        self.pending_validated = False
+        self.current = []           # endpoints whose parameter list is being read
+        self.has_request_body = False
+        self.has_validation = False
+        self._line = 1
+        self._line_offset = 0
+
+    def line_at(self, offset):
+        self._line += self.source.count('\n', self._line_offset, offset)
+        self._line_offset = offset
+        return self._line
+
+    def handler_before(self, offset):
+        """Return the handler name match between the pending mapping and offset."""
+        return HANDLER_PATTERN.search(self.source, self.pending[3], offset)
+
+    def open_type(self, declaration):
+        """Enter the body of the type declared by declaration."""
+        prefixes = ['']
+        if self.pending:
+            handler = self.handler_before(declaration.start())
+            if handler:
+                # A bodiless handler (interface method) directly before a nested type
+                self.bind_mapping(handler)
+            elif self.pending[0] == 'Request':
+                prefixes = mapping_paths(self.pending[1])
+        self.pending = None
+        self.pending_validated = False
+        self.classes.append((self.depth, declaration.group(1), prefixes))
+
+    def open_brace(self, offset, region_start):
+        # Types are declared at the top level or directly in a type body.
+        # Only code separates this brace from the previous token, so a type
+        # keyword found there declares the type this brace opens.
+        declaration = None
+        if not self.classes or self.classes[-1][0] == self.depth:
+            declaration = TYPE_PATTERN.search(self.source, region_start, offset)
+        self.depth += 1
+        if declaration:
+            self.open_type(declaration)
+        elif self.pending:
+            # Braces before the handler name belong to annotation arguments
+            handler = self.handler_before(offset)
+            if not handler:
+                return
+            self.bind_mapping(handler)
+        self.current = []
+
+    def close_brace(self, offset):
+        closes_type = bool(self.classes) and self.classes[-1][0] == self.depth
+        if self.pending:
+            handler = self.handler_before(offset)
+            if handler or closes_type:
+                self.bind_mapping(handler)
+        if closes_type:
+            self.classes.pop()
+        self.depth -= 1
+        self.current = []
+
+    def parameter_annotation(self, kind, match):
+        if kind == 'body':
+            self.has_request_body = True
+        else:
+            self.has_validation = True
+
+        if self.pending:
+            # Parameter annotations follow the handler name; anything
+            # earlier annotates the method itself or its class
+            handler = self.handler_before(match.start())
+            if not handler:
+                self.pending_validated = self.pending_validated or kind == 'valid'
+                return
+            self.bind_mapping(handler)
+
+        for endpoint in self.current:
+            if kind == 'valid':
+                endpoint['validated'] = True
+            else:
+                body_type = BODY_TYPE_PATTERN.match(self.source, match.end())
+                endpoint['request_body'] = body_type.group(1) if body_type else 'Object'
+
+    def bind_mapping(self, handler):
+        """Attach the pending method-level mapping to the handler that follows it."""
+        verb, args, start, _ = self.pending
+        validated = self.pending_validated
+        self.pending = None
+        self.pending_validated = False
+
+        class_name, prefixes = (self.classes[-1][1], self.classes[-1][2]) if self.classes else (None, [''])
+        line = self.line_at(start)
+
+        self.current = []
+        for prefix in prefixes:
+            for path in mapping_paths(args):
+                full_path = join_paths(prefix, path)
+                for method in mapping_methods(verb, args):
+                    self.current.append({
+                        'method': method,
+                        'path': full_path,
+                        'path_variables': PATH_VARIABLE_PATTERN.findall(full_path) if '{' in full_path else [],
+                        'handler': handler.group(1) if handler else None,
+                        'controller': class_name,
+                        'request_body': None,
+                        'validated': validated,
+                        'file': self.filename,
+                        'line': line
+                    })
+        self.endpoints.extend(self.current)
+
+
+def scan_source(source, filename=None):
+    """Extract every Spring request mapping from Java source in one pass.
+
+    Returns (endpoints, flags) where each endpoint is a dict with method,
+    path (including the class-level @RequestMapping prefix), path_variables,
+    handler, controller, request_body type, validated, file and line.
+    """
+    scan = _Scan(source, filename)
+
+    last_end = 0
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        region_start, last_end = last_end, match.end()
+
+        if kind in LITERAL_TOKENS:
+            continue
+
+        if kind is None:
+            if match.group() == '{':
+                scan.open_brace(match.start(), region_start)
+            else:
+                scan.close_brace(match.start())
+
+        elif kind in ('verb', 'args'):
+            if scan.pending:
+                # The previous mapping's handler had no body (an interface method)
+                handler = scan.handler_before(match.start())
+                if handler:
+                    scan.bind_mapping(handler)
+            scan.current = []
+            scan.pending = (match.group('verb'), match.group('args'), match.start(), match.end())
+
+        else:
+            scan.parameter_annotation(kind, match)
+
+    if scan.pending:
+        scan.bind_mapping(scan.handler_before(len(source)))
+
+    flags = {'has_request_body': scan.has_request_body, 'has_validation': scan.has_validation}
+    return scan.endpoints, flags
+
+
+def describe_endpoint(endpoint):
+    description = f"{endpoint['method']} {endpoint['path']}"
+    details = []
+    if endpoint['request_body']:
+        details.append(f"body: {endpoint['request_body']}")
+    if endpoint['validated']:
+        details.append("validated")
+    if endpoint['handler']:
+        details.append(f"handler: {endpoint['handler']}")
+    return f"{description} ({', '.join(details)})" if details else description
+
+
+def summarize(endpoints, flags):
+    """Build the analyze_api_structure result from scanned endpoints."""
+    return {
+        "endpoint_count": len(endpoints),
+        "endpoints": [describe_endpoint(endpoint) for endpoint in endpoints],
+        "has_path_variables": any(endpoint['path_variables'] for endpoint in endpoints),
+        "has_request_body": flags['has_request_body'],
+        "has_validation": flags['has_validation'],
+        "mappings": endpoints
+    }
+
+
+def analyze_source(source, filename=None):
+    return summarize(*scan_source(source, filename))
+
+
+def scan_directory(directory, extensions=('.java',)):
+    """Scan every controller source under directory and summarize them together."""
+    endpoints = []
+    flags = {'has_request_body': False, 'has_validation': False}
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(extensions):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                source = f.read()
+            # Skip files that cannot declare a mapping without tokenizing them
+            if 'Mapping' not in source:
+                continue
+
+            file_endpoints, file_flags = scan_source(source, os.path.relpath(path, directory))
+            endpoints.extend(file_endpoints)
+            for key, value in file_flags.items():
+                flags[key] = flags[key] or value
+
+    return summarize(endpoints, flags)
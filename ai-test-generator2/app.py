@@ -1,21 +1,285 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context
 from granite_client import GraniteClient
+from async_granite_client import AsyncGraniteClient
+from api_scanner import analyze_source
+from batch import BatchError, BatchScheduler, build_archive, elapsed_ms, read_batch_items, unique_filename
+from testgen_common import tracing
+from testgen_common.llm_scheduler import (DEFAULT_TENANT, Caller, LANES, LLMScheduler, bind_caller, current_caller,
+                                          enter_caller, exit_caller, parse_weights)
+from testgen_common.metrics import CONTENT_TYPE, REGISTRY, SIZE_BUCKETS
+from testgen_common.resilience import GraniteError
+from testgen_common.tracing import span
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import math
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+app.config['PIPELINE_WORKERS'] = int(os.getenv('PIPELINE_WORKERS', 8))
+app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 50))
+app.config['BATCH_GENERATION_WORKERS'] = int(os.getenv('BATCH_GENERATION_WORKERS', 8))
+app.config['BATCH_CONCURRENCY_PER_REQUEST'] = int(os.getenv('BATCH_CONCURRENCY_PER_REQUEST', 4))
+app.config['BATCH_PARSE_WORKERS'] = int(os.getenv('BATCH_PARSE_WORKERS', 2))
+# ?debug=timing or ?debug=profile adds a per-request breakdown to JSON
+# responses; keep it off in production
+app.config['TRACING_DEBUG'] = os.getenv('TRACING_DEBUG', 'false').lower() == 'true'
+app.config['TRACING_OTEL'] = os.getenv('TRACING_OTEL', 'false').lower() == 'true'
+# Directory where worker processes pool their metrics so /metrics reports all
+# of them; gunicorn.conf.py sets it
+app.config['METRICS_MULTIPROC_DIR'] = os.getenv('METRICS_MULTIPROC_DIR', '')
+# watsonx plan limits (0 = unlimited); each of LLM_SCHEDULER_WORKERS processes
+# schedules an equal share, and gunicorn.conf.py sets it to the worker count
+app.config['LLM_RPM_LIMIT'] = int(os.getenv('LLM_RPM_LIMIT', 0))
+app.config['LLM_TPM_LIMIT'] = int(os.getenv('LLM_TPM_LIMIT', 0))
+app.config['LLM_SCHEDULER_WORKERS'] = max(1, int(os.getenv('LLM_SCHEDULER_WORKERS', 1)))
+# 'team-a=3,team-b=1'; unlisted tenants weigh 1
+app.config['LLM_TENANT_WEIGHTS'] = parse_weights(os.getenv('LLM_TENANT_WEIGHTS', ''))
+app.config['LLM_TENANT_HEADER'] = os.getenv('LLM_TENANT_HEADER', 'X-Tenant')
+app.config['LLM_MAX_QUEUE_WAIT'] = float(os.getenv('LLM_MAX_QUEUE_WAIT', 120))
+
+if app.config['TRACING_OTEL'] and not tracing.configure_opentelemetry(
+        os.getenv('OTEL_SERVICE_NAME', 'ai-test-generator2')):
+    print("⚠️ TRACING_OTEL is set but OpenTelemetry is not installed")
+
+# Shared by both clients so their calls count against the same limits
+llm_scheduler = LLMScheduler(
+    requests_per_minute=app.config['LLM_RPM_LIMIT'] / app.config['LLM_SCHEDULER_WORKERS'],
+    tokens_per_minute=app.config['LLM_TPM_LIMIT'] / app.config['LLM_SCHEDULER_WORKERS'],
+    weights=app.config['LLM_TENANT_WEIGHTS'],
+    max_wait=app.config['LLM_MAX_QUEUE_WAIT']
+)
 
 # Initialize Granite client
 try:
-    granite_client = GraniteClient()
+    granite_client = GraniteClient(llm_scheduler)
+    if os.getenv('GRANITE_TOKEN_RENEWER', 'false').lower() == 'true':
+        granite_client.start_token_renewer()
     print("✅ Granite client initialized successfully")
 except Exception as e:
     print(f"❌ Failed to initialize Granite client: {e}")
     granite_client = None
 
+try:
+    async_granite_client = AsyncGraniteClient(llm_scheduler)
+except Exception as e:
+    print(f"❌ Failed to initialize async Granite client: {e}")
+    async_granite_client = None
+
+def after_fork():
+    """Per-worker setup when gunicorn forks a preloaded app (see gunicorn.conf.py)"""
+    if app.config['METRICS_MULTIPROC_DIR']:
+        REGISTRY.enable_multiprocess(app.config['METRICS_MULTIPROC_DIR'])
+    if granite_client:
+        granite_client.after_fork()
+    if async_granite_client:
+        async_granite_client.after_fork()
+    batch_scheduler.after_fork()
+
+# Runs analysis stages that overlap with test generation
+pipeline_executor = ThreadPoolExecutor(max_workers=app.config['PIPELINE_WORKERS'],
+                                       thread_name_prefix='pipeline')
+
+# Shared by every batch request so concurrent batches split the workers
+batch_scheduler = BatchScheduler(
+    max_workers=app.config['BATCH_GENERATION_WORKERS'],
+    per_batch_limit=app.config['BATCH_CONCURRENCY_PER_REQUEST'],
+    parse_workers=app.config['BATCH_PARSE_WORKERS']
+)
+
+REQUEST_SECONDS = REGISTRY.histogram('http_request_seconds', 'Time spent handling HTTP requests',
+                                     ('endpoint', 'method', 'status'))
+UPLOAD_SIZE_BYTES = REGISTRY.histogram('upload_size_bytes', 'Size of submitted API code request bodies',
+                                       ('endpoint',), buckets=SIZE_BUCKETS)
+REQUEST_ERRORS = REGISTRY.counter('request_errors_total', 'Failed generations by endpoint and error class',
+                                  ('endpoint', 'error'))
+REGISTRY.gauge('batch_active', 'Batch requests currently generating',
+               function=lambda: batch_scheduler.stats()['active_batches'])
+REGISTRY.gauge('async_client_in_flight', 'Generations in flight on the async client',
+               function=lambda: async_granite_client.stats()['in_flight'])
+REGISTRY.gauge('llm_queue_depth', 'watsonx calls waiting for the scheduler by lane', ('lane',),
+               function=lambda: {(lane,): llm_scheduler.stats()['queued'][lane] for lane in LANES})
+REGISTRY.gauge('circuit_breaker_open', '1 while the watsonx circuit breaker is open or half-open',
+               function=lambda: int(granite_client.circuit_breaker.stats()['state'] != 'closed'))
+REGISTRY.callback_counter('watsonx_coalesced_total', 'Calls that shared an identical in-flight watsonx request',
+                          lambda: {(name,): client.coalescer.stats()['coalesced']
+                                   for name, client in (('sync', granite_client), ('async', async_granite_client))
+                                   if client},
+                          ('client',))
+
+DEBUG_MODES = {'timing', 'profile'}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.llm_caller_token = enter_caller(Caller(request_tenant(), request_lane()))
+    if request.method == 'POST' and request.content_length:
+        UPLOAD_SIZE_BYTES.observe(request.content_length, endpoint=request.endpoint or 'unknown')
+    if app.config['TRACING_DEBUG']:
+        mode = request.args.get('debug') or request.headers.get('X-Debug')
+        if mode in DEBUG_MODES:
+            g.trace = tracing.begin(profile=mode == 'profile')
+
+@app.teardown_request
+def release_llm_caller(exc):
+    token = g.pop('llm_caller_token', None)
+    if token is not None:
+        exit_caller(token)
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'metrics':
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    
+    caller = current_caller()
+    if caller is not None and caller.calls:
+        response.headers['X-Queue-Wait-Ms'] = str(caller.queue_wait_ms)
+    
+    trace_handle = g.pop('trace', None)
+    if trace_handle:
+        attach_debug_trace(response, tracing.end(trace_handle))
+    return response
+
+def request_tenant():
+    """Whose share of the watsonx quota a request uses: its API key, LLM_TENANT_HEADER or address"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        return 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+    tenant = request.headers.get(app.config['LLM_TENANT_HEADER'], '').strip()[:128]
+    return tenant or request.remote_addr or DEFAULT_TENANT
+
+def request_lane():
+    """'interactive' for the web page's own requests, 'batch' for batch requests and API clients"""
+    if request.path.startswith('/api/batch/'):
+        return 'batch'
+    # Browsers set Sec-Fetch-Site themselves; a page cannot override it
+    return 'interactive' if request.headers.get('Sec-Fetch-Site') == 'same-origin' else 'batch'
+
+def attach_debug_trace(response, trace):
+    """Add the trace as Server-Timing and, for JSON bodies, as a 'debug' field"""
+    response.headers['Server-Timing'] = trace.server_timing()
+    if response.is_json and not response.is_streamed:
+        data = response.get_json()
+        if isinstance(data, dict):
+            data['debug'] = trace.summary()
+            response.set_data(json.dumps(data))
+
+def run_generation_pipeline(api_code, deep_analysis=False):
+    """Analyze and generate tests for api_code.
+    
+    The static analysis is cheap and feeds the prompt, so it runs first.
+    The optional LLM analysis only enriches the response, so it runs next to
+    generation and the request takes as long as the slowest stage.
+    """
+    started = time.perf_counter()
+    timings = {}
+    
+    with span('api.analysis'):
+        api_analysis = granite_client.analyze_api_structure(api_code)
+    timings['static_analysis'] = elapsed_ms(started)
+    
+    def timed(stage, fn, *args):
+        stage_started = time.perf_counter()
+        try:
+            with span(stage):
+                return fn(*args)
+        finally:
+            timings[stage] = elapsed_ms(stage_started)
+    
+    llm_future = None
+    if deep_analysis:
+        llm_future = pipeline_executor.submit(bind_caller(tracing.bind(timed)), 'llm_analysis',
+                                              granite_client.analyze_api_with_llm, api_code)
+    
+    result = {'api_analysis': api_analysis}
+    prompt_reports = []
+    try:
+        result['generated_tests'] = timed('generation', granite_client.generate_test_cases, api_code, api_analysis,
+                                          prompt_reports)
+    except Exception:
+        if llm_future:
+            llm_future.cancel()
+        raise
+    
+    if llm_future:
+        try:
+            result['llm_analysis'] = llm_future.result()
+        except Exception as e:
+            REQUEST_ERRORS.inc(endpoint='llm_analysis', error=type(e).__name__)
+            print(f"⚠️ LLM analysis failed: {e}")
+            result['llm_analysis_error'] = str(e)
+    
+    timings['total'] = elapsed_ms(started)
+    caller = current_caller()
+    if caller is not None:
+        timings['queue_wait'] = caller.queue_wait_ms
+    result['timings'] = timings
+    result['prompt'] = prompt_reports[0]
+    return result
+
+def run_batch_generation(items):
+    """Analyze and generate tests for [(name, api_code)]; returns (zip buffer, manifest)."""
+    started = time.perf_counter()
+    with span('batch.parse', items=len(items)):
+        analyses = batch_scheduler.parse_all(analyze_source, [(api_code,) for _, api_code in items])
+    
+    entries = []
+    tasks = []
+    for index, ((name, api_code), (api_analysis, error)) in enumerate(zip(items, analyses)):
+        entry = {'index': index, 'name': name, 'status': 'failed' if error else 'succeeded'}
+        entries.append(entry)
+        if error:
+            entry['error'] = f"Failed to analyze API code: {error}"
+            continue
+        
+        controllers = [mapping['controller'] for mapping in api_analysis['mappings'] if mapping['controller']]
+        entry['name'] = name or (controllers[0] if controllers else f"Api{index + 1}")
+        entry['endpoint_count'] = api_analysis['endpoint_count']
+        tasks.append((entry, lambda api_code=api_code, api_analysis=api_analysis:
+                      granite_client.generate_test_cases(api_code, api_analysis)))
+    
+    with span('batch.generate', items=len(tasks)):
+        results = batch_scheduler.run([bind_caller(tracing.bind(task)) for _, task in tasks])
+    
+    files = []
+    used_names = set()
+    for (entry, _), (generated_tests, error) in zip(tasks, results):
+        if error:
+            entry['status'] = 'failed'
+            entry['error'] = str(error)
+            continue
+        test_filename = "".join(c if c.isalnum() or c in '-_' else '_' for c in entry['name'])
+        entry['filename'] = unique_filename(f"{test_filename}_Tests.java", used_names)
+        files.append((entry['filename'], generated_tests))
+    
+    manifest = {
+        'items': entries,
+        'total': len(entries),
+        'succeeded': sum(1 for entry in entries if entry['status'] == 'succeeded'),
+        'failed': sum(1 for entry in entries if entry['status'] == 'failed'),
+        'model_used': os.getenv('GRANITE_MODEL'),
+        'duration_ms': elapsed_ms(started)
+    }
+    return build_archive(files, manifest), manifest
+
+def record_error(e):
+    REQUEST_ERRORS.inc(endpoint=request.endpoint or 'unknown', error=type(e).__name__)
+
+def granite_error_response(e):
+    """JSON error with the HTTP status the watsonx failure maps to"""
+    record_error(e)
+    response = jsonify({'error': str(e), 'success': False})
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, e.http_status
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
@@ -30,18 +294,15 @@ def index():
                                  error="Granite client not initialized. Check your environment variables.")
         
         try:
-            # Analyze API structure
-            api_analysis = granite_client.analyze_api_structure(api_code)
-            
-            # Generate test cases
-            generated_tests = granite_client.generate_test_cases(api_code)
+            result = run_generation_pipeline(api_code)
             
             return render_template('index.html', 
-                                 generated_tests=generated_tests,
-                                 api_analysis=api_analysis,
+                                 generated_tests=result['generated_tests'],
+                                 api_analysis=result['api_analysis'],
                                  api_code=api_code)
         
         except Exception as e:
+            record_error(e)
             error_message = f"Error generating test cases: {str(e)}"
             print(f"❌ {error_message}")
             return render_template('index.html', 
@@ -54,7 +315,8 @@ def index():
 def api_generate():
     """API endpoint for programmatic access"""
     try:
-        data = request.get_json()
+        with span('request.read'):
+            data = request.get_json()
         api_code = data.get('api_code', '').strip()
         
         if not api_code:
@@ -63,26 +325,143 @@ def api_generate():
         if not granite_client:
             return jsonify({'error': 'Granite client not initialized'}), 500
         
-        # Analyze and generate
-        api_analysis = granite_client.analyze_api_structure(api_code)
-        generated_tests = granite_client.generate_test_cases(api_code)
+        result = run_generation_pipeline(api_code, deep_analysis=bool(data.get('deep_analysis')))
+        
+        return jsonify({
+            **result,
+            'model_used': os.getenv('GRANITE_MODEL'),
+            'success': True
+        })
+    
+    except GraniteError as e:
+        return granite_error_response(e)
+    except Exception as e:
+        record_error(e)
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/batch/generate', methods=['POST'])
+def api_batch_generate():
+    """Generate tests for a JSON array of api_code strings and return a zip"""
+    try:
+        try:
+            items = read_batch_items(request.get_json(silent=True), app.config['BATCH_MAX_ITEMS'])
+        except BatchError as e:
+            return jsonify({'error': str(e), 'success': False}), 400
+        
+        if not granite_client:
+            return jsonify({'error': 'Granite client not initialized'}), 500
+        
+        archive, manifest = run_batch_generation(items)
+        print(f"📦 Batch finished: {manifest['succeeded']} succeeded, {manifest['failed']} failed")
+        
+        response = send_file(archive, mimetype='application/zip', as_attachment=True,
+                             download_name='generated_tests.zip')
+        response.headers['X-Batch-Succeeded'] = str(manifest['succeeded'])
+        response.headers['X-Batch-Failed'] = str(manifest['failed'])
+        return response
+    
+    except Exception as e:
+        record_error(e)
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/async/generate', methods=['POST'])
+async def api_generate_async():
+    """Async variant of /api/generate backed by AsyncGraniteClient"""
+    try:
+        data = request.get_json()
+        api_code = data.get('api_code', '').strip()
+        
+        if not api_code:
+            return jsonify({'error': 'API code is required'}), 400
+        
+        if not async_granite_client:
+            return jsonify({'error': 'Granite client not initialized'}), 500
+        
+        with span('api.analysis'):
+            api_analysis = async_granite_client.analyze_api_structure(api_code)
+        prompt_reports = []
+        with span('generation'):
+            generated_tests = await async_granite_client.generate_test_cases(api_code, api_analysis, prompt_reports)
         
         return jsonify({
             'generated_tests': generated_tests,
             'api_analysis': api_analysis,
+            'prompt': prompt_reports[0],
             'model_used': os.getenv('GRANITE_MODEL'),
             'success': True
         })
     
+    except GraniteError as e:
+        return granite_error_response(e)
     except Exception as e:
+        record_error(e)
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/generate/stream', methods=['POST'])
+def api_generate_stream():
+    """Streaming variant of /api/generate using Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    api_code = data.get('api_code', '').strip()
+    
+    if not api_code:
+        return jsonify({'error': 'API code is required'}), 400
+    
+    if not granite_client:
+        return jsonify({'error': 'Granite client not initialized'}), 500
+    
+    def sse_event(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    caller = current_caller()
+    
+    def events():
+        api_analysis = granite_client.analyze_api_structure(api_code)
+        yield sse_event('meta', {
+            'api_analysis': api_analysis,
+            'model_used': os.getenv('GRANITE_MODEL')
+        })
+        
+        prompt_reports = []
+        try:
+            for chunk in granite_client.generate_test_cases_stream(api_code, api_analysis, prompt_reports):
+                yield sse_event('chunk', {'text': chunk})
+            yield sse_event('done', {'success': True, 'prompt': prompt_reports[0],
+                                     'queue_wait_ms': caller.queue_wait_ms})
+        except Exception as e:
+            REQUEST_ERRORS.inc(endpoint='api_generate_stream', error=type(e).__name__)
+            print(f"❌ Streaming generation failed: {e}")
+            yield sse_event('error', {'error': str(e), 'success': False})
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'granite_client': granite_client is not None,
+        'circuit_breaker': granite_client.circuit_breaker.stats() if granite_client else None,
+        'llm_scheduler': llm_scheduler.stats(),
+        'coalescing': granite_client.coalescer.stats() if granite_client else None,
+        'model': os.getenv('GRANITE_MODEL'),
+        'environment': os.getenv('FLASK_ENV', 'production')
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of every worker's metrics (see METRICS_MULTIPROC_DIR)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/async/health')
+async def health_check_async():
+    """Health check for the async client"""
+    return jsonify({
+        'status': 'healthy',
+        'granite_client': async_granite_client is not None,
+        'async_client': async_granite_client.stats() if async_granite_client else None,
         'model': os.getenv('GRANITE_MODEL'),
         'environment': os.getenv('FLASK_ENV', 'production')
     })
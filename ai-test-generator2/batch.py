@@ -0,0 +1,163 @@
+import atexit
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class BatchError(ValueError):
+    pass
+
+
+def read_batch_items(payload, max_items):
+    """Return [(name, api_code)] from a JSON batch request.
+
+    payload is a list, or an object with an "items" list, whose entries are
+    api_code strings or {"name": ..., "api_code": ...} objects.
+    """
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise BatchError('Expected a non-empty JSON array of api_code strings')
+    if len(items) > max_items:
+        raise BatchError(f"Batch contains {len(items)} items; the limit is {max_items}")
+
+    batch = []
+    for index, item in enumerate(items):
+        name = None
+        if isinstance(item, dict):
+            name = item.get('name')
+            item = item.get('api_code')
+            if name is not None and not isinstance(name, str):
+                raise BatchError(f"Item {index} has a name that is not a string")
+        if not isinstance(item, str) or not item.strip():
+            raise BatchError(f"Item {index} has no api_code")
+        batch.append((name, item.strip()))
+    return batch
+
+
+def unique_filename(name, used):
+    stem, extension = os.path.splitext(name)
+    candidate = name
+    suffix = 2
+    while candidate in used:
+        candidate = f"{stem}_{suffix}{extension}"
+        suffix += 1
+    used.add(candidate)
+    return candidate
+
+
+def build_archive(files, manifest):
+    """Zip [(filename, text)] together with manifest.json."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, text in files:
+            archive.writestr(filename, text)
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    buffer.seek(0)
+    return buffer
+
+
+def _process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class BatchScheduler:
+    """Shares one bounded pool between every batch in the process.
+
+    Analysis runs in a process pool so large sources do not hold the GIL.
+    Generation tasks run on a thread pool of max_workers, and each batch
+    keeps at most per_batch_limit tasks queued or running at a time, so
+    concurrent batches interleave instead of one draining the pool first.
+
+    The process pool is started on first use, from a request thread, so
+    its processes come from a forkserver (spawn where that is missing):
+    fork() there would copy locks that other threads hold at that moment.
+    """
+
+    def __init__(self, max_workers=8, per_batch_limit=4, parse_workers=2):
+        self.max_workers = max_workers
+        self.per_batch_limit = max(1, min(per_batch_limit, max_workers))
+        self.parse_workers = parse_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-generation')
+        self._parse_pool = None
+        self._lock = threading.Lock()
+        self._active_batches = 0
+
+    def parse_all(self, fn, items):
+        """Run fn(*item) for each item; returns [(result, error)] in order."""
+        if not self.parse_workers or len(items) < 2:
+            return [self._capture(fn, *item) for item in items]
+
+        with self._lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=_process_context())
+                atexit.register(self.shutdown)
+            pool = self._parse_pool
+
+        futures = [pool.submit(fn, *item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def run(self, tasks):
+        """Run callables on the shared pool; returns [(result, error)] in order."""
+        slots = threading.Semaphore(self.per_batch_limit)
+        futures = []
+
+        with self._lock:
+            self._active_batches += 1
+        try:
+            for task in tasks:
+                slots.acquire()
+                future = self._executor.submit(self._capture, task)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            return [future.result() for future in futures]
+        finally:
+            with self._lock:
+                self._active_batches -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_batches': self._active_batches,
+                'max_workers': self.max_workers,
+                'per_batch_limit': self.per_batch_limit,
+                'parse_workers': self.parse_workers
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(wait=False)
+                self._parse_pool = None
+
+    def after_fork(self):
+        """Forget a process pool inherited from the parent; the next parse_all() starts one.
+
+        Its processes are the parent's children, so only the parent can shut
+        them down.
+        """
+        self._lock = threading.Lock()
+        self._parse_pool = None
+
+    @staticmethod
+    def _capture(fn, *args):
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
@@ -0,0 +1,130 @@
+"""Benchmark API structure analysis on synthetic Spring controller sources.
+
+Compares the previous line-splitting analyze_api_structure with the
+single-pass api_scanner on pasted sources of increasing size, and
+optionally on a directory of controllers.
+
+Usage:
+    python benchmark_api_scanner.py
+    python benchmark_api_scanner.py --sizes 10 1000 --repeat 5
+    python benchmark_api_scanner.py --directory path/to/src/main/java
+"""
+import argparse
+import time
+
+import api_scanner
+
+
+def legacy_analyze_api_structure(api_code):
+    """The line-based analysis GraniteClient used before api_scanner."""
+    endpoints = []
+    lines = api_code.split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if any(annotation in line for annotation in ['@GetMapping', '@PostMapping', '@PutMapping', '@DeleteMapping']):
+            endpoints.append(line)
+
+    return {
+        "endpoint_count": len(endpoints),
+        "endpoints": endpoints,
+        "has_path_variables": "{" in api_code and "}" in api_code,
+        "has_request_body": "@RequestBody" in api_code,
+        "has_validation": "@Valid" in api_code
+    }
+
+
+CONTROLLER_TEMPLATE = '''package com.example.api.resource{index};
+
+import org.springframework.http.ResponseEntity;
+import org.springframework.web.bind.annotation.*;
+
+/**
+ * Controller for resource {index}. Example: {{@code GET /api/resources{index}/1}}
+ */
+@RestController
+@RequestMapping("/api/resources{index}")
+public class Resource{index}Controller {{
+
+    private static final String NOT_FOUND = "Resource {{id}} not found";
+
+    @GetMapping
+    public List<Resource> list(@RequestParam(defaultValue = "0") int page) {{
+        return service.list(page);
+    }}
+
+    @GetMapping("/{{id}}")
+    public ResponseEntity<Resource> get(@PathVariable Long id) {{
+        return service.find(id).map(ResponseEntity::ok).orElseThrow(() -> new NotFound(NOT_FOUND));
+    }}
+
+    @PostMapping(
+        consumes = "application/json",
+        produces = "application/json"
+    )
+    public Resource create(@Valid @RequestBody CreateResourceRequest request) {{
+        return service.create(request);
+    }}
+
+    @RequestMapping(value = "/{{id}}", method = RequestMethod.PUT)
+    public Resource replace(@PathVariable Long id, @RequestBody @Valid ResourceDto body) {{
+        return service.replace(id, body);
+    }}
+
+    @PatchMapping("/{{id}}/status")
+    public Resource status(@PathVariable Long id, @RequestBody Map<String, String> patch) {{
+        return service.patch(id, patch);
+    }}
+
+    @DeleteMapping("/{{id}}")
+    public void delete(@PathVariable Long id) {{
+        service.delete(id);
+    }}
+}}
+'''
+
+
+def build_source(controller_count):
+    return '\n'.join(CONTROLLER_TEMPLATE.format(index=i) for i in range(controller_count))
+
+
+def best_of(repeat, fn):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def report(label, seconds, size_bytes, endpoint_count):
+    mb_per_second = size_bytes / (1024 * 1024) / seconds if seconds else float('inf')
+    print(f"  {label:<22} {seconds * 1000:10.1f} ms  {mb_per_second:8.1f} MB/s  {endpoint_count:7d} endpoints")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='number of controllers concatenated into one source')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--directory', help='also scan every .java file under this directory')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        source = build_source(size)
+        print(f"\n{size} controllers  ({len(source) / 1024:.0f} KB, {size * 6} mappings)")
+
+        seconds, result = best_of(args.repeat, lambda: legacy_analyze_api_structure(source))
+        report('legacy line scan', seconds, len(source), result['endpoint_count'])
+        seconds, result = best_of(args.repeat, lambda: api_scanner.analyze_source(source))
+        report('api_scanner', seconds, len(source), result['endpoint_count'])
+
+    if args.directory:
+        print(f"\nDirectory {args.directory}")
+        seconds, result = best_of(args.repeat, lambda: api_scanner.scan_directory(args.directory))
+        print(f"  scan_directory         {seconds * 1000:10.1f} ms  {result['endpoint_count']:7d} endpoints")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import re
+
+# Least to most lossy; mapping annotations and handler signatures survive
+# every step, so the prompt still shows each endpoint and its parameters
+COMPACTION_STEPS = ('strip_comments', 'drop_imports', 'summarize_enums', 'drop_method_bodies')
+ENUM_SUMMARY_LIMIT = 8
+
+# Comments and literals are matched whole so that braces, parentheses and
+# separators inside them are never taken for code.
+TOKEN_PATTERN = re.compile(
+    r'(?P<comment>//[^\n]*|/\*.*?\*/)'
+    r'|(?P<literal>"""(?:[^\\]|\\.)*?"""|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)+\')'
+    r'|[{}();,]',
+    re.DOTALL
+)
+TYPE_DECLARATION_PATTERN = re.compile(r'(?<![\w.])(class|interface|enum|record)\s+[A-Za-z_]\w*')
+IMPORT_PATTERN = re.compile(r'^[ \t]*(?:package|import)\s[^;\n]*;[ \t]*\n?', re.MULTILINE)
+TRAILING_SPACE_PATTERN = re.compile(r'[ \t]+$', re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r'\n{3,}')
+
+
+class _Compaction:
+    """Per-source state for compact_source; collects (start, end, replacement) cuts."""
+
+    def __init__(self, source, steps):
+        self.source = source
+        self.steps = steps
+        self.cuts = []
+        self.braces = []            # [(kind, offset after the brace)], kind is type, enum, body or block
+        self.parens = 0
+        self.statement = []         # code since the last ; { or }, without comments and literals
+        self.enum_depth = None      # brace depth of the enum whose constants are being read
+        self.commas = []            # offsets of the commas between those constants
+
+    def open_brace(self, offset):
+        declaration = None
+        if self.parens == 0:
+            declaration = TYPE_DECLARATION_PATTERN.search(''.join(self.statement))
+
+        if declaration:
+            kind = 'enum' if declaration.group(1) == 'enum' else 'type'
+        elif self.parens == 0 and self.braces and self.braces[-1][0] in ('type', 'enum'):
+            # Method, constructor and initializer bodies, or an enum constant's class body
+            kind = 'body'
+        else:
+            kind = 'block'
+        self.braces.append((kind, offset))
+
+        if kind == 'enum' and 'summarize_enums' in self.steps:
+            self.enum_depth = len(self.braces)
+            self.commas = []
+
+    def close_brace(self, offset):
+        self.end_enum_constants(offset)
+        if not self.braces:
+            return
+        kind, opened = self.braces.pop()
+        if kind == 'body' and 'drop_method_bodies' in self.steps:
+            self.cuts.append((opened, offset, ' ... '))
+
+    def comma(self, offset):
+        if self.enum_depth == len(self.braces) and self.parens == 0:
+            self.commas.append(offset)
+
+    def end_enum_constants(self, offset):
+        """Keep the first ENUM_SUMMARY_LIMIT constants of the enum that ends its list at offset."""
+        if self.enum_depth != len(self.braces) or self.parens != 0:
+            return
+        self.enum_depth = None
+
+        count = len(self.commas)
+        if self.commas and self.source[self.commas[-1] + 1:offset].strip():
+            count += 1
+        if count <= ENUM_SUMMARY_LIMIT:
+            return
+
+        start = self.commas[ENUM_SUMMARY_LIMIT - 1]
+        hidden = self.source[start:offset]
+        trailing = hidden[len(hidden.rstrip()):]
+        self.cuts.append((start, offset, f" /* {count - ENUM_SUMMARY_LIMIT} more */" + trailing))
+
+    def apply(self):
+        pieces = []
+        position = 0
+        for start, end, replacement in sorted(self.cuts):
+            if start < position:
+                # Inside a larger cut, e.g. a comment in a dropped method body
+                continue
+            pieces.append(self.source[position:start])
+            pieces.append(replacement)
+            position = end
+        pieces.append(self.source[position:])
+        return ''.join(pieces)
+
+
+def compact_source(source, steps=()):
+    """Return Java source with the named COMPACTION_STEPS applied.
+
+    Type, field and method declarations and their annotations are kept;
+    drop_method_bodies replaces each body with '{ ... }' and
+    summarize_enums keeps the first ENUM_SUMMARY_LIMIT constants.
+    """
+    steps = frozenset(steps)
+    if not steps:
+        return source
+    if 'drop_imports' in steps:
+        source = IMPORT_PATTERN.sub('', source)
+
+    compaction = _Compaction(source, steps)
+    last_end = 0
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'comment':
+            if 'strip_comments' in steps:
+                compaction.cuts.append((match.start(), match.end(), ''))
+            last_end = match.end()
+            continue
+
+        compaction.statement.append(source[last_end:match.start()])
+        last_end = match.end()
+        if kind == 'literal':
+            continue
+
+        token = match.group()
+        if token == '(':
+            compaction.parens += 1
+        elif token == ')':
+            compaction.parens = max(0, compaction.parens - 1)
+        elif token == ',':
+            compaction.comma(match.start())
+        elif token == ';':
+            compaction.end_enum_constants(match.start())
+            compaction.statement = []
+        elif token == '{':
+            compaction.open_brace(match.end())
+            compaction.statement = []
+        else:
+            compaction.close_brace(match.start())
+            compaction.statement = []
+
+    text = TRAILING_SPACE_PATTERN.sub('', compaction.apply())
+    return BLANK_LINES_PATTERN.sub('\n\n', text).strip('\n') + '\n'
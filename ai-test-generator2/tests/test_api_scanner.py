@@ -0,0 +1,172 @@
+import os
+
+from api_scanner import analyze_source, mapping_paths, scan_directory, scan_source
+
+CONTROLLER = '''package com.example.api;
+
+@RestController
+@RequestMapping("/api/users")
+public class UserController {
+
+    // @GetMapping("/commented-out")
+    private static final String DOC = "@PostMapping(\\"/in-a-string\\") }";
+
+    @GetMapping("/{id}")
+    public ResponseEntity<User> getUser(@PathVariable Long id) {
+        if (id < 0) { throw new IllegalArgumentException("}"); }
+        return ResponseEntity.ok(service.find(id));
+    }
+
+    @PostMapping(
+        value = "/",
+        consumes = "application/json"
+    )
+    public User createUser(@Valid @RequestBody UserDto user) {
+        return service.create(user);
+    }
+
+    @RequestMapping(path = "/{id}/roles/{role}", method = {RequestMethod.PUT, RequestMethod.DELETE})
+    public void changeRole(@PathVariable Long id, @PathVariable String role) {
+        String block = """
+            @DeleteMapping("/in-a-text-block")
+            """;
+    }
+
+    @RequestMapping("/legacy")
+    public void legacy() {}
+}
+'''
+
+
+def endpoints_of(source):
+    return [(e['method'], e['path']) for e in scan_source(source)[0]]
+
+
+def test_controller_mappings():
+    endpoints, flags = scan_source(CONTROLLER, 'UserController.java')
+    assert [(e['method'], e['path'], e['handler']) for e in endpoints] == [
+        ('GET', '/api/users/{id}', 'getUser'),
+        ('POST', '/api/users', 'createUser'),
+        ('PUT', '/api/users/{id}/roles/{role}', 'changeRole'),
+        ('DELETE', '/api/users/{id}/roles/{role}', 'changeRole'),
+        ('ANY', '/api/users/legacy', 'legacy')
+    ]
+    get, post, put = endpoints[:3]
+    assert get['path_variables'] == ['id'] and get['line'] == 10
+    assert get['controller'] == 'UserController' and get['file'] == 'UserController.java'
+    assert post['request_body'] == 'UserDto' and post['validated']
+    assert put['path_variables'] == ['id', 'role'] and put['request_body'] is None
+    assert flags == {'has_request_body': True, 'has_validation': True}
+
+
+def test_mapping_paths():
+    assert mapping_paths(None) == ['']
+    assert mapping_paths('"/users"') == ['/users']
+    assert mapping_paths('value = "/users", produces = "application/json"') == ['/users']
+    assert mapping_paths('produces = "application/json", path = {"/a", "/b"}') == ['/a', '/b']
+    assert mapping_paths('{"/a", "/b"}') == ['/a', '/b']
+    assert mapping_paths('produces = "application/json"') == ['']
+
+
+def test_array_paths_give_one_endpoint_each():
+    source = '@RestController\n@RequestMapping({"/v1", "/v2"})\nclass Api {\n' \
+             '    @GetMapping({"/a", "/b"}) public void get() {}\n}\n'
+    assert endpoints_of(source) == [('GET', '/v1/a'), ('GET', '/v1/b'), ('GET', '/v2/a'), ('GET', '/v2/b')]
+
+
+def test_nested_types_and_interfaces():
+    source = '''
+@RequestMapping("/outer")
+public class Api {
+    @GetMapping("/list") List<Item> list() { return items; }
+
+    @RequestMapping("/inner")
+    static class Inner {
+        @PatchMapping("/{id:[0-9]+}") void patch(@RequestBody Map<String, Item> items) {}
+    }
+
+    @DeleteMapping("/{id}") void delete(@PathVariable long id) {}
+}
+
+@RequestMapping("/client")
+interface Client {
+    @GetMapping("/{id}")
+    Item get(@PathVariable("id") long id);
+}
+'''
+    endpoints, _ = scan_source(source)
+    assert [(e['method'], e['path'], e['controller']) for e in endpoints] == [
+        ('GET', '/outer/list', 'Api'),
+        ('PATCH', '/inner/{id:[0-9]+}', 'Inner'),
+        ('DELETE', '/outer/{id}', 'Api'),
+        ('GET', '/client/{id}', 'Client')
+    ]
+    assert endpoints[1]['path_variables'] == ['id']
+    assert endpoints[1]['request_body'] == 'Map<String, Item>'
+    assert endpoints[3]['handler'] == 'get'
+
+
+def test_analyze_source_summary():
+    summary = analyze_source(CONTROLLER)
+    assert summary['endpoint_count'] == 5
+    assert summary['has_path_variables']
+    assert summary['endpoints'][1] == 'POST /api/users (body: UserDto, validated, handler: createUser)'
+    assert len(summary['mappings']) == 5
+
+
+def test_scan_directory(tmp_path):
+    (tmp_path / 'web').mkdir()
+    (tmp_path / 'web' / 'UserController.java').write_text(CONTROLLER)
+    (tmp_path / 'web' / 'User.java').write_text('class User { String name; }')
+    (tmp_path / 'README.md').write_text('@GetMapping("/not-java")')
+    summary = scan_directory(tmp_path)
+    assert summary['endpoint_count'] == 5
+    assert {e['file'] for e in summary['mappings']} == {os.path.join('web', 'UserController.java')}
+
+
+def test_array_paths_with_path_variables():
+    assert mapping_paths('{"/{id}", "/legacy/{id}"}') == ['/{id}', '/legacy/{id}']
+    assert mapping_paths('value = {"/{id}"}, produces = "application/json"') == ['/{id}']
+    assert mapping_paths('path = {"/{id:[0-9]+}", }') == ['/{id:[0-9]+}']
+    source = '''
+@RestController
+@RequestMapping("/users")
+class UserController {
+    @GetMapping({"/{id}", "/legacy/{id}"})
+    public User get(@PathVariable long id) { return null; }
+
+    @PutMapping(value = {"/{id}"})
+    public void put(@PathVariable long id, @RequestBody User user) {}
+}
+'''
+    endpoints, _ = scan_source(source)
+    assert [(e['method'], e['path'], e['path_variables']) for e in endpoints] == [
+        ('GET', '/users/{id}', ['id']),
+        ('GET', '/users/legacy/{id}', ['id']),
+        ('PUT', '/users/{id}', ['id'])
+    ]
+
+
+def test_every_bodiless_interface_method_is_kept():
+    source = '''
+@RequestMapping("/pets")
+public interface PetClient {
+    @GetMapping
+    List<Pet> list();
+
+    @GetMapping("/{id}")
+    Pet get(@PathVariable("id") long id);
+
+    @DeleteMapping("/{id}")
+    void delete(@PathVariable("id") long id);
+
+    @RequestMapping("/inner")
+    class Inner {}
+}
+'''
+    endpoints, _ = scan_source(source)
+    assert [(e['method'], e['path'], e['handler']) for e in endpoints] == [
+        ('GET', '/pets', 'list'),
+        ('GET', '/pets/{id}', 'get'),
+        ('DELETE', '/pets/{id}', 'delete')
+    ]
@@ -0,0 +1,107 @@
+from source_compactor import COMPACTION_STEPS, ENUM_SUMMARY_LIMIT, compact_source
+
+CONTROLLER = '''package com.example.api;
+
+import org.springframework.web.bind.annotation.*;
+import java.util.List;
+
+/** Users API */
+@RestController
+@RequestMapping("/api/users")
+public class UserController {
+    // injected; see "}" handling
+    private final UserService userService;
+
+    @GetMapping("/{id}")
+    public ResponseEntity<User> getUser(@PathVariable Long id) {
+        String brace = "}{;";
+        if (id < 0) { throw new IllegalArgumentException("bad id: }"); }
+        return ResponseEntity.ok(userService.findById(id));
+    }
+
+    @PostMapping(consumes = "application/json")
+    public ResponseEntity<User> createUser(@Valid @RequestBody User user, @RequestParam(defaultValue = "a,b") String tags) {
+        /* } not the end */
+        return ResponseEntity.status(HttpStatus.CREATED).body(userService.save(user));
+    }
+}
+'''
+
+STATUS_ENUM = '''public enum Status {
+    ACTIVE("a", 1) {
+        @Override public String label() { return "Active, really"; }
+    },
+    B("b", 2), C("c", 3), D("d", 4), E("e", 5), F("f", 6), G("g", 7), H("h", 8), I("i", 9), J("j", 10);
+
+    private final String code;
+    Status(String code, int rank) { this.code = code; }
+    public String label() { return code; }
+}
+'''
+
+
+def test_no_steps_returns_source_unchanged():
+    assert compact_source(CONTROLLER) == CONTROLLER
+
+
+def test_all_steps_keep_mappings_and_signatures():
+    assert compact_source(CONTROLLER, COMPACTION_STEPS) == '''@RestController
+@RequestMapping("/api/users")
+public class UserController {
+
+    private final UserService userService;
+
+    @GetMapping("/{id}")
+    public ResponseEntity<User> getUser(@PathVariable Long id) { ... }
+
+    @PostMapping(consumes = "application/json")
+    public ResponseEntity<User> createUser(@Valid @RequestBody User user, @RequestParam(defaultValue = "a,b") String tags) { ... }
+}
+'''
+
+
+def test_strip_comments_leaves_literals_alone():
+    compacted = compact_source(CONTROLLER, ['strip_comments'])
+    assert '/** Users API */' not in compacted
+    assert '// injected' not in compacted
+    assert '/* } not the end */' not in compacted
+    assert 'String brace = "}{;";' in compacted
+    assert 'import java.util.List;' in compacted
+
+
+def test_drop_imports_only_removes_package_and_imports():
+    compacted = compact_source(CONTROLLER, ['drop_imports'])
+    assert not compacted.startswith('package')
+    assert 'import ' not in compacted
+    assert compacted.startswith('/** Users API */\n@RestController')
+
+
+def test_summarize_enums_keeps_first_constants_and_constant_bodies():
+    compacted = compact_source(STATUS_ENUM, ['summarize_enums'])
+    assert '@Override public String label() { return "Active, really"; }' in compacted
+    assert 'H("h", 8) /* 2 more */;' in compacted
+    assert 'I("i", 9)' not in compacted
+    assert 'Status(String code, int rank) { this.code = code; }' in compacted
+
+
+def test_summarize_enums_with_every_step():
+    assert compact_source(STATUS_ENUM, COMPACTION_STEPS) == '''public enum Status {
+    ACTIVE("a", 1) { ... },
+    B("b", 2), C("c", 3), D("d", 4), E("e", 5), F("f", 6), G("g", 7), H("h", 8) /* 2 more */;
+
+    private final String code;
+    Status(String code, int rank) { ... }
+    public String label() { ... }
+}
+'''
+
+
+def test_short_enums_are_kept_whole():
+    constants = ', '.join(f"V{index}" for index in range(ENUM_SUMMARY_LIMIT))
+    source = f"enum Short {{ {constants} }}\n"
+    assert compact_source(source, ['summarize_enums']) == source
+
+
+def test_enum_without_trailing_semicolon():
+    source = 'enum Letter { A, B, C, D, E, F, G, H, I, J, K }\n'
+    assert compact_source(source, ['summarize_enums']) == 'enum Letter { A, B, C, D, E, F, G, H /* 3 more */ }\n'
@@ -0,0 +1,255 @@
+"""Open-loop load generator for the test generator apps.
+
+Sends requests at a fixed target rate, whether or not earlier requests have
+finished, and reports latency percentiles, throughput and error rates.
+Latency is measured from each request's scheduled start, so queueing in
+the client counts against the app (no coordinated omission).
+
+Targets:
+  generate      ai-test-generator   POST /generate (multipart spec upload)
+  api-generate  ai-test-generator2  POST /api/generate (JSON api_code)
+
+Usage:
+    python perf/load_test.py --url http://127.0.0.1:5000 --target generate --rps 5 --duration 60
+    python perf/load_test.py --url http://127.0.0.1:5001 --target api-generate --rps 2 \\
+        --max-p95 30 --max-error-rate 0.01 --json results.json
+
+Exits with status 1 when --max-p95 / --max-p99 / --max-error-rate are
+exceeded, so it can gate CI runs against perf/watsonx_stub.py.
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_SPEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                            'ai-test-generator', 'sample_specs', 'petstore.yaml')
+
+DEFAULT_API_CODE = """@RestController
+@RequestMapping("/api/users")
+public class UserController {
+
+    @GetMapping("/{id}")
+    public ResponseEntity<User> getUser(@PathVariable Long id) {
+        return ResponseEntity.ok(userService.findById(id));
+    }
+
+    @PostMapping
+    public ResponseEntity<User> createUser(@Valid @RequestBody User user) {
+        return ResponseEntity.status(HttpStatus.CREATED).body(userService.save(user));
+    }
+
+    @DeleteMapping("/{id}")
+    public ResponseEntity<Void> deleteUser(@PathVariable Long id) {
+        userService.delete(id);
+        return ResponseEntity.noContent().build();
+    }
+}
+"""
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Target:
+    """Builds the request for one target endpoint."""
+
+    def __init__(self, name, url, payload_path=None, unique=False):
+        self.name = name
+        self.unique = unique
+        if name == 'generate':
+            self.url = url.rstrip('/') + '/generate'
+            path = payload_path or DEFAULT_SPEC
+            with open(path, 'rb') as f:
+                self.payload = f.read()
+            self.filename = os.path.basename(path)
+            if unique:
+                import yaml
+                # YAML is a superset of JSON, so this reads either kind of spec
+                self.spec = yaml.safe_load(self.payload)
+        else:
+            self.url = url.rstrip('/') + '/api/generate'
+            if payload_path:
+                with open(payload_path, encoding='utf-8') as f:
+                    self.payload = f.read()
+            else:
+                self.payload = DEFAULT_API_CODE
+
+    def send(self, session, sequence, timeout):
+        if self.name == 'generate':
+            files = {'file': (self.filename, self.payload)}
+            if self.unique:
+                # The title always reaches the prompt, so every request misses
+                # the generation cache and is never coalesced with another
+                info = dict(self.spec.get('info') or {})
+                info['title'] = f"{info.get('title', 'API')} {sequence}"
+                payload = json.dumps(dict(self.spec, info=info), default=str).encode('utf-8')
+                files = {'file': (f"{os.path.splitext(self.filename)[0]}.json", payload)}
+            return session.post(self.url, files=files, timeout=timeout)
+
+        api_code = self.payload
+        if self.unique:
+            # An extra endpoint survives source compaction, unlike a comment,
+            # so the prompt differs as well
+            head, _, tail = api_code.rpartition('}')
+            api_code = (f"{head}\n    @GetMapping(\"/load-test-{sequence}\")\n"
+                        f"    public ResponseEntity<Void> loadTest{sequence}() {{\n"
+                        f"        return ResponseEntity.ok().build();\n    }}\n}}{tail}")
+        return session.post(self.url, json={'api_code': api_code}, timeout=timeout)
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.service_times = []
+        self.outcomes = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, latency, service_time, outcome):
+        with self.lock:
+            if outcome == 'ok':
+                self.latencies.append(latency)
+                self.service_times.append(service_time)
+            self.outcomes[outcome] += 1
+
+    def summary(self, elapsed, offered):
+        latencies = sorted(self.latencies)
+        service_times = sorted(self.service_times)
+        completed = sum(self.outcomes.values())
+        errors = completed - self.outcomes['ok']
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            'offered': offered,
+            'completed': completed,
+            'succeeded': self.outcomes['ok'],
+            'errors': errors,
+            'error_rate': round(errors / completed, 4) if completed else 0.0,
+            'outcomes': dict(self.outcomes),
+            'duration_s': round(elapsed, 2),
+            'throughput_rps': round(self.outcomes['ok'] / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 0.50)),
+                'p95': ms(percentile(latencies, 0.95)),
+                'p99': ms(percentile(latencies, 0.99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+            'service_time_ms': {
+                'p50': ms(percentile(service_times, 0.50)),
+                'p95': ms(percentile(service_times, 0.95)),
+            }
+        }
+
+
+def run_load(target, rps, duration, concurrency, timeout, warmup=0.0):
+    """Drive target at rps for duration seconds; returns the summary dict."""
+    results = Results()
+    sessions = threading.local()
+    interval = 1.0 / rps
+    total = int(rps * duration)
+
+    def session():
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        return sessions.session
+
+    def fire(sequence, scheduled, measured):
+        started = time.perf_counter()
+        try:
+            response = target.send(session(), sequence, timeout)
+            outcome = 'ok' if response.status_code < 400 else f"http_{response.status_code}"
+            response.close()
+        except requests.Timeout:
+            outcome = 'timeout'
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        finished = time.perf_counter()
+        if measured:
+            results.record(finished - scheduled, finished - started, outcome)
+
+    warmup_requests = int(rps * warmup)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as pool:
+        start = time.perf_counter() + 0.05
+        for sequence in range(warmup_requests + total):
+            scheduled = start + sequence * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, sequence, scheduled, sequence >= warmup_requests)
+        measured_start = start + warmup_requests * interval
+    elapsed = time.perf_counter() - measured_start
+
+    return results.summary(elapsed, total)
+
+
+def print_summary(target, rps, summary):
+    latency = summary['latency_ms']
+    print(f"{target.name} -> {target.url}")
+    print(f"  offered {summary['offered']} requests at {rps} rps over {summary['duration_s']} s")
+    print(f"  succeeded {summary['succeeded']}  errors {summary['errors']}"
+          f"  error rate {summary['error_rate'] * 100:.2f}%  {summary['outcomes']}")
+    print(f"  throughput {summary['throughput_rps']} req/s")
+    print(f"  latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"  service time ms  p50 {summary['service_time_ms']['p50']}  p95 {summary['service_time_ms']['p95']}")
+
+
+def check_thresholds(summary, args):
+    failures = []
+    latency = summary['latency_ms']
+    if args.max_p95 is not None and (latency['p95'] is None or latency['p95'] > args.max_p95 * 1000):
+        failures.append(f"p95 {latency['p95']} ms exceeds {args.max_p95} s")
+    if args.max_p99 is not None and (latency['p99'] is None or latency['p99'] > args.max_p99 * 1000):
+        failures.append(f"p99 {latency['p99']} ms exceeds {args.max_p99} s")
+    if args.max_error_rate is not None and summary['error_rate'] > args.max_error_rate:
+        failures.append(f"error rate {summary['error_rate']} exceeds {args.max_error_rate}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="base URL of the app under test")
+    parser.add_argument("--target", choices=["generate", "api-generate"], default="generate")
+    parser.add_argument("--payload", help="spec file for generate, Java source for api-generate")
+    parser.add_argument("--unique", action="store_true",
+                        help="make every prompt distinct, so each request reaches watsonx instead of "
+                             "the generation cache or an identical in-flight call")
+    parser.add_argument("--rps", type=float, default=2.0, help="target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=0.0, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--json", dest="json_path", help="also write the summary to this file")
+    parser.add_argument("--max-p95", type=float, help="fail if p95 latency exceeds this many seconds")
+    parser.add_argument("--max-p99", type=float, help="fail if p99 latency exceeds this many seconds")
+    parser.add_argument("--max-error-rate", type=float, help="fail if the error fraction exceeds this")
+    args = parser.parse_args()
+
+    target = Target(args.target, args.url, args.payload, args.unique)
+    summary = run_load(target, args.rps, args.duration, args.concurrency, args.timeout, args.warmup)
+    print_summary(target, args.rps, summary)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'target': args.target, 'url': target.url, 'rps': args.rps, **summary}, f, indent=2)
+
+    failures = check_thresholds(summary, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Local stand-in for IBM IAM and the watsonx.ai text generation API.
+
+Serves the endpoints the apps call, with realistic pacing and injectable
+failures, so both apps can be benchmarked without IBM credentials:
+
+  POST /identity/token                     IAM API key -> bearer token
+  POST /ml/v1/text/generation              JSON generation result
+  POST /ml/v1/text/generation_stream       Server-Sent Events, one event per chunk
+  POST /ml/v1/text/tokenization            token count of the input
+  GET  /stats                              request and failure counters
+
+A generation waits --latency seconds (time to first token), then produces
+min(max_new_tokens, --generated-tokens) tokens at --tokens-per-second.
+--error-rate and --rate-limit-rate fail that fraction of generation calls
+with --error-status or 429 + Retry-After; --rpm-limit returns 429 once the
+rolling one-minute request count is exceeded.
+
+Usage:
+    python perf/watsonx_stub.py --port 8081 --latency 0.5 --tokens-per-second 80
+    python perf/watsonx_stub.py --error-rate 0.05 --rate-limit-rate 0.02 --seed 1
+
+then start an app with the environment the stub prints, e.g.
+    WATSONX_URL=http://127.0.0.1:8081 IBM_IAM_URL=http://127.0.0.1:8081/identity/token
+"""
+import argparse
+import collections
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# watsonx counts roughly four characters of code per token
+CHARS_PER_TOKEN = 4
+
+TEST_CLASS_HEADER = """import io.restassured.RestAssured;
+import org.junit.jupiter.api.*;
+import static io.restassured.RestAssured.given;
+import static org.hamcrest.Matchers.*;
+
+public class StubApiTest {
+
+    @BeforeEach
+    void setUp() {
+        RestAssured.baseURI = "http://localhost:8080";
+    }
+"""
+
+TEST_METHOD = """
+    @Test
+    @DisplayName("Stub scenario {index}")
+    void testStubScenario{index}ReturnsOk() {{
+        given().contentType("application/json")
+            .when().get("/stub/{index}")
+            .then().statusCode(200).body("id", equalTo({index}));
+    }}
+"""
+
+
+def generated_text(tokens):
+    """A complete JUnit class of at least `tokens` tokens' worth of text."""
+    target = tokens * CHARS_PER_TOKEN
+    parts = [TEST_CLASS_HEADER]
+    size = len(TEST_CLASS_HEADER) + 2
+    index = 1
+    while size < target:
+        method = TEST_METHOD.format(index=index)
+        parts.append(method)
+        size += len(method)
+        index += 1
+    parts.append("}\n")
+    return "".join(parts)
+
+
+class StubConfig:
+    def __init__(self, latency=0.2, tokens_per_second=50.0, generated_tokens=400, error_rate=0.0,
+                 error_status=503, rate_limit_rate=0.0, retry_after=1, rpm_limit=0, token_ttl=3600,
+                 jitter=0.1, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.generated_tokens = generated_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rpm_limit = rpm_limit
+        self.token_ttl = token_ttl
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+
+class StubState:
+    def __init__(self, config):
+        self.config = config
+        self.tokens = {}
+        self.counters = collections.Counter()
+        self.recent = collections.deque()
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def issue_token(self):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[token] = time.time() + self.config.token_ttl
+        return token
+
+    def token_is_valid(self, token):
+        with self.lock:
+            return time.time() < self.tokens.get(token, 0)
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def injected_failure(self):
+        """(status, headers) for a generation call that should fail, else None."""
+        config = self.config
+        now = time.monotonic()
+        with self.lock:
+            if config.rpm_limit:
+                while self.recent and now - self.recent[0] > 60:
+                    self.recent.popleft()
+                if len(self.recent) >= config.rpm_limit:
+                    wait = max(1, int(60 - (now - self.recent[0])) + 1)
+                    return 429, {"Retry-After": str(wait)}
+                self.recent.append(now)
+            roll = config.random.random()
+        if roll < config.rate_limit_rate:
+            return 429, {"Retry-After": str(config.retry_after)}
+        if roll < config.rate_limit_rate + config.error_rate:
+            return config.error_status, {}
+        return None
+
+    def jittered(self, seconds):
+        if not self.config.jitter:
+            return seconds
+        with self.lock:
+            factor = self.config.random.uniform(1 - self.config.jitter, 1 + self.config.jitter)
+        return seconds * factor
+
+    def stats(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'in_flight': self.in_flight}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/stats":
+            return self.send_json(200, self.state.stats())
+        self.send_json(404, {"errors": [{"code": "not_found", "message": self.path}]})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlsplit(self.path).path
+
+        if path == "/identity/token":
+            self.state.count("iam")
+            return self.send_json(200, {
+                "access_token": self.state.issue_token(),
+                "refresh_token": "not_supported",
+                "token_type": "Bearer",
+                "expires_in": self.state.config.token_ttl,
+                "expiration": int(time.time()) + self.state.config.token_ttl
+            })
+
+        handlers = {
+            "/ml/v1/text/generation": self.generation,
+            "/ml/v1/text/generation_stream": self.generation_stream,
+            "/ml/v1/text/tokenization": self.tokenization,
+        }
+        handler = handlers.get(path)
+        if handler is None:
+            return self.send_json(404, {"errors": [{"code": "not_found", "message": path}]})
+
+        authorization = self.headers.get("Authorization", "")
+        if not self.state.token_is_valid(authorization[len("Bearer "):]):
+            self.state.count("unauthorized")
+            return self.send_json(401, {"errors": [{"code": "authentication_token_expired",
+                                                    "message": "Invalid or expired token"}]})
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_json(400, {"errors": [{"code": "json_validation_error", "message": "Invalid JSON"}]})
+        handler(request)
+
+    def tokenization(self, request):
+        self.state.count("tokenization")
+        self.send_json(200, {"model_id": request.get("model_id"),
+                             "result": {"token_count": len(request.get("input", "")) // CHARS_PER_TOKEN}})
+
+    def plan_generation(self, request, key):
+        """Count the call and apply injected failures; returns (text, input_tokens, tokens) or None."""
+        self.state.count(key)
+        failure = self.state.injected_failure()
+        if failure:
+            status, headers = failure
+            self.state.count(f"injected_{status}")
+            self.send_json(status, {"errors": [{"code": "injected", "message": f"Injected {status}"}]}, headers)
+            return None
+
+        max_new_tokens = request.get("parameters", {}).get("max_new_tokens", self.state.config.generated_tokens)
+        tokens = max(1, min(max_new_tokens, self.state.config.generated_tokens))
+        input_tokens = len(request.get("input", "")) // CHARS_PER_TOKEN
+        return generated_text(tokens), input_tokens, tokens
+
+    def generation(self, request):
+        plan = self.plan_generation(request, "generation")
+        if plan is None:
+            return
+        text, input_tokens, tokens = plan
+        with self.state.lock:
+            self.state.in_flight += 1
+        try:
+            time.sleep(self.state.jittered(self.state.config.latency + tokens / self.state.config.tokens_per_second))
+        finally:
+            with self.state.lock:
+                self.state.in_flight -= 1
+        self.send_json(200, {
+            "model_id": request.get("model_id"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "results": [{
+                "generated_text": text,
+                "generated_token_count": tokens,
+                "input_token_count": input_tokens,
+                "stop_reason": "max_tokens"
+            }]
+        })
+
+    def generation_stream(self, request):
+        plan = self.plan_generation(request, "generation_stream")
+        if plan is None:
+            return
+        text, input_tokens, tokens = plan
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        with self.state.lock:
+            self.state.in_flight += 1
+        try:
+            time.sleep(self.state.jittered(self.state.config.latency))
+            # Emit about eight tokens per event, paced at the configured rate
+            chunk_chars = 8 * CHARS_PER_TOKEN
+            delay = 8 / self.state.config.tokens_per_second
+            for event_id, start in enumerate(range(0, len(text), chunk_chars), 1):
+                generated = min(tokens, (start + chunk_chars) // CHARS_PER_TOKEN)
+                data = json.dumps({"model_id": request.get("model_id"), "results": [{
+                    "generated_text": text[start:start + chunk_chars],
+                    "generated_token_count": generated,
+                    "input_token_count": input_tokens,
+                    "stop_reason": "not_finished" if start + chunk_chars < len(text) else "max_tokens"
+                }]})
+                self.write_chunk(f"id: {event_id}\nevent: message\ndata: {data}\n\n".encode("utf-8"))
+                time.sleep(self.state.jittered(delay))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count("stream_disconnects")
+        finally:
+            with self.state.lock:
+                self.state.in_flight -= 1
+
+    def write_chunk(self, payload):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub(config, host="127.0.0.1", port=0):
+    """Serve the stub on a background thread; returns (server, state, base_url)."""
+    state = StubState(config)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="watsonx-stub", daemon=True).start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, state, f"http://{bound_host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--generated-tokens", type=int, default=400,
+                        help="tokens per generation, capped by the request's max_new_tokens")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- fraction applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of generations that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="fraction of generations answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="generation requests per minute before 429s")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="IAM token lifetime in seconds")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, generated_tokens=args.generated_tokens,
+        error_rate=args.error_rate, error_status=args.error_status, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, rpm_limit=args.rpm_limit, token_ttl=args.token_ttl,
+        jitter=args.jitter, seed=args.seed
+    )
+    server, _, base_url = start_stub(config, args.host, args.port)
+
+    print(f"watsonx stub listening on {base_url}")
+    print("Point an app at it with:")
+    print("  IBM_API_KEY=stub WATSONX_PROJECT_ID=stub GRANITE_MODEL=ibm/granite-stub \\")
+    print(f"  WATSONX_URL={base_url} IBM_IAM_URL={base_url}/identity/token")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""watsonx client plumbing shared by ai-test-generator and ai-test-generator2.
+
+Errors and retries (resilience), the rate-limit scheduler (llm_scheduler),
+request coalescing, token budgets, metrics, tracing and the IAM token
+stores live here once; each app imports them as testgen_common.<module>.
+"""
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import threading
+
+
+def request_key(body):
+    """SHA-256 of a watsonx request body: prompt, parameters, model and project"""
+    material = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight wait and get its result, or have its exception raised. Nothing
+    is kept once the call returns, so this never serves stale results and
+    works with or without a cache in front of it.
+
+    do() is for threads; ado() for coroutines that all run on one event
+    loop, such as AsyncGraniteClient's. The two do not share calls.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            'calls': 0,
+            'coalesced': 0
+        }
+
+    def do(self, key, function, *args):
+        if not self.enabled:
+            return function(*args)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counters['calls' if leader else 'coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, coroutine_function, *args):
+        if not self.enabled:
+            return await coroutine_function(*args)
+
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(coroutine_function(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        with self._lock:
+            self._counters['calls' if leader else 'coalesced'] += 1
+
+        # A cancelled caller stops waiting without cancelling the call the
+        # others still wait on
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller was cancelled
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, enabled=self.enabled, in_flight=len(self._calls) + len(self._tasks))
@@ -0,0 +1,415 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+
+from testgen_common.metrics import LLM_QUEUE_WAIT_SECONDS
+from testgen_common.resilience import GraniteRateLimitError
+from testgen_common.token_budget import estimate_tokens
+from testgen_common.tracing import span
+
+# Highest priority first: a queued interactive call is always admitted
+# before any batch call
+LANES = ('interactive', 'batch')
+DEFAULT_TENANT = 'anonymous'
+# Tenants idle for long enough to have no effect on finish tags are dropped
+# from the bookkeeping once more than this many are tracked
+MAX_TRACKED_TENANTS = 1024
+
+_current_caller = contextvars.ContextVar('llm_caller', default=None)
+
+
+class Caller:
+    """Who LLM calls are made for: the tenant whose share they use and their lane.
+
+    Totals the queue wait of every call made on its behalf, so a request
+    that fans out into several calls (shards, batch items) reports the sum.
+    """
+    __slots__ = ('tenant', 'lane', 'queue_wait', 'calls', '_lock')
+
+    def __init__(self, tenant=DEFAULT_TENANT, lane='batch'):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}'. Use one of: {', '.join(LANES)}")
+        self.tenant = tenant or DEFAULT_TENANT
+        self.lane = lane
+        self.queue_wait = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.queue_wait += seconds
+            self.calls += 1
+
+    @property
+    def queue_wait_ms(self):
+        return round(self.queue_wait * 1000, 2)
+
+
+def current_caller():
+    return _current_caller.get()
+
+
+def enter_caller(caller):
+    """Make caller current; returns a token for exit_caller()."""
+    return _current_caller.set(caller)
+
+
+def exit_caller(token):
+    _current_caller.reset(token)
+
+
+def bind_caller(fn, caller=None):
+    """Wrap fn so calls it makes from another thread are scheduled for caller (default: the current one)."""
+    caller = caller or _current_caller.get()
+    if caller is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        token = _current_caller.set(caller)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_caller.reset(token)
+    return bound
+
+
+def parse_weights(text):
+    """{'tenant': weight} from 'team-a=3,team-b=1'."""
+    weights = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        tenant, _, weight = item.rpartition('=')
+        if not tenant.strip():
+            raise ValueError(f"Invalid tenant weight '{item.strip()}'. Use tenant=weight")
+        weights[tenant.strip()] = float(weight)
+    return weights
+
+
+def estimate_call_tokens(body):
+    """Tokens a generation request may use: its prompt plus max_new_tokens."""
+    return estimate_prompt_tokens(body) + body["parameters"].get("max_new_tokens", 0)
+
+
+def estimate_prompt_tokens(body):
+    """Tokens of a generation request's prompt alone."""
+    return estimate_tokens(body["input"])
+
+
+def used_tokens(result, default=None):
+    """Prompt plus generated tokens reported in a watsonx results entry."""
+    input_tokens = result.get("input_token_count")
+    generated_tokens = result.get("generated_token_count")
+    if input_tokens is None or generated_tokens is None:
+        return default
+    return input_tokens + generated_tokens
+
+
+class TokenBucket:
+    """per_minute units refilled continuously, holding at most one minute's worth.
+
+    The level may go negative when a call turns out to cost more than it
+    reserved; later calls then wait for the debt to be repaid.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until amount can be taken; a call larger than the bucket waits for a full one."""
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    __slots__ = ('caller', 'tokens', 'finish', 'enqueued', 'admitted_at', 'cancelled', 'settled', 'wake')
+
+    def __init__(self, caller, tokens, finish, enqueued, wake=None):
+        self.caller = caller
+        self.tokens = tokens
+        self.finish = finish
+        self.enqueued = enqueued
+        self.admitted_at = None
+        self.cancelled = False
+        self.settled = False
+        self.wake = wake
+
+    @property
+    def wait(self):
+        return (self.admitted_at or time.monotonic()) - self.enqueued
+
+
+class LLMScheduler:
+    """Admits watsonx calls within the plan's requests- and tokens-per-minute limits.
+
+    Calls that cannot start at once queue in their caller's lane, and
+    interactive calls always go before batch ones. Within a lane, tenants
+    share the quota by weight (self-clocked weighted fair queueing on
+    reserved tokens): a tenant with 50 queued specs cannot hold back
+    another tenant's single call for more than about one call of its own.
+    A call reserves its prompt plus max_new_tokens and settle() returns
+    what watsonx reports it did not use.
+
+    acquire() is for threads, aacquire() for coroutines; both wait in the
+    same queues. Waiting longer than max_wait raises GraniteRateLimitError.
+    With neither limit set, every call is admitted immediately.
+
+    Every retry of a call is another request and goes through readmit().
+    pause() holds every call back for a watsonx Retry-After, so a burst of
+    429s slows the whole process down instead of stacking up retries.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, weights=None, max_wait=120.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.weights = dict(weights or {})
+        self.max_wait = max_wait
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._queues = {lane: [] for lane in LANES}        # heaps of (finish tag, seq, Ticket)
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._last_finish = {lane: {} for lane in LANES}   # tenant -> finish tag of its latest call
+        self._sequence = itertools.count()
+        self._lane_stats = {lane: {'admitted': 0, 'rejected': 0, 'wait_seconds': 0.0} for lane in LANES}
+
+    @property
+    def enabled(self):
+        return self.requests is not None or self.tokens is not None
+
+    def acquire(self, tokens, caller=None):
+        """Wait until a call reserving tokens may be sent; returns its Ticket."""
+        caller = caller or _current_caller.get() or Caller()
+        if not self.enabled:
+            enqueued = time.monotonic()
+            pause = self._paused_until - enqueued
+            if pause > 0:
+                time.sleep(pause)
+            return self._admit_unlimited(caller, tokens, enqueued)
+
+        with span('llm.queue', lane=caller.lane, tenant=caller.tenant):
+            with self._cond:
+                ticket = self._enqueue(caller, tokens)
+                while True:
+                    retry_in = self._dispatch(time.monotonic())
+                    if ticket.admitted_at is not None:
+                        break
+                    self._cond.wait(self._wait_timeout(ticket, retry_in))
+        return self._admitted(ticket)
+
+    async def aacquire(self, tokens, caller=None):
+        """acquire() for coroutines; waits without blocking the event loop."""
+        caller = caller or _current_caller.get() or Caller()
+        if not self.enabled:
+            enqueued = time.monotonic()
+            pause = self._paused_until - enqueued
+            if pause > 0:
+                await asyncio.sleep(pause)
+            return self._admit_unlimited(caller, tokens, enqueued)
+
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        with self._cond:
+            ticket = self._enqueue(caller, tokens, wake=lambda: loop.call_soon_threadsafe(wakeup.set))
+        try:
+            while True:
+                wakeup.clear()
+                with self._cond:
+                    retry_in = self._dispatch(time.monotonic())
+                    if ticket.admitted_at is not None:
+                        break
+                    timeout = self._wait_timeout(ticket, retry_in)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._cond:
+                self._abandon(ticket)
+            raise
+        return self._admitted(ticket)
+
+    def readmit(self, ticket):
+        """Wait until a retry of ticket's call may be sent.
+
+        The retry takes one more request in the same caller's lane; its
+        tokens stay covered by the original reservation, which settle()
+        corrects to what watsonx reports.
+        """
+        return self.acquire(0, ticket.caller)
+
+    async def areadmit(self, ticket):
+        return await self.aacquire(0, ticket.caller)
+
+    def pause(self, seconds):
+        """Admit no call for the next seconds (at most max_wait), e.g. a watsonx Retry-After."""
+        if not seconds or seconds <= 0:
+            return
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + min(seconds, self.max_wait))
+
+    def settle(self, ticket, used):
+        """Correct a ticket's token reservation to the tokens the call actually used.
+
+        Call it whether or not the call succeeded: a failed call passes 0,
+        or its prompt estimate if watsonx answered, so that it does not
+        keep its full reservation.
+        """
+        if used is None or self.tokens is None:
+            return
+        with self._cond:
+            if ticket.settled:
+                return
+            ticket.settled = True
+            if used < ticket.tokens:
+                self.tokens.give(ticket.tokens - used)
+                # Returned tokens may let the head of the queue start now
+                self._dispatch(time.monotonic())
+            else:
+                self.tokens.take(used - ticket.tokens)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            queued = {lane: 0 for lane in LANES}
+            waiting_tenants = {}
+            for lane, queue in self._queues.items():
+                for _, _, ticket in queue:
+                    if not ticket.cancelled:
+                        queued[lane] += 1
+                        waiting_tenants[ticket.caller.tenant] = waiting_tenants.get(ticket.caller.tenant, 0) + 1
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                'enabled': self.enabled,
+                'requests_per_minute': self.requests.capacity if self.requests else None,
+                'tokens_per_minute': self.tokens.capacity if self.tokens else None,
+                'available_requests': round(self.requests.level, 1) if self.requests else None,
+                'available_tokens': round(self.tokens.level) if self.tokens else None,
+                'max_wait': self.max_wait,
+                'paused_for': round(max(0.0, self._paused_until - now), 1),
+                'queued': queued,
+                'waiting_tenants': waiting_tenants,
+                'lanes': {lane: dict(stats, wait_seconds=round(stats['wait_seconds'], 3))
+                          for lane, stats in self._lane_stats.items()}
+            }
+
+    def _admit_unlimited(self, caller, tokens, enqueued):
+        ticket = Ticket(caller, tokens, 0.0, enqueued)
+        ticket.admitted_at = time.monotonic()
+        return self._admitted(ticket)
+
+    def _admitted(self, ticket):
+        wait = ticket.wait
+        ticket.caller.add_wait(wait)
+        LLM_QUEUE_WAIT_SECONDS.observe(wait, lane=ticket.caller.lane)
+        with self._cond:
+            stats = self._lane_stats[ticket.caller.lane]
+            stats['admitted'] += 1
+            stats['wait_seconds'] += wait
+        return ticket
+
+    def _enqueue(self, caller, tokens, wake=None):
+        """Queue a ticket with its weighted finish tag. Callers hold self._cond."""
+        lane = caller.lane
+        last_finish = self._last_finish[lane]
+        virtual_time = self._virtual_time[lane]
+        if len(last_finish) > MAX_TRACKED_TENANTS:
+            for tenant in [tenant for tenant, finish in last_finish.items() if finish <= virtual_time]:
+                del last_finish[tenant]
+
+        weight = self.weights.get(caller.tenant, 1.0)
+        start = max(virtual_time, last_finish.get(caller.tenant, 0.0))
+        finish = start + max(1, tokens) / weight
+        last_finish[caller.tenant] = finish
+
+        ticket = Ticket(caller, tokens, finish, time.monotonic(), wake)
+        heapq.heappush(self._queues[lane], (finish, next(self._sequence), ticket))
+        return ticket
+
+    def _dispatch(self, now):
+        """Admit queued calls while the limits allow; returns seconds until the next may start.
+
+        Callers hold self._cond. None means nothing is waiting on the limits.
+        """
+        admitted = False
+        retry_in = None
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue:
+                ticket = queue[0][2]
+                if ticket.cancelled:
+                    heapq.heappop(queue)
+                    continue
+                delay = self._delay(ticket, now)
+                if delay > 0:
+                    retry_in = delay
+                    break
+                heapq.heappop(queue)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(ticket.tokens)
+                ticket.admitted_at = now
+                self._virtual_time[lane] = ticket.finish
+                admitted = True
+            if queue:
+                # Lower lanes wait until this one can move again
+                break
+
+        if admitted:
+            # The new head of the queue may have a different delay; wake everyone to recompute
+            self._cond.notify_all()
+            for queue in self._queues.values():
+                for _, _, ticket in queue:
+                    if ticket.wake and not ticket.cancelled:
+                        ticket.wake()
+        return retry_in
+
+    def _delay(self, ticket, now):
+        delay = max(0.0, self._paused_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(ticket.tokens, now))
+        return delay
+
+    def _wait_timeout(self, ticket, retry_in):
+        """Seconds to wait before retrying; raises once ticket has waited max_wait. Callers hold self._cond."""
+        remaining = self.max_wait - (time.monotonic() - ticket.enqueued)
+        if remaining <= 0:
+            self._abandon(ticket)
+            self._lane_stats[ticket.caller.lane]['rejected'] += 1
+            raise GraniteRateLimitError(
+                f"Waited {self.max_wait:g}s for the watsonx rate limit; try again later",
+                retry_after=retry_in
+            )
+        return remaining if retry_in is None else min(retry_in, remaining)
+
+    def _abandon(self, ticket):
+        """Drop a ticket whose caller stopped waiting, handing back anything it took."""
+        if ticket.admitted_at is not None:
+            if self.requests is not None:
+                self.requests.give(1)
+            if self.tokens is not None:
+                self.tokens.give(ticket.tokens)
+        else:
+            ticket.cancelled = True
+        self._dispatch(time.monotonic())
@@ -0,0 +1,341 @@
+import atexit
+import functools
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, (), value) for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self, samples=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, key, extra, value in (self.samples() if samples is None else samples):
+            lines.append(f"{name}{_format_labels(labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A gauge set directly or read from a callback at scrape time.
+
+    The callback returns a number, or {label values tuple: number} for a
+    labelled gauge.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            values = self.function()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, self.labelnames, tuple(map(str, key)), (), value) for key, value in values.items()]
+
+
+class CallbackCounter(Gauge):
+    """A counter whose totals are kept elsewhere, e.g. in a stats() dict."""
+    type = 'counter'
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][index] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def time(self, **labels):
+        """Context manager and decorator observing elapsed seconds."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    samples.append((self.name + '_bucket', self.labelnames, key,
+                                    (('le', _format_value(bound)),), cumulative))
+                samples.append((self.name + '_sum', self.labelnames, key, (), total))
+                samples.append((self.name + '_count', self.labelnames, key, (), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Values live in process memory. Under a multi-worker server each scrape
+    reaches a single worker, so call enable_multiprocess() in every worker
+    (gunicorn.conf.py does): each one then writes its samples to a shared
+    directory and render() reports all of them. Counters and histograms
+    are summed over every worker, exited ones included, so totals never go
+    backwards. Gauges (and callback counters) describe one process, so
+    they get a pid label and only running workers report them.
+    """
+
+    def __init__(self, namespace=''):
+        self.namespace = namespace
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.directory = None
+        self._flusher = None
+
+    def _register(self, cls, name, *args, **kwargs):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {full_name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge, name, documentation, labelnames, function=function)
+
+    def callback_counter(self, name, documentation, function, labelnames=()):
+        return self._register(CallbackCounter, name, documentation, labelnames, function=function)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def enable_multiprocess(self, directory, flush_interval=5.0):
+        """Share this process's samples through directory, refreshed every flush_interval seconds.
+
+        Call it after fork: values recorded before (by a preloading master)
+        are dropped so that they are not counted once per worker.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+        self.directory = directory
+
+        def flush_quietly():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Could not write metrics to %s: %s", directory, e)
+
+        def flush_periodically():
+            while True:
+                time.sleep(flush_interval)
+                flush_quietly()
+
+        self._flusher = threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(flush_quietly)
+
+    def flush(self):
+        """Write this process's samples to the multiprocess directory."""
+        if self.directory is None:
+            return
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {metric.name: [[name, list(key), [list(pair) for pair in extra], value]
+                                  for name, _, key, extra, value in metric.samples()]
+                    for metric in metrics}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load_snapshots(self):
+        """{pid: snapshot} of every process that wrote to the multiprocess directory."""
+        snapshots = {}
+        for filename in os.listdir(self.directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                    snapshots[int(pid)] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _merged_samples(self, metric, snapshots):
+        if isinstance(metric, Gauge):
+            samples = []
+            for pid, snapshot in sorted(snapshots.items()):
+                if pid != os.getpid() and not _process_alive(pid):
+                    continue
+                for name, key, extra, value in snapshot.get(metric.name, ()):
+                    samples.append((name, metric.labelnames, tuple(key),
+                                    tuple(map(tuple, extra)) + (('pid', pid),), value))
+            return samples
+        totals = {}
+        for snapshot in snapshots.values():
+            for name, key, extra, value in snapshot.get(metric.name, ()):
+                sample = (name, tuple(key), tuple(map(tuple, extra)))
+                totals[sample] = totals.get(sample, 0) + value
+        return [(name, metric.labelnames, key, extra, value) for (name, key, extra), value in totals.items()]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshots = None
+        if self.directory is not None:
+            self.flush()
+            snapshots = self._load_snapshots()
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(None if snapshots is None else self._merged_samples(metric, snapshots)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry('testgen')
+
+# Shared by GraniteClient and AsyncGraniteClient
+TOKEN_FETCH_SECONDS = REGISTRY.histogram(
+    'iam_token_fetch_seconds', 'Time to fetch an IAM access token, retries included')
+WATSONX_REQUEST_SECONDS = REGISTRY.histogram(
+    'watsonx_request_seconds', 'Latency of single watsonx HTTP requests (time to headers for streams)',
+    ('operation', 'status'))
+WATSONX_TOKENS = REGISTRY.counter(
+    'watsonx_tokens_total', 'Tokens reported by watsonx responses', ('operation', 'kind'))
+WATSONX_GENERATED_TOKENS = REGISTRY.histogram(
+    'watsonx_generated_tokens', 'Generated tokens per watsonx call', ('operation',), buckets=TOKEN_BUCKETS)
+WATSONX_ERRORS = REGISTRY.counter(
+    'watsonx_errors_total', 'Failed watsonx and IAM attempts by error class', ('operation', 'error'))
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'llm_queue_wait_seconds', 'Time watsonx calls waited for the scheduler to admit them', ('lane',))
+
+
+def operation_for_url(url):
+    """'generation' for .../ml/v1/text/generation?version=..."""
+    return url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+def record_token_usage(operation, result):
+    """Count input/generated tokens from a watsonx results entry."""
+    input_tokens = result.get('input_token_count')
+    generated_tokens = result.get('generated_token_count')
+    if input_tokens is not None:
+        WATSONX_TOKENS.inc(input_tokens, operation=operation, kind='input')
+    if generated_tokens is not None:
+        WATSONX_TOKENS.inc(generated_tokens, operation=operation, kind='generated')
+        WATSONX_GENERATED_TOKENS.observe(generated_tokens, operation=operation)
@@ -0,0 +1,302 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class GraniteError(Exception):
+    """Base class for failed calls to IAM or watsonx.
+
+    retryable marks failures worth another attempt; trips_breaker marks the
+    ones that suggest the upstream itself is degraded.
+    """
+    retryable = False
+    trips_breaker = False
+    http_status = 502
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GraniteTimeoutError(GraniteError):
+    retryable = True
+    trips_breaker = True
+    http_status = 504
+
+
+class GraniteUnavailableError(GraniteError):
+    retryable = True
+    trips_breaker = True
+    http_status = 503
+
+
+class GraniteRateLimitError(GraniteError):
+    retryable = True
+    http_status = 429
+
+
+class GraniteAuthError(GraniteError):
+    pass
+
+
+class GraniteRequestError(GraniteError):
+    pass
+
+
+class GraniteResponseError(GraniteError):
+    pass
+
+
+class CircuitOpenError(GraniteUnavailableError):
+    retryable = False
+    trips_breaker = False
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds from a Retry-After header, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def error_for_response(response, action):
+    """Build the typed error for a failed requests or httpx response."""
+    status = response.status_code
+    message = f"{action}: HTTP {status} {response.text[:200]}"
+    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+    if status == 429:
+        return GraniteRateLimitError(message, status, retry_after)
+    if status in (401, 403):
+        return GraniteAuthError(message, status)
+    if status in (408, 504):
+        return GraniteTimeoutError(message, status, retry_after)
+    if status in RETRYABLE_STATUS_CODES:
+        return GraniteUnavailableError(message, status, retry_after)
+    if status >= 500:
+        return GraniteError(message, status)
+    return GraniteRequestError(message, status)
+
+
+def raise_for_status(response, action):
+    if response.status_code >= 400:
+        raise error_for_response(response, action)
+
+
+def translate_exception(error, action):
+    """Map transport exceptions from requests or httpx onto GraniteError."""
+    if isinstance(error, GraniteError):
+        return error
+    if isinstance(error, requests.Timeout) or (httpx and isinstance(error, httpx.TimeoutException)):
+        return GraniteTimeoutError(f"{action}: timed out ({error})")
+    if isinstance(error, requests.ConnectionError) or (httpx and isinstance(error, httpx.TransportError)):
+        return GraniteUnavailableError(f"{action}: connection failed ({error})")
+    return GraniteError(f"{action}: {error}")
+
+
+def generation_deadline(max_new_tokens, base=10.0, min_tokens_per_second=20.0, maximum=300.0):
+    """Seconds a generation of up to max_new_tokens may take, retries included."""
+    return min(maximum, base + max_new_tokens / min_tokens_per_second)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After.
+
+    A retry is only scheduled when it can start before the call's deadline,
+    so a slow failure never stretches a call past its budget.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=20.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, attempt, error, deadline):
+        """Seconds to wait before the next attempt, or None to give up."""
+        if not error.retryable or attempt >= self.max_attempts:
+            return None
+
+        if error.retry_after is not None:
+            if error.retry_after > self.max_delay:
+                return None
+            delay = error.retry_after
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Fails calls fast while the upstream keeps failing.
+
+    After failure_threshold consecutive failures that trip the breaker the
+    circuit opens for reset_timeout seconds. Then a single probe call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name='watsonx'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit for {self.name} is open; failing fast",
+                                           retry_after=remaining)
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit for {self.name} is half-open; probe in flight",
+                                           retry_after=1.0)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error):
+        if not error.trips_breaker:
+            if error.status_code is not None:
+                # The upstream answered, so as far as health goes this worked
+                self.record_success()
+            else:
+                with self._lock:
+                    self._probe_in_flight = False
+            return
+
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Opening %s circuit after %d failures: %s", self.name, self.failures, error)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'rejected': self.rejected,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout
+            }
+
+
+def call_with_retries(attempt, timeout, action, retry_policy, breaker=None, before_retry=None):
+    """Run attempt(remaining_seconds) until it succeeds or the budget runs out.
+
+    attempt must raise GraniteError subclasses (or transport exceptions,
+    which are translated) and return the call's result. before_retry(error)
+    runs after the backoff and before each retry, e.g. to wait for the rate
+    limiter; the time it takes counts against the budget.
+    """
+    deadline = time.monotonic() + timeout
+    number = 0
+    while True:
+        number += 1
+        if breaker:
+            breaker.before_call()
+
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise GraniteTimeoutError(f"{action}: deadline of {timeout:.0f}s exceeded")
+            result = attempt(remaining)
+        except Exception as e:
+            error = translate_exception(e, action)
+            if breaker:
+                breaker.record_failure(error)
+            delay = retry_policy.next_delay(number, error, deadline)
+            if delay is None:
+                if error is e:
+                    raise
+                raise error from e
+            logger.warning("Attempt %d failed, retrying in %.2fs: %s", number, delay, error)
+            time.sleep(delay)
+            if before_retry:
+                before_retry(error)
+            continue
+
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retries(attempt, timeout, action, retry_policy, breaker=None, before_retry=None):
+    """asyncio counterpart of call_with_retries; attempt and before_retry are coroutine functions."""
+    deadline = time.monotonic() + timeout
+    number = 0
+    while True:
+        number += 1
+        if breaker:
+            breaker.before_call()
+
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise GraniteTimeoutError(f"{action}: deadline of {timeout:.0f}s exceeded")
+            result = await attempt(remaining)
+        except Exception as e:
+            error = translate_exception(e, action)
+            if breaker:
+                breaker.record_failure(error)
+            delay = retry_policy.next_delay(number, error, deadline)
+            if delay is None:
+                if error is e:
+                    raise
+                raise error from e
+            logger.warning("Attempt %d failed, retrying in %.2fs: %s", number, delay, error)
+            await asyncio.sleep(delay)
+            if before_retry:
+                await before_retry(error)
+            continue
+
+        if breaker:
+            breaker.record_success()
+        return result
@@ -0,0 +1,238 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('none', 'file', 'redis')
+
+
+def _credential_id(api_key):
+    """Short stable id for a credential, so different API keys never share a token."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class FileTokenStore:
+    """IAM token shared by the worker processes of one host through a file.
+
+    An flock on a side file makes a single process fetch a new token while
+    the others wait and then read it, so N workers cost one IAM call. The
+    token file is written atomically and is readable by its owner only.
+    """
+
+    def __init__(self, directory, api_key):
+        os.makedirs(directory, exist_ok=True)
+        name = f"iam_token_{_credential_id(api_key)}"
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name}.json")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+
+    @contextlib.contextmanager
+    def lock(self):
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        """(access_token, expires_at) of a stored token that has not expired, else None."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['expires_at'] > time.time():
+                return data['access_token'], data['expires_at']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def save(self, access_token, expires_at):
+        # mkstemp creates the file with mode 0600
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'access_token': access_token, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def discard(self, access_token):
+        """Forget access_token if it is the stored one, e.g. after watsonx rejected it."""
+        with self.lock():
+            stored = self.load()
+            if stored and stored[0] == access_token:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+
+
+class RedisTokenStore:
+    """IAM token shared through Redis, for workers spread over several hosts."""
+
+    def __init__(self, client, api_key, lock_timeout=60):
+        self.client = client
+        self.key = f"testgen:iam_token:{_credential_id(api_key)}"
+        self.lock_timeout = lock_timeout
+
+    def lock(self):
+        return self.client.lock(f"{self.key}:lock", timeout=self.lock_timeout,
+                                blocking_timeout=self.lock_timeout)
+
+    def load(self):
+        raw = self.client.get(self.key)
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        if data['expires_at'] <= time.time():
+            return None
+        return data['access_token'], data['expires_at']
+
+    def save(self, access_token, expires_at):
+        self.client.set(self.key, json.dumps({'access_token': access_token, 'expires_at': expires_at}),
+                        ex=max(1, int(expires_at - time.time())))
+
+    def discard(self, access_token):
+        with self.lock():
+            stored = self.load()
+            if stored and stored[0] == access_token:
+                self.client.delete(self.key)
+
+
+class RedisCacheStore:
+    """String values in Redis under a key prefix, expiring after ttl seconds."""
+
+    def __init__(self, client, prefix, ttl):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+
+
+class FileRecordStore:
+    """JSON records shared by the worker processes of one host, one file each.
+
+    A record expires ttl seconds after it was last written. Keys are hashed
+    into file names, so they may come straight from a URL.
+    """
+
+    def __init__(self, directory, prefix, ttl):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{self.prefix}{digest}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, record):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class RedisRecordStore:
+    """JSON records in Redis under a key prefix, expiring ttl seconds after their last write."""
+
+    def __init__(self, client, prefix, ttl):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def set(self, key, record):
+        self.client.set(self.prefix + key, json.dumps(record), ex=max(1, int(self.ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def redis_client(url):
+    """A redis-py client for url, or None when the package is not installed."""
+    try:
+        import redis
+    except ImportError as e:
+        logger.warning("Redis shared state requested but redis is not installed: %s", e)
+        return None
+    return redis.Redis.from_url(url)
+
+
+def create_token_store(backend, api_key, directory='shared_state', redis_url='redis://localhost:6379/0'):
+    """Token store for SHARED_STATE_BACKEND; None keeps the token per process.
+
+    'redis' falls back to the file store when redis-py is missing.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown shared state backend '{backend}'. Use one of: {', '.join(BACKENDS)}")
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        client = redis_client(redis_url)
+        if client is not None:
+            return RedisTokenStore(client, api_key)
+    return FileTokenStore(directory, api_key)
+
+
+def create_record_store(backend, name, ttl, directory='shared_state', redis_url='redis://localhost:6379/0'):
+    """Store for records named name under SHARED_STATE_BACKEND; None keeps them per process.
+
+    'redis' falls back to the file store when redis-py is missing.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown shared state backend '{backend}'. Use one of: {', '.join(BACKENDS)}")
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        client = redis_client(redis_url)
+        if client is not None:
+            return RedisRecordStore(client, f"testgen:{name}:", ttl)
+    return FileRecordStore(directory, f"{name}_", ttl)
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks; long words cost several tokens
+TOKEN_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+CHARS_PER_WORD_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Local approximation of a BPE token count, usually within ~15%."""
+    total = 0
+    for piece in TOKEN_PIECE_PATTERN.findall(text):
+        total += math.ceil(len(piece) / CHARS_PER_WORD_TOKEN) if piece[0].isalnum() else 1
+    return total
+
+
+def default_budget(context_window, max_new_tokens, margin=256):
+    """Prompt tokens left once room is kept for the generated output."""
+    return max(0, context_window - max_new_tokens - margin)
+
+
+class TokenCounter:
+    """Counts prompt tokens, asking watsonx when a tokenizer is available.
+
+    Counts from tokenize(text) are cached by content hash. When the remote
+    call fails the local estimate is used and the tokenizer is not retried
+    for retry_after seconds, so a tokenizer outage never slows requests.
+    """
+
+    def __init__(self, tokenize=None, max_entries=1024, retry_after=60.0):
+        self.tokenize = tokenize
+        self.max_entries = max_entries
+        self.retry_after = retry_after
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._disabled_until = 0.0
+
+    def measure(self, text):
+        """Return (token_count, source) where source is 'watsonx' or 'estimate'."""
+        if self.tokenize is None or time.monotonic() < self._disabled_until:
+            return estimate_tokens(text), 'estimate'
+
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key], 'watsonx'
+
+        try:
+            count = self.tokenize(text)
+        except Exception as e:
+            logger.warning("Token counting via watsonx failed, using estimates for %.0fs: %s", self.retry_after, e)
+            self._disabled_until = time.monotonic() + self.retry_after
+            return estimate_tokens(text), 'estimate'
+
+        with self._lock:
+            self._cache[key] = count
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return count, 'watsonx'
+
+
+def fit_to_budget(render, steps, budget, counter):
+    """Apply compaction steps in order until render(steps) fits the budget.
+
+    render(applied_steps) returns the prompt text. The uncompacted prompt is
+    measured once with counter; compacted variants are sized with the local
+    estimate scaled by that measurement, so at most one remote call is made.
+    Returns (text, report).
+    """
+    text = render(())
+    tokens_before, source = counter.measure(text)
+    scale = tokens_before / max(1, estimate_tokens(text))
+
+    applied = []
+    tokens = tokens_before
+    for step in steps:
+        if budget is None or tokens <= budget:
+            break
+        applied.append(step)
+        text = render(tuple(applied))
+        tokens = round(estimate_tokens(text) * scale)
+
+    return text, {
+        'budget': budget,
+        'tokens_before': tokens_before,
+        'tokens': tokens,
+        'trimmed_tokens': tokens_before - tokens,
+        'steps': applied,
+        'within_budget': budget is None or tokens <= budget,
+        'counted_by': source
+    }
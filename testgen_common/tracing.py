@@ -0,0 +1,185 @@
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_depth = contextvars.ContextVar('span_depth', default=0)
+
+# OpenTelemetry tracer, set by configure_opentelemetry()
+_tracer = None
+# Number of requests currently collecting a Trace; while this is zero and no
+# tracer is configured, span() returns a shared no-op without further work.
+_active_traces = 0
+_active_lock = threading.Lock()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans recorded for one request, plus an optional cProfile run."""
+
+    def __init__(self, profile=False):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.profiler = cProfile.Profile() if profile else None
+
+    def add(self, name, started, ended, depth, attributes, error):
+        record = {
+            'name': name,
+            'start_ms': round((started - self.started) * 1000, 2),
+            'duration_ms': round((ended - started) * 1000, 2),
+            'depth': depth,
+            'thread': threading.current_thread().name
+        }
+        if attributes:
+            record.update(attributes)
+        if error is not None:
+            record['error'] = error.__name__
+        self.spans.append(record)
+
+    def server_timing(self):
+        """Value for a Server-Timing header covering the top-level spans."""
+        entries = [f"{record['name']};dur={record['duration_ms']}"
+                   for record in self.spans if record['depth'] == 0]
+        entries.append(f"total;dur={round((time.perf_counter() - self.started) * 1000, 2)}")
+        return ', '.join(entries)
+
+    def summary(self, profile_limit=40):
+        """Timing breakdown for a debug response, spans in start order."""
+        result = {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'spans': sorted(self.spans, key=lambda record: record['start_ms'])
+        }
+        if self.profiler:
+            output = io.StringIO()
+            pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(profile_limit)
+            result['profile'] = output.getvalue()
+        return result
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attributes', 'started', 'depth_token', 'otel_context', 'otel_span')
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.otel_context = None
+        self.otel_span = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self.otel_context = _tracer.start_as_current_span(self.name, attributes=self.attributes)
+            self.otel_span = self.otel_context.__enter__()
+        self.depth_token = _depth.set(_depth.get() + 1)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        depth = _depth.get() - 1
+        _depth.reset(self.depth_token)
+        if self.trace is not None:
+            self.trace.add(self.name, self.started, ended, depth, self.attributes, exc_type)
+        if self.otel_context is not None:
+            self.otel_context.__exit__(exc_type, exc, tb)
+        return False
+
+    def set(self, key, value):
+        """Attach an attribute discovered while the span is running."""
+        self.attributes[key] = value
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, value)
+
+
+def span(name, **attributes):
+    """Context manager timing one pipeline stage.
+
+    Returns a shared no-op unless a debug trace is active for the current
+    request or OpenTelemetry export is configured.
+    """
+    if not _active_traces and _tracer is None:
+        return _NOOP_SPAN
+    trace = _current_trace.get()
+    if trace is None and _tracer is None:
+        return _NOOP_SPAN
+    return _Span(trace, name, attributes)
+
+
+def begin(profile=False):
+    """Start collecting a Trace for the current context; pass the result to end()."""
+    global _active_traces
+    trace = Trace(profile)
+    with _active_lock:
+        _active_traces += 1
+    if trace.profiler:
+        trace.profiler.enable()
+    return trace, _current_trace.set(trace)
+
+
+def end(handle):
+    """Stop collecting and return the Trace started by begin()."""
+    global _active_traces
+    trace, token = handle
+    if trace.profiler:
+        trace.profiler.disable()
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # Reset from another context, e.g. a different async task
+        _current_trace.set(None)
+    with _active_lock:
+        _active_traces -= 1
+    return trace
+
+
+def bind(fn):
+    """Wrap fn so it runs with the caller's trace when submitted to a thread pool."""
+    if _current_trace.get() is None and _tracer is None:
+        return fn
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time, so each call
+    # runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def configure_opentelemetry(service_name):
+    """Export spans through OpenTelemetry's OTLP exporter, if it is installed.
+
+    The exporter reads the standard OTEL_EXPORTER_OTLP_* environment
+    variables. Returns False when the packages are missing.
+    """
+    global _tracer
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        logger.warning("OpenTelemetry tracing requested but not available: %s", e)
+        return False
+
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    _tracer = otel_trace.get_tracer(__name__)
+    return True
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from testgen_common.llm_scheduler import Caller, LLMScheduler, parse_weights
+from testgen_common.resilience import GraniteRateLimitError
+
+
+def drained(**kwargs):
+    """A scheduler whose request bucket is empty, so every call has to queue."""
+    scheduler = LLMScheduler(**kwargs)
+    scheduler.requests.take(scheduler.requests.capacity)
+    return scheduler
+
+
+def acquire_all(scheduler, callers, tokens=100):
+    """Queue one call per caller at the same time; returns the callers in admission order."""
+    barrier = threading.Barrier(len(callers))
+    tickets = [None] * len(callers)
+
+    def run(index):
+        barrier.wait()
+        tickets[index] = scheduler.acquire(tokens, callers[index])
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(callers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [ticket.caller for ticket in sorted(tickets, key=lambda ticket: ticket.admitted_at)]
+
+
+def test_parse_weights():
+    assert parse_weights('team-a=3, team-b=0.5,') == {'team-a': 3.0, 'team-b': 0.5}
+    assert parse_weights('') == {}
+    with pytest.raises(ValueError):
+        parse_weights('=2')
+
+
+def test_unlimited_scheduler_admits_at_once():
+    scheduler = LLMScheduler()
+    caller = Caller('team-a', 'interactive')
+    ticket = scheduler.acquire(1000, caller)
+    assert ticket.admitted_at is not None
+    assert caller.calls == 1
+    assert scheduler.stats()['lanes']['interactive']['admitted'] == 1
+
+
+def test_interactive_calls_go_before_queued_batch_calls():
+    scheduler = drained(requests_per_minute=600)
+    batch = [Caller(f"batch-{index}", 'batch') for index in range(3)]
+    interactive = Caller('user', 'interactive')
+
+    worker = threading.Thread(target=acquire_all, args=(scheduler, batch))
+    worker.start()
+    time.sleep(0.02)
+    scheduler.acquire(100, interactive)
+    worker.join()
+
+    # The interactive call arrived last but is admitted before any batch call
+    assert interactive.queue_wait < min(caller.queue_wait for caller in batch)
+
+
+def test_tenants_share_the_quota_by_weight():
+    scheduler = drained(requests_per_minute=600, weights={'heavy': 3})
+    callers = [Caller('heavy', 'batch') for _ in range(8)] + [Caller('light', 'batch') for _ in range(8)]
+
+    order = acquire_all(scheduler, callers)
+
+    first = [caller.tenant for caller in order[:8]]
+    assert first.count('heavy') == 6
+    assert first.count('light') == 2
+
+
+def test_waiting_longer_than_max_wait_is_rejected():
+    scheduler = drained(requests_per_minute=6, max_wait=0.1)
+    with pytest.raises(GraniteRateLimitError):
+        scheduler.acquire(100, Caller('team-a', 'batch'))
+    stats = scheduler.stats()
+    assert stats['lanes']['batch']['rejected'] == 1
+    assert stats['queued'] == {'interactive': 0, 'batch': 0}
+
+
+def test_settle_returns_unused_tokens():
+    scheduler = LLMScheduler(tokens_per_minute=1000)
+    ticket = scheduler.acquire(800)
+    assert scheduler.stats()['available_tokens'] == pytest.approx(200, abs=5)
+    scheduler.settle(ticket, 100)
+    assert scheduler.stats()['available_tokens'] == pytest.approx(900, abs=5)
+    # A second settle of the same ticket is ignored
+    scheduler.settle(ticket, 0)
+    assert scheduler.stats()['available_tokens'] == pytest.approx(900, abs=5)
+
+
+def test_readmit_takes_another_request_for_the_same_caller():
+    scheduler = LLMScheduler(requests_per_minute=60)
+    caller = Caller('team-a', 'interactive')
+    ticket = scheduler.acquire(100, caller)
+    scheduler.readmit(ticket)
+    assert caller.calls == 2
+    assert scheduler.stats()['available_requests'] == pytest.approx(58, abs=0.5)
+
+
+def test_pause_holds_back_every_call():
+    scheduler = LLMScheduler()
+    scheduler.pause(0.2)
+    started = time.monotonic()
+    asyncio.run(scheduler.aacquire(100))
+    assert time.monotonic() - started >= 0.19
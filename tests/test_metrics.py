@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+from testgen_common.metrics import Registry
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_snapshot(directory, pid, snapshot):
+    with open(os.path.join(directory, f"{pid}.json"), 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+
+def test_single_process_registry_renders_its_own_values():
+    registry = Registry('t')
+    registry.counter('calls_total', 'Calls', ('kind',)).inc(kind='a')
+    registry.gauge('depth', 'Depth', function=lambda: 3)
+    text = registry.render()
+    assert 't_calls_total{kind="a"} 1' in text
+    assert 't_depth 3' in text
+
+
+def test_multiprocess_registry_sums_counters_of_every_worker(tmp_path):
+    registry = Registry('t')
+    calls = registry.counter('calls_total', 'Calls', ('kind',))
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(1,))
+    registry.gauge('depth', 'Depth', function=lambda: 3)
+    calls.inc(kind='a')
+    registry.enable_multiprocess(str(tmp_path))
+    calls.inc(2, kind='a')
+    latency.observe(0.5)
+
+    # A worker that has exited: its totals count, its gauges do not
+    write_snapshot(str(tmp_path), exited_pid(), {
+        't_calls_total': [['t_calls_total', ['a'], [], 5], ['t_calls_total', ['b'], [], 1]],
+        't_latency_seconds': [['t_latency_seconds_bucket', [], [['le', '1']], 1],
+                              ['t_latency_seconds_bucket', [], [['le', '+Inf']], 2],
+                              ['t_latency_seconds_sum', [], [], 3.0],
+                              ['t_latency_seconds_count', [], [], 2]],
+        't_depth': [['t_depth', [], [], 7]]
+    })
+
+    lines = registry.render().splitlines()
+    # The value recorded before enable_multiprocess() (in the master) is dropped
+    assert 't_calls_total{kind="a"} 7' in lines
+    assert 't_calls_total{kind="b"} 1' in lines
+    assert 't_latency_seconds_bucket{le="1"} 2' in lines
+    assert 't_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 't_latency_seconds_sum 3.5' in lines
+    assert 't_latency_seconds_count 3' in lines
+    assert [line for line in lines if line.startswith('t_depth')] == [f't_depth{{pid="{os.getpid()}"}} 3']
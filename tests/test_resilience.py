@@ -0,0 +1,170 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+import requests
+
+from testgen_common.resilience import (CircuitBreaker, CircuitOpenError, GraniteAuthError, GraniteError,
+                                       GraniteRateLimitError, GraniteRequestError, GraniteTimeoutError,
+                                       GraniteUnavailableError, RetryPolicy, acall_with_retries, call_with_retries,
+                                       error_for_response, generation_deadline, parse_retry_after,
+                                       translate_exception)
+
+
+class Response:
+    def __init__(self, status_code, headers=None, text='error'):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    in_a_minute = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < parse_retry_after(in_a_minute) <= 60
+
+
+@pytest.mark.parametrize('status, error_type, http_status', [
+    (429, GraniteRateLimitError, 429),
+    (401, GraniteAuthError, 502),
+    (408, GraniteTimeoutError, 504),
+    (503, GraniteUnavailableError, 503),
+    (501, GraniteError, 502),
+    (400, GraniteRequestError, 502)
+])
+def test_error_for_response(status, error_type, http_status):
+    error = error_for_response(Response(status, {'Retry-After': '3'}), 'Generating tests')
+    assert type(error) is error_type
+    assert error.status_code == status
+    assert error.http_status == http_status
+    assert str(error).startswith(f"Generating tests: HTTP {status}")
+
+
+def test_rate_limit_keeps_retry_after():
+    error = error_for_response(Response(429, {'Retry-After': '3'}), 'Generating tests')
+    assert error.retry_after == 3.0
+    assert error.retryable and not error.trips_breaker
+
+
+def test_translate_exception():
+    assert isinstance(translate_exception(requests.Timeout('slow'), 'x'), GraniteTimeoutError)
+    assert isinstance(translate_exception(requests.ConnectionError('refused'), 'x'), GraniteUnavailableError)
+    assert isinstance(translate_exception(httpx.ConnectTimeout('slow'), 'x'), GraniteTimeoutError)
+    assert isinstance(translate_exception(httpx.ConnectError('refused'), 'x'), GraniteUnavailableError)
+    error = GraniteAuthError('denied')
+    assert translate_exception(error, 'x') is error
+    assert type(translate_exception(KeyError('results'), 'x')) is GraniteError
+
+
+def test_generation_deadline_scales_with_tokens_and_is_capped():
+    assert generation_deadline(200, base=10, min_tokens_per_second=20, maximum=300) == 20
+    assert generation_deadline(100000, base=10, min_tokens_per_second=20, maximum=300) == 300
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=20.0)
+    later = time.monotonic() + 60
+    assert policy.next_delay(1, GraniteAuthError('denied'), later) is None
+    assert policy.next_delay(3, GraniteUnavailableError('down'), later) is None
+    assert 0 <= policy.next_delay(2, GraniteUnavailableError('down'), later) <= 2.0
+    assert policy.next_delay(1, GraniteRateLimitError('slow down', 429, retry_after=4), later) == 4
+    # Never wait longer than max_delay or past the deadline
+    assert policy.next_delay(1, GraniteRateLimitError('slow down', 429, retry_after=30), later) is None
+    assert policy.next_delay(1, GraniteRateLimitError('slow down', 429, retry_after=4),
+                             time.monotonic() + 2) is None
+
+
+def test_circuit_breaker_opens_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(GraniteUnavailableError('down'))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_after <= 0.05
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats()['state'] == CircuitBreaker.CLOSED
+    assert breaker.stats()['rejected'] == 2
+
+
+def test_answered_errors_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure(GraniteUnavailableError('down'))
+    breaker.record_failure(GraniteRateLimitError('slow down', 429))
+    breaker.record_failure(GraniteUnavailableError('down'))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def flaky(*errors, result='ok'):
+    """An attempt function that raises errors in turn, then returns result."""
+    calls = []
+
+    def attempt(remaining):
+        calls.append(remaining)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return attempt, calls
+
+
+def test_call_with_retries_retries_transient_failures():
+    attempt, calls = flaky(requests.ConnectionError('reset'), GraniteRateLimitError('slow down', 429, 0))
+    breaker = CircuitBreaker()
+    assert call_with_retries(attempt, 10, 'Generating tests', RetryPolicy(base_delay=0), breaker) == 'ok'
+    assert len(calls) == 3
+    assert calls[0] > calls[2] > 0
+    assert breaker.failures == 0
+
+
+def test_call_with_retries_gives_up_on_permanent_failures():
+    attempt, calls = flaky(requests.ConnectionError('reset'), GraniteRequestError('bad input', 400))
+    with pytest.raises(GraniteRequestError):
+        call_with_retries(attempt, 10, 'Generating tests', RetryPolicy(base_delay=0))
+    assert len(calls) == 2
+
+    attempt, calls = flaky(*[requests.Timeout('slow')] * 3)
+    with pytest.raises(GraniteTimeoutError) as raised:
+        call_with_retries(attempt, 10, 'Generating tests', RetryPolicy(max_attempts=3, base_delay=0))
+    assert isinstance(raised.value.__cause__, requests.Timeout)
+    assert len(calls) == 3
+
+
+def test_open_circuit_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    attempt, calls = flaky(GraniteUnavailableError('down'))
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(attempt, 10, 'Generating tests', RetryPolicy(base_delay=0), breaker)
+    assert len(calls) == 1
+
+
+def test_acall_with_retries():
+    errors = [httpx.ReadTimeout('slow')]
+
+    async def attempt(remaining):
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    assert asyncio.run(acall_with_retries(attempt, 10, 'Generating tests', RetryPolicy(base_delay=0))) == 'ok'
+    assert errors == []
+
+
+def test_before_retry_runs_before_every_retry():
+    attempt, calls = flaky(GraniteUnavailableError('down'), GraniteUnavailableError('down'))
+    retries = []
+    result = call_with_retries(attempt, 10, 'Generating tests', RetryPolicy(base_delay=0),
+                               before_retry=lambda error: retries.append((len(calls), type(error))))
+    assert result == 'ok'
+    assert retries == [(1, GraniteUnavailableError), (2, GraniteUnavailableError)]